@@ -3,11 +3,23 @@ import re
 import json
 import time
 import logging
-from typing import Dict, Any, Iterable, List
+import math
+import itertools
+from collections import Counter, deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
 
 import boto3
 import requests
 
+import coalesce
+import hunk_artifact
+import tracing
+from diff_hunks import ignored_path, parse_unified_hunks
+from gh_client import GitHubClient
+from hunk_priority import default_ranker
+
 GITHUB_API_BASE   = os.environ.get("GITHUB_API_BASE", "https://api.github.com")
 USER_AGENT        = os.environ.get("GITHUB_USER_AGENT", "codesense-dispatcher")
 
@@ -21,7 +33,23 @@ GITHUB_TOKEN_SECRET_ARN = os.environ.get("GITHUB_TOKEN_SECRET_ARN")
 
 IGNORE_PATTERNS   = os.environ.get("IGNORE_PATHS", "package-lock.json,^.*/dist/.*,^.*/build/.*").split(",")
 MAX_HUNKS         = int(os.environ.get("MAX_HUNKS", "6"))
+CANDIDATE_HUNKS   = int(os.environ.get("CANDIDATE_HUNKS", "2000"))
+HUNK_TOKEN_BUDGET = int(os.environ.get("HUNK_TOKEN_BUDGET", "0") or 0)
+MAX_HUNKS_PER_FILE = int(os.environ.get("MAX_HUNKS_PER_FILE", "0") or 0)
 HTTP_TIMEOUT      = float(os.environ.get("HTTP_TIMEOUT_SEC", "12"))
+GITHUB_MAX_RETRIES  = int(os.environ.get("GITHUB_MAX_RETRIES", "3"))
+GITHUB_RATE_PER_SEC = float(os.environ.get("GITHUB_RATE_PER_SEC", "10"))
+GITHUB_BURST        = int(os.environ.get("GITHUB_BURST", "20"))
+PAGE_CONCURRENCY    = max(1, int(os.environ.get("PAGE_CONCURRENCY", "4")))
+ARTIFACT_FORMAT     = os.environ.get("ARTIFACT_FORMAT", "v1").lower()
+FILE_INDEX          = os.environ.get("FILE_INDEX", "true").lower() == "true"
+COMPARE_MAX_FILES   = 300
+ENRICH_CONCURRENCY  = max(1, int(os.environ.get("ENRICH_CONCURRENCY", "4")))
+SECRET_TTL_SEC      = int(os.environ.get("SECRET_TTL_SEC", "300"))
+SQS_BATCH_MAX       = 10
+DDB_TRANSACT_MAX    = 100
+DEBOUNCE_SEC        = float(os.environ.get("DEBOUNCE_SEC", "0") or 0)
+EVENTS_QUEUE_URL    = os.environ.get("EVENTS_QUEUE_URL", "")
 
 
 logger = logging.getLogger(__name__)
@@ -34,131 +62,343 @@ sqs = boto3.client("sqs")
 s3  = boto3.client("s3")
 sm  = boto3.client("secretsmanager")
 ddb = boto3.resource("dynamodb").Table(IDEMPOTENCY_TABLE)
+ddb_client = ddb.meta.client
+coalescer = (coalesce.Coalescer(coalesce.DynamoLatestStore(ddb), DEBOUNCE_SEC)
+             if DEBOUNCE_SEC > 0 and EVENTS_QUEUE_URL else None)
+gh  = GitHubClient(USER_AGENT, HTTP_TIMEOUT, max_retries=GITHUB_MAX_RETRIES,
+                   rate_per_sec=GITHUB_RATE_PER_SEC, burst=GITHUB_BURST)
+
+_secret_cache: Dict[str, Tuple[float, str]] = {}
+
+def get_secret(arn: str) -> str:
+    """Secrets Manager value, cached for SECRET_TTL_SEC in the warm container."""
+    hit = _secret_cache.get(arn)
+    if hit and hit[0] > time.time():
+        return hit[1]
+    r = sm.get_secret_value(SecretId=arn)
+    value = r.get("SecretString") or r["SecretBinary"].decode()
+    _secret_cache[arn] = (time.time() + SECRET_TTL_SEC, value)
+    return value
 
 def get_token() -> str:
     if GITHUB_TOKEN:
         return GITHUB_TOKEN
     if not GITHUB_TOKEN_SECRET_ARN:
         raise RuntimeError("Missing GITHUB_TOKEN or GITHUB_TOKEN_SECRET_ARN")
-    r = sm.get_secret_value(SecretId=GITHUB_TOKEN_SECRET_ARN)
-    return r.get("SecretString") or r["SecretBinary"].decode()
+    return get_secret(GITHUB_TOKEN_SECRET_ARN)
 
 def gh_request(method: str, url: str, token: str, **kw) -> requests.Response:
-    headers = kw.pop("headers", {})
-    headers.setdefault("Accept", "application/vnd.github+json")
-    headers.setdefault("Authorization", f"Bearer {token}")
-    headers.setdefault("User-Agent", USER_AGENT)
-    resp = requests.request(method, url, headers=headers, timeout=HTTP_TIMEOUT, **kw)
-    resp.raise_for_status()
-    return resp
-
-_HUNK_HDR_RE = re.compile(r"@@\s*-(\d+)(?:,(\d+))?\s+\+(\d+)(?:,(\d+))?\s+@@")
-
-def parse_unified_hunks(patch: str, file_path: str) -> List[Dict[str, Any]]:
-    """Extract unified diff hunks from a file patch."""
-    if not patch:
-        return []
-    out: List[Dict[str, Any]] = []
-    lines = patch.splitlines()
-    i = 0
-    while i < len(lines):
-        m = _HUNK_HDR_RE.match(lines[i])
-        if not m:
-            i += 1
-            continue
-        old_start = int(m.group(1)); old_len = int(m.group(2) or "0")
-        new_start = int(m.group(3)); new_len = int(m.group(4) or "0")
-        buf = [lines[i]]; i += 1
-        while i < len(lines) and not _HUNK_HDR_RE.match(lines[i]):
-            buf.append(lines[i]); i += 1
-        out.append({
-            "file_path": file_path,
-            "patch_hunk": "\n".join(buf),
-            "new_start": new_start, "new_lines": new_len,
-            "old_start": old_start, "old_lines": old_len
-        })
-    return out
+    return gh.request(method, url, token, **kw)
 
 def should_ignore_path(path: str) -> bool:
-    path = path or ""
-    for pat in IGNORE_PATTERNS:
-        pat = pat.strip()
-        if not pat:
-            continue
-        try:
-            if pat.startswith("^"):
-                if re.match(pat, path):
-                    return True
-            else:
-                if pat in path:
-                    return True
-        except re.error:
-            if pat in path:
-                return True
-    return False
-
-def parse_messages(event: Dict[str, Any]):
+    return ignored_path(path, IGNORE_PATTERNS)
+
+def parse_records(event: Dict[str, Any]) -> Iterator[Tuple[Optional[str], Dict[str, Any], float]]:
+    """Yield (SQS messageId, body, sent time) triples; a direct invoke is one record without an id."""
     if "Records" in event:
         for rec in event["Records"]:
             body = rec.get("body") or "{}"
+            sent_ms = (rec.get("attributes") or {}).get("SentTimestamp")
             try:
-                yield json.loads(body)
+                yield rec.get("messageId"), json.loads(body), int(sent_ms) / 1000 if sent_ms else time.time()
             except Exception:
                 logger.warning("Bad SQS body: %s", body)
     else:
-        yield event
+        yield None, event, time.time()
 
-def ddb_put_once(delivery_id: str, head_sha: str) -> bool:
+def debounce(records: List[Tuple[Optional[str], Dict[str, Any], float]]) -> Tuple[list, List[Optional[str]]]:
+    """Split records into those to process now and failures; held ones are re-queued with a delay."""
+    ready, held = [], []
+    for rid, msg, sent_at in sorted(records, key=lambda r: r[2]):
+        decision, delay, body = coalesce.route(coalescer, msg, sent_at)
+        if decision == coalesce.FORWARD:
+            ready.append((rid, msg, sent_at))
+        elif decision == coalesce.HOLD:
+            held.append((rid, body, delay))
+        else:
+            logger.info("Superseded event %s for %s; skipping.", msg.get("delivery_id"),
+                        coalesce.pr_key(msg.get("owner"), msg.get("repo"), msg.get("pr_number")))
+
+    failures: List[Optional[str]] = []
+    for start in range(0, len(held), SQS_BATCH_MAX):
+        chunk = held[start:start + SQS_BATCH_MAX]
+        entries = [{"Id": str(i), "MessageBody": json.dumps(body), "DelaySeconds": int(math.ceil(delay))}
+                   for i, (_, body, delay) in enumerate(chunk)]
+        try:
+            resp = sqs.send_message_batch(QueueUrl=EVENTS_QUEUE_URL, Entries=entries)
+            failed = {int(f["Id"]) for f in resp.get("Failed") or []}
+        except Exception:
+            logger.exception("Re-queue of %d held events failed", len(entries))
+            failed = set(range(len(chunk)))
+        failures.extend(chunk[i][0] for i in sorted(failed))
+    if held:
+        logger.info("Held %d events for debounce (%d re-queue failures)", len(held), len(failures))
+    return ready, failures
+
+def idempotency_key(delivery_id: str, head_sha: str) -> str:
     """Idempotency using (delivery_id + head_sha)."""
-    pk = f"{delivery_id}:{head_sha or 'nohead'}"
+    return f"{delivery_id}:{head_sha or 'nohead'}"
+
+def claim_many(keys: List[str]) -> Tuple[Set[str], Set[str]]:
+    """Conditionally create idempotency records in bulk.
+
+    Returns (claimed, failed): keys this call claimed, and keys whose claim
+    could not be decided (throttling, transaction conflicts, other errors).
+    Any other key already existed, i.e. is a duplicate.
+
+    BatchWriteItem cannot carry conditions, so claims go through
+    TransactWriteItems. A cancelled transaction names the keys that already
+    existed; those are dropped and the rest retried.
+    """
+    pending = list(dict.fromkeys(keys))
+    claimed: Set[str] = set()
+    failed: Set[str] = set()
+    ttl = str(int(time.time()) + 7 * 24 * 3600)
+    for start in range(0, len(pending), DDB_TRANSACT_MAX):
+        chunk = pending[start:start + DDB_TRANSACT_MAX]
+        while chunk:
+            try:
+                ddb_client.transact_write_items(TransactItems=[{"Put": {
+                    "TableName": IDEMPOTENCY_TABLE,
+                    "Item": {"pk": {"S": k}, "ttl": {"N": ttl}},
+                    "ConditionExpression": "attribute_not_exists(pk)",
+                }} for k in chunk])
+                claimed.update(chunk)
+                break
+            except ddb_client.exceptions.TransactionCanceledException as e:
+                reasons = e.response.get("CancellationReasons") or []
+                dup = {k for k, r in zip(chunk, reasons) if r.get("Code") == "ConditionalCheckFailed"}
+                if not dup:
+                    logger.warning("Idempotency claim cancelled (%s); retrying %d keys later",
+                                   [r.get("Code") for r in reasons], len(chunk))
+                    failed.update(chunk)
+                    break
+                chunk = [k for k in chunk if k not in dup]
+            except Exception:
+                logger.exception("Idempotency claim failed for %d keys", len(chunk))
+                failed.update(chunk)
+                break
+    return claimed, failed
+
+def release_claim(key: str) -> None:
+    """Drop a claim whose review could not be handed to the worker, so the retry is not skipped."""
+    try:
+        ddb.delete_item(Key={"pk": key})
+    except Exception:
+        logger.exception("Could not release idempotency claim %s", key)
+
+def _link_url(link: str, rel: str) -> Optional[str]:
+    for p in [p.strip() for p in (link or "").split(",")]:
+        if f'rel="{rel}"' in p:
+            return p[p.find("<")+1:p.find(">")]
+    return None
+
+def _last_page(link: str) -> Optional[int]:
+    m = re.search(r"[?&]page=(\d+)", _link_url(link, "last") or "")
+    return int(m.group(1)) if m else None
+
+def iter_pr_files(owner: str, repo: str, pr_number: int, token: str) -> Iterator[Dict[str, Any]]:
+    """Yield PR files in API order.
+
+    The first page tells us the page count (rel="last"); the remaining pages
+    are then fetched up to PAGE_CONCURRENCY ahead of the consumer, so closing
+    the generator early leaves at most that many pages wasted.
+    """
+    files_url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/pulls/{pr_number}/files?per_page=100"
+    r = gh_request("GET", files_url, token)
+    yield from r.json()
+
+    link = r.headers.get("Link", "")
+    last = _last_page(link)
+    if last is None:
+        url = _link_url(link, "next")
+        while url:
+            r = gh_request("GET", url, token)
+            yield from r.json()
+            url = _link_url(r.headers.get("Link", ""), "next")
+        return
+
+    pool = ThreadPoolExecutor(max_workers=PAGE_CONCURRENCY)
+    pending: deque = deque()
+    try:
+        page = 2
+        while page <= last or pending:
+            while page <= last and len(pending) < PAGE_CONCURRENCY:
+                pending.append(pool.submit(gh_request, "GET", f"{files_url}&page={page}", token))
+                page += 1
+            yield from pending.popleft().result().json()
+    finally:
+        for f in pending:
+            f.cancel()
+        pool.shutdown(wait=False)
+
+def iter_hunks(
+    owner: str,
+    repo: str,
+    pr_number: int,
+    token: str,
+    scope: Optional[Dict[str, Any]] = None,
+    files_seen: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield hunks of the PR's files, limited to what `scope` says is new.
+
+    scope["known"] (the file index) drops files whose blob SHA was already
+    reviewed; for a known file that changed since, scope["changed"] (from the
+    compare API) swaps in the patch of just the new commits. Any other file
+    is yielded in full. Each file's blob SHA and hunk count go to `files_seen`,
+    from which enrich builds the next file index.
+    """
+    scope = scope or {}
+    changed: Optional[Dict[str, Dict[str, Any]]] = scope.get("changed")
+    known: Dict[str, str] = scope.get("known") or {}
+    with closing(iter_pr_files(owner, repo, pr_number, token)) as files:
+        for f in files:
+            path, patch, sha = f.get("filename"), f.get("patch"), f.get("sha")
+            if not path or should_ignore_path(path):
+                continue
+            hunks: List[Dict[str, Any]] = []
+            if not (sha and known.get(path) == sha):
+                if changed is not None and path in changed and path in known:
+                    patch = changed[path].get("patch") or patch
+                if patch:
+                    hunks = list(parse_unified_hunks(patch, path))
+            if files_seen is not None and sha:
+                files_seen[path] = {"sha": sha, "hunks": len(hunks)}
+            yield from hunks
+
+def _index_key(owner: str, repo: str, pr_number: int) -> str:
+    return f"repos/{owner}/{repo}/pr-{pr_number}/files-index.json"
+
+def load_file_index(owner: str, repo: str, pr_number: int) -> Dict[str, Any]:
+    """Last processed head of the PR and its files' blob SHAs ({} if none)."""
+    try:
+        obj = s3.get_object(Bucket=ARTIFACTS_BUCKET, Key=_index_key(owner, repo, pr_number))
+        return json.loads(obj["Body"].read())
+    except s3.exceptions.NoSuchKey:
+        return {}
+    except Exception as e:
+        logger.warning("File index read failed for %s/%s#%s: %s", owner, repo, pr_number, e)
+        return {}
+
+def _staged_index_key(owner: str, repo: str, pr_number: int, head_sha: str) -> str:
+    return f"repos/{owner}/{repo}/pr-{pr_number}/{head_sha}/files-index.json"
+
+def save_file_index(owner: str, repo: str, pr_number: int, head_sha: str, files: Dict[str, str],
+                    key: Optional[str] = None) -> None:
+    s3.put_object(
+        Bucket=ARTIFACTS_BUCKET,
+        Key=key or _index_key(owner, repo, pr_number),
+        Body=json.dumps({"head_sha": head_sha, "files": files}).encode("utf-8"),
+        ContentType="application/json",
+        ServerSideEncryption="AES256"
+    )
+
+def remember_files(owner: str, repo: str, pr_number: int, head_sha: str, scope: Dict[str, Any]) -> None:
+    if not (FILE_INDEX and scope.get("files")):
+        return
     try:
-        ddb.put_item(
-            Item={"pk": pk, "ttl": int(time.time()) + 7 * 24 * 3600},
-            ConditionExpression="attribute_not_exists(pk)"
-        )
-        return True
+        save_file_index(owner, repo, pr_number, head_sha, scope["files"])
     except Exception:
-        return False
+        logger.exception("File index save failed (continue)")
+
+def stage_file_index(owner: str, repo: str, pr_number: int, head_sha: str,
+                     scope: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """Write the index this review leaves behind next to its artifact.
+
+    The worker copies it to the live key only once the review is posted, so a
+    review that is skipped or fails never moves the index past its head.
+    """
+    if not (FILE_INDEX and scope.get("files")):
+        return None
+    key = _staged_index_key(owner, repo, pr_number, head_sha)
+    try:
+        save_file_index(owner, repo, pr_number, head_sha, scope["files"], key=key)
+    except Exception:
+        logger.exception("File index staging failed (continue)")
+        return None
+    return {"s3_bucket": ARTIFACTS_BUCKET, "staged_key": key, "key": _index_key(owner, repo, pr_number)}
+
+def compare_files(owner: str, repo: str, base: str, head: str, token: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Files changed by the commits in base..head, or None if head is not a fast-forward of base."""
+    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/compare/{base}...{head}"
+    try:
+        data = gh_request("GET", url, token).json()
+    except requests.HTTPError as e:
+        logger.info("Compare %s...%s unavailable (%s); full review", base[:7], head[:7], e)
+        return None
+    if data.get("status") not in ("ahead", "identical"):
+        return None
+    files = data.get("files") or []
+    # The compare API lists at most 300 files; past that the set is incomplete.
+    if len(files) >= COMPARE_MAX_FILES:
+        return None
+    return {f["filename"]: f for f in files if f.get("filename")}
+
+def review_scope(owner: str, repo: str, pr_number: int, head_sha: str, token: str,
+                 msg: Dict[str, Any]) -> Dict[str, Any]:
+    """Decide how much of the PR a `synchronize` event needs reviewed.
+
+    The compare base is the last head whose review was posted (from the file
+    index); the event's own `before` may name a head that was never reviewed,
+    so without an index the review is "full". A fast-forward gives
+    "incremental" (new commits only); a force-push with a usable index gives
+    "files" (changed blobs only).
+    """
+    if not FILE_INDEX or msg.get("action") != "synchronize":
+        return {"mode": "full"}
+    index = load_file_index(owner, repo, pr_number)
+    base = index.get("head_sha")
+    if base and base != head_sha:
+        changed = compare_files(owner, repo, base, head_sha, token)
+        if changed is not None:
+            return {"mode": "incremental", "base": base, "changed": changed, "known": index.get("files") or {}}
+    if index.get("files"):
+        return {"mode": "files", "base": index.get("head_sha"), "known": index["files"]}
+    return {"mode": "full"}
 
-def enrich(owner: str, repo: str, pr_number: int, token: str):
-    """Fetch PR head SHA and file hunks (limited)."""
+def enrich(owner: str, repo: str, pr_number: int, token: str, msg: Optional[Dict[str, Any]] = None):
+    """Fetch PR head SHA, the review scope and the highest-priority hunks in it.
+
+    Paging stops once CANDIDATE_HUNKS hunks are collected; those are ranked and
+    cut to MAX_HUNKS / HUNK_TOKEN_BUDGET / MAX_HUNKS_PER_FILE. The returned
+    scope carries, under "files", the blob SHAs of the files this review
+    covers completely: known ones and those with every hunk selected.
+    """
     pr_url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/pulls/{pr_number}"
     pr = gh_request("GET", pr_url, token).json()
     head_sha = (pr.get("head") or {}).get("sha")
     if not head_sha:
         raise RuntimeError("No head_sha")
 
-    files_url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/pulls/{pr_number}/files?per_page=100"
-    hunks: List[Dict[str, Any]] = []
-    url = files_url
-    while url:
-        r = gh_request("GET", url, token)
-        for f in r.json():
-            path, patch = f.get("filename"), f.get("patch")
-            if not path or should_ignore_path(path):
-                continue
-            if not patch:
-                continue 
-            hunks.extend(parse_unified_hunks(patch, path))
-        
-        next_url = None
-        link = r.headers.get("Link", "")
-        if link:
-            for p in [p.strip() for p in link.split(",")]:
-                if 'rel="next"' in p:
-                    next_url = p[p.find("<")+1:p.find(">")]
-                    break
-        url = next_url
-    return head_sha, hunks[:MAX_HUNKS]
+    scope = review_scope(owner, repo, pr_number, head_sha, token, msg or {})
+    files_seen: Dict[str, Dict[str, Any]] = {}
+    with closing(iter_hunks(owner, repo, pr_number, token, scope, files_seen)) as it:
+        candidates = list(itertools.islice(it, max(CANDIDATE_HUNKS, MAX_HUNKS)))
+    hunks = default_ranker.select(
+        candidates, max_hunks=MAX_HUNKS, token_budget=HUNK_TOKEN_BUDGET, per_file_cap=MAX_HUNKS_PER_FILE,
+    )
+    picked = Counter(h["file_path"] for h in hunks)
+    scope["files"] = {path: f["sha"] for path, f in files_seen.items() if picked[path] == f["hunks"]}
+    logger.info("Scope %s for %s/%s#%s: %d candidate hunks, %d selected",
+                scope["mode"], owner, repo, pr_number, len(candidates), len(hunks))
+    return head_sha, hunks, scope
 
 def save_artifact(owner: str, repo: str, pr_number: int, head_sha: str, hunks: List[Dict[str, Any]]) -> str:
-    """Save hunks to S3 as JSON artifact and return the S3 key."""
-    key = f"repos/{owner}/{repo}/pr-{pr_number}/{head_sha}/patch.json"
+    """Save hunks to S3 as an artifact (v1 by default, legacy JSON if configured) and return the S3 key."""
+    prefix = f"repos/{owner}/{repo}/pr-{pr_number}/{head_sha}"
+    if ARTIFACT_FORMAT == "json":
+        key, content_type = f"{prefix}/patch.json", "application/json"
+        body = json.dumps({"hunks": hunks}, ensure_ascii=False).encode("utf-8")
+    else:
+        key, content_type = f"{prefix}/patch.hnka", hunk_artifact.CONTENT_TYPE
+        body = hunk_artifact.encode(hunks, {
+            "owner": owner, "repo": repo, "pr_number": pr_number, "head_sha": head_sha,
+        })
     s3.put_object(
         Bucket=ARTIFACTS_BUCKET,
         Key=key,
-        Body=json.dumps({"hunks": hunks}, ensure_ascii=False).encode("utf-8"),
-        ContentType="application/json",
+        Body=body,
+        ContentType=content_type,
         ServerSideEncryption="AES256"
 
     )
@@ -178,47 +418,144 @@ def save_artifact(owner: str, repo: str, pr_number: int, head_sha: str, hunks: L
 #     )
 #     return key
 
-def lambda_handler(event, context):
-    
-    token = get_token()
-    processed = 0
-
-    for msg in parse_messages(event):
-        owner = msg.get("owner"); repo = msg.get("repo"); prn = msg.get("pr_number")
-        delivery_id = msg.get("delivery_id")
-        if not (owner and repo and prn and delivery_id):
-            logger.info("Skip (missing fields): %s", msg)
-            continue
+def _payload(msg: Dict[str, Any], head_sha: str, hunks: List[Dict[str, Any]], scope: Dict[str, Any],
+             s3_key: Optional[str], file_index: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return {
+        "delivery_id": msg["delivery_id"],
+        "owner": msg["owner"],
+        "repo": msg["repo"],
+        "pr_number": msg["pr_number"],
+        "head_sha": head_sha,
+        "artifact": {"s3_bucket": ARTIFACTS_BUCKET, "s3_key": s3_key},
+        "hunk_count": len(hunks),
+        "scope": {"mode": scope["mode"], "base": scope.get("base")},
+        "file_index": file_index,
+        "policy": {"max_comments": MAX_HUNKS, "style":"concise","severity_threshold":"suggestion"},
+        "ts": int(time.time()),
+        tracing.TRACE_KEY: tracing.context_from(msg),
+    }
+
+def _enrich_one(msg: Dict[str, Any], token: str):
+    with tracing.bind(**tracing.context_from(msg)), tracing.span("enrich", pr=msg["pr_number"]) as sp:
+        head_sha, hunks, scope = enrich(msg["owner"], msg["repo"], int(msg["pr_number"]), token, msg)
+        sp.update(hunks=len(hunks), scope=scope["mode"])
+        return head_sha, hunks, scope
 
+def _save_one(job: Dict[str, Any]) -> Optional[str]:
+    msg = job["msg"]
+    owner, repo, pr_number = msg["owner"], msg["repo"], int(msg["pr_number"])
+    try:
+        with tracing.bind(**tracing.context_from(msg)), tracing.span("artifact_write", hunks=len(job["hunks"])):
+            key = save_artifact(owner, repo, pr_number, job["head_sha"], job["hunks"])
+    except Exception:
+        logger.exception("Artifact save failed; record will be retried")
+        return None
+    job["file_index"] = stage_file_index(owner, repo, pr_number, job["head_sha"], job["scope"])
+    return key
+
+def send_batches(payloads: List[Dict[str, Any]]) -> List[int]:
+    """Send payloads with send_message_batch (10 per call); returns indexes that failed."""
+    failed: List[int] = []
+    for start in range(0, len(payloads), SQS_BATCH_MAX):
+        chunk = payloads[start:start + SQS_BATCH_MAX]
+        entries = [{"Id": str(start + j), "MessageBody": json.dumps(p)} for j, p in enumerate(chunk)]
         try:
-            head_sha, hunks = enrich(owner, repo, int(prn), token)
-        except Exception as e:
-            logger.exception("Enrich failed for %s/%s#%s: %s", owner, repo, prn, e)
+            with tracing.span("enqueue", messages=len(entries)):
+                resp = sqs.send_message_batch(QueueUrl=TARGET_QUEUE_URL, Entries=entries)
+        except Exception:
+            logger.exception("send_message_batch failed for %d messages", len(entries))
+            failed.extend(range(start, start + len(chunk)))
             continue
+        for f in resp.get("Failed") or []:
+            logger.warning("Send failed for entry %s: %s", f.get("Id"), f.get("Message"))
+            failed.append(int(f["Id"]))
+    return failed
+
+def lambda_handler(event, context):
+    """Process a batch of PR events and report per-record failures.
+
+    Records are enriched concurrently, their idempotency keys claimed in bulk,
+    artifacts written concurrently and review messages sent in batches. Records
+    whose enrich, claim or send failed are returned in `batchItemFailures`, so SQS
+    retries only those.
+    """
+    with tracing.bind(service="dispatcher"), tracing.span("dispatch_batch") as sp:
+        result = _handle_batch(event)
+        sp.update(processed=result["processed"], failures=len(result["batchItemFailures"]))
+    return result
 
-    
-        if not ddb_put_once(delivery_id, head_sha):
-            logger.info("Duplicate delivery+sha; skipping.")
+def _handle_batch(event) -> Dict[str, Any]:
+    records = []
+    for rid, msg, sent_at in parse_records(event):
+        if not (msg.get("owner") and msg.get("repo") and msg.get("pr_number") and msg.get("delivery_id")):
+            logger.info("Skip (missing fields): %s", msg)
             continue
+        records.append((rid, msg, sent_at))
 
-        s3_key = None
-        try:
-            s3_key = save_artifact(owner, repo, int(prn), head_sha, hunks)
-        except Exception:
-            logger.exception("Artifact save failed (continue)")
-
-        payload = {
-            "delivery_id": delivery_id,
-            "owner": owner,
-            "repo": repo,
-            "pr_number": prn,
-            "head_sha": head_sha,
-            "artifact": {"s3_bucket": ARTIFACTS_BUCKET, "s3_key": s3_key},
-            "hunk_count": len(hunks),
-            "policy": {"max_comments": MAX_HUNKS, "style":"concise","severity_threshold":"suggestion"},
-            "ts": int(time.time())
-        }
-        sqs.send_message(QueueUrl=TARGET_QUEUE_URL, MessageBody=json.dumps(payload))
-        processed += 1
-
-    return {"ok": True, "processed": processed}
+    failures: List[Optional[str]] = []
+    if coalescer is not None:
+        with tracing.span("debounce", records=len(records)):
+            records, failures = debounce(records)
+    jobs: List[Dict[str, Any]] = [{"rid": rid, "msg": msg} for rid, msg, _ in records]
+
+    if jobs:
+        token = get_token()
+        with ThreadPoolExecutor(max_workers=min(ENRICH_CONCURRENCY, len(jobs))) as pool:
+            futures = [pool.submit(tracing.wrap(_enrich_one), j["msg"], token) for j in jobs]
+            for j, fut in zip(jobs, futures):
+                try:
+                    j["head_sha"], j["hunks"], j["scope"] = fut.result()
+                except Exception as e:
+                    m = j["msg"]
+                    logger.exception("Enrich failed for %s/%s#%s: %s", m["owner"], m["repo"], m["pr_number"], e)
+                    failures.append(j["rid"])
+            jobs = [j for j in jobs if "head_sha" in j]
+
+            for j in jobs:
+                j["key"] = idempotency_key(j["msg"]["delivery_id"], j["head_sha"])
+            claimed, unclaimed = claim_many([j["key"] for j in jobs])
+            ready: List[Dict[str, Any]] = []
+            for j in jobs:
+                m = j["msg"]
+                if j["key"] in unclaimed:
+                    failures.append(j["rid"])
+                    continue
+                if j["key"] not in claimed:
+                    logger.info("Duplicate delivery+sha; skipping.")
+                    continue
+                claimed.discard(j["key"])
+                if not j["hunks"] and j["scope"]["mode"] != "full":
+                    logger.info("No new hunks since %s; nothing to review.", (j["scope"].get("base") or "")[:7])
+                    remember_files(m["owner"], m["repo"], int(m["pr_number"]), j["head_sha"], j["scope"])
+                else:
+                    ready.append(j)
+
+            keys = list(pool.map(tracing.wrap(_save_one), ready))
+
+        # The worker cannot review without the artifact: retry the record.
+        for j, k in zip(ready, keys):
+            if k is None:
+                release_claim(j["key"])
+                failures.append(j["rid"])
+        ready, keys = [j for j, k in zip(ready, keys) if k], [k for k in keys if k]
+        payloads = [_payload(j["msg"], j["head_sha"], j["hunks"], j["scope"], k, j.get("file_index"))
+                    for j, k in zip(ready, keys)]
+        failed = set(send_batches(payloads))
+        for idx, j in enumerate(ready):
+            m = j["msg"]
+            if idx in failed:
+                release_claim(j["key"])
+                failures.append(j["rid"])
+            else:
+                with tracing.bind(**tracing.context_from(m)):
+                    tracing.since_received("dispatched_s", hunks=len(j["hunks"]))
+        processed = len(ready) - len(failed)
+    else:
+        processed = 0
+
+    logger.info("GitHub client: %s", gh.metrics.snapshot())
+    return {
+        "ok": not failures,
+        "processed": processed,
+        "batchItemFailures": [{"itemIdentifier": rid} for rid in failures if rid],
+    }
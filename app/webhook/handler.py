@@ -3,7 +3,9 @@ import json
 import hmac
 import base64
 import hashlib
-from typing import Any, Dict, Optional, Tuple
+import re
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import boto3
 from botocore.exceptions import ClientError
@@ -22,7 +24,15 @@ try:
 except KeyError as exc:
     raise RuntimeError(f"Missing required environment variable: {exc.args[0]}")
 
-_secrets_cache: Dict[str, str] = {}
+TRACE = os.environ.get("TRACE", "true").lower() == "true"
+SECRET_TTL_SEC = float(os.environ.get("SECRET_TTL_SEC", "300"))
+# Bodies at least this large are routed from a partial scan; smaller ones are just parsed.
+FAST_PARSE_MIN_BYTES = int(os.environ.get("FAST_PARSE_MIN_BYTES", "8192"))
+
+_HMAC_CHUNK = 64 * 1024
+
+# value, monotonic time it was fetched
+_secrets_cache: Dict[str, Tuple[str, float]] = {}
 
 def _resp(status: int, payload: Dict[str, Any]) -> Dict[str, Any]:
     """Consistent API Gateway response."""
@@ -33,22 +43,46 @@ def _resp(status: int, payload: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+def _span(name: str, t0: float, cid: Optional[str], **attrs: Any) -> None:
+    """Emit one span as a JSON line, in the record shape of the worker's tracing module."""
+    if not TRACE:
+        return
+    dur = time.perf_counter() - t0
+    print(json.dumps({
+        "type": "span", "name": name, "service": "webhook", "cid": cid,
+        "ts": round(time.time() - dur, 3), "dur_ms": round(dur * 1000, 3), **attrs,
+    }, separators=(",", ":")))
+
+
 def _get_secret(secret_id: str) -> str:
-    """Fetch and cache the secret string by id."""
-    if secret_id in _secrets_cache:
-        return _secrets_cache[secret_id]
+    """Fetch the secret string by id, cached for SECRET_TTL_SEC so rotations are picked up.
+    If a refresh fails, the expired value is used rather than failing the delivery."""
+    cached = _secrets_cache.get(secret_id)
+    if cached and time.monotonic() - cached[1] < SECRET_TTL_SEC:
+        return cached[0]
 
     try:
         resp = _sm.get_secret_value(SecretId=secret_id)
     except ClientError as e:
         print(f"[secrets] error: {e.response.get('Error', {}).get('Code')}")
+        if cached:
+            return cached[0]
         raise
 
     val = resp.get("SecretString") or ""
-    _secrets_cache[secret_id] = val
+    _secrets_cache[secret_id] = (val, time.monotonic())
     return val
 
 
+def _hmac_hex(secret: str, body: bytes, digestmod: Any) -> str:
+    """HMAC of `body` fed in fixed-size slices of a memoryview, so no copy of the body is made."""
+    mac = hmac.new(secret.encode("utf-8"), digestmod=digestmod)
+    view = memoryview(body)
+    for i in range(0, len(view), _HMAC_CHUNK):
+        mac.update(view[i : i + _HMAC_CHUNK])
+    return mac.hexdigest()
+
+
 def _verify_sig(
     secret: str, body: bytes, sig256: Optional[str], sig1: Optional[str]
 ) -> bool:
@@ -56,18 +90,101 @@ def _verify_sig(
     Verify GitHub webhook signature. Prefer sha256, fallback to legacy sha1 if provided.
     """
     if sig256:
-        expected = "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        expected = "sha256=" + _hmac_hex(secret, body, hashlib.sha256)
         if hmac.compare_digest(expected, sig256):
             return True
 
     if sig1:
-        expected = "sha1=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha1).hexdigest()
+        expected = "sha1=" + _hmac_hex(secret, body, hashlib.sha1)
         if hmac.compare_digest(expected, sig1):
             return True
 
     return False
 
 
+# A JSON string, or one structural character; numbers and literals between them are skipped.
+_TOKEN_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\],:]')
+_SCALAR_RE = re.compile(rb'\s*("[^"\\]*(?:\\.[^"\\]*)*"|true|false|null|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)')
+
+# Fields that can rule a delivery out, by key path. Both sit near the top of
+# the payload; `draft` comes after the PR body and labels, so it is left to
+# the full parse that queued deliveries need anyway.
+_ROUTE_PATHS = {("action",): "action", ("pull_request", "state"): "state"}
+
+
+def _peek_fields(raw: bytes, paths: Dict[Tuple[str, ...], str]) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield (name, value) for scalar values at the given key paths, in document
+    order, without building the object tree. Stops once every path was seen or
+    the objects that could hold the rest are closed. Only strings and structural
+    characters are visited (all ASCII, so the scan runs on the raw UTF-8 bytes);
+    a value is decoded only at a wanted path.
+    """
+    remaining = dict(paths)
+    depth = max(len(p) for p in paths)
+    stack: List[List[Any]] = []  # [kind, current key] per open container
+    expect_key = False
+    for m in _TOKEN_RE.finditer(raw):
+        c = raw[m.start()]
+        if c == 0x22:  # "
+            if expect_key:
+                tok = raw[m.start() : m.end()]
+                stack[-1][1] = tok[1:-1].decode("utf-8") if b"\\" not in tok else json.loads(tok)
+                expect_key = False
+        elif c == 0x3A:  # :
+            if all(f[0] == "o" for f in stack):
+                name = remaining.pop(tuple(f[1] for f in stack), None)
+                v = _SCALAR_RE.match(raw, m.end()) if name else None
+                if v:
+                    yield name, json.loads(v.group(1))
+                if name and not remaining:
+                    return
+        elif c == 0x7B:  # {
+            stack.append(["o", None])
+            expect_key = True
+        elif c == 0x5B:  # [
+            stack.append(["a", None])
+        elif c == 0x2C:  # ,
+            expect_key = bool(stack) and stack[-1][0] == "o"
+        elif stack:  # } or ]
+            if len(stack) <= depth:
+                # Paths under the container being closed can no longer appear.
+                prefix = tuple(f[1] for f in stack[:-1])
+                for p in [p for p in remaining if p[: len(prefix)] == prefix and len(p) > len(prefix)]:
+                    del remaining[p]
+                if not remaining:
+                    return
+            stack.pop()
+
+
+def _route_fields(raw: bytes) -> Optional[Dict[str, Any]]:
+    """
+    action and PR state of a large body, stopping as soon as the action alone
+    rules the delivery out. None for small bodies, which are cheaper to parse whole.
+    """
+    if len(raw) < FAST_PARSE_MIN_BYTES:
+        return None
+    found: Dict[str, Any] = {}
+    try:
+        for name, value in _peek_fields(raw, _ROUTE_PATHS):
+            found[name] = value
+            if name == "action" and value not in ALLOWED_PR_ACTIONS:
+                break
+    except ValueError:
+        return None  # malformed; the full parse reports it
+    return found
+
+
+def _ignore_reason(action: Any, state: Any, draft: Any) -> Optional[str]:
+    if action not in ALLOWED_PR_ACTIONS:
+        return f"action_not_allowed:{action}"
+    if state != "open":
+        return f"state:{state}"
+    if draft:
+        return "draft_pr"
+    return None
+
+
 def _get_raw_body(event: Dict[str, Any]) -> bytes:
     """Return the raw request body as bytes, handling base64 encoding if set."""
     body = event.get("body") or ""
@@ -85,7 +202,9 @@ def _is_fifo_queue(url: str) -> bool:
     return url.rstrip().endswith(".fifo")
 
 
-def _prepare_message(p: Dict[str, Any], delivery_id: Optional[str]) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+def _prepare_message(
+    p: Dict[str, Any], delivery_id: Optional[str], received_at: Optional[float] = None
+) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
     """
     Build SQS send_message kwargs: MessageBody + optional FIFO fields.
     Returns (message_body_str, message_attributes, extra_kwargs)
@@ -109,6 +228,8 @@ def _prepare_message(p: Dict[str, Any], delivery_id: Optional[str]) -> Tuple[str
         "incremental": bool(before and after),
         "before": before,
         "after": after,
+        # Correlation id and receipt time, carried through dispatcher and worker.
+        "trace": {"cid": delivery_id, "received_at": round(received_at or time.time(), 3)},
     }
 
     body_str = json.dumps(msg, separators=(",", ":"), ensure_ascii=False)
@@ -123,6 +244,7 @@ def _prepare_message(p: Dict[str, Any], delivery_id: Optional[str]) -> Tuple[str
     return body_str, attrs, extra
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    received_at = time.time()
     headers = _extract_headers(event)
     gh_event = headers.get("x-github-event")
     delivery = headers.get("x-github-delivery")
@@ -143,26 +265,36 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     except ClientError:
         return _resp(500, {"ok": False, "error": "secrets_unavailable"})
 
-    if not _verify_sig(secret, raw_body, sig256, sig1):
+    t0 = time.perf_counter()
+    valid = _verify_sig(secret, raw_body, sig256, sig1)
+    _span("verify_signature", t0, delivery, bytes=len(raw_body), ok=valid)
+    if not valid:
         return _resp(401, {"ok": False, "error": "invalid_signature"})
 
+    # Most deliveries are ignored; for large bodies decide that from a partial
+    # scan and only parse the whole payload for the ones that get queued.
+    t0 = time.perf_counter()
+    peek = _route_fields(raw_body)
+    if peek is not None:
+        # Only a conclusive scan rejects; anything missing is left to the full parse.
+        conclusive = "action" in peek and (peek["action"] not in ALLOWED_PR_ACTIONS or "state" in peek)
+        reason = conclusive and _ignore_reason(peek["action"], peek.get("state"), False)
+        _span("peek", t0, delivery, bytes=len(raw_body), ignored=bool(reason))
+        if reason:
+            return _resp(204, {"ignored": True, "reason": reason})
+
+    t0 = time.perf_counter()
     try:
-        p = json.loads(raw_body.decode("utf-8"))
+        p = json.loads(raw_body)
     except Exception:
         return _resp(400, {"ok": False, "error": "invalid_json"})
-    
-
+    _span("parse", t0, delivery, bytes=len(raw_body))
 
     action = p.get("action")
     pr = p.get("pull_request") or {}
-    state  = pr.get("state", "")    
-
-    if action not in ALLOWED_PR_ACTIONS:
-        return _resp(204, {"ignored": True, "reason": f"action_not_allowed:{action}"})
-    if state != "open":
-        return _resp(204, {"ignored": True, "reason": f"state:{state}"})
-    if pr.get("draft", False):
-        return _resp(204, {"ignored": True, "reason": "draft_pr"})
+    reason = _ignore_reason(action, pr.get("state", ""), pr.get("draft", False))
+    if reason:
+        return _resp(204, {"ignored": True, "reason": reason})
 
 
     repo = p.get("repository") or {}
@@ -175,7 +307,8 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if missing:
         return _resp(400, {"ok": False, "error": "missing_fields", "fields": missing})
 
-    body_str, msg_attrs, extra_kwargs = _prepare_message(p, delivery_id=delivery)
+    body_str, msg_attrs, extra_kwargs = _prepare_message(p, delivery_id=delivery, received_at=received_at)
+    t0 = time.perf_counter()
     try:
         _sqs.send_message(
             QueueUrl=PR_EVENTS_SQS_URL,
@@ -183,6 +316,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             MessageAttributes=msg_attrs,
             **extra_kwargs,
         )
+        _span("enqueue", t0, delivery)
     except ClientError as e:
         code = e.response.get("Error", {}).get("Code")
         print(f"[sqs] send_message error: {code}")
@@ -2,26 +2,53 @@ from __future__ import annotations
 
 import json
 import os
-from typing import Any, Dict, List, Optional
-import boto3
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+from . import hunk_artifact, tracing
 from .logutil import setup_logger
 from .config import (
     ADAPTER_BUCKET, LORA_ADAPTER_DIR,
-    
+    ADAPTER_POINTER_KEY, ADAPTER_DOWNLOAD_WORKERS, ADAPTER_KEEP_VERSIONS,
 )
 
 log = setup_logger("aws-utils")
 
-s3 = boto3.client("s3")
-sm = boto3.client("secretsmanager")
-sqs = boto3.client("sqs")
+ADAPTER_MANIFEST_FILE = ".manifest.json"
+_CLIENT_SERVICES = {"s3": "s3", "sm": "secretsmanager", "sqs": "sqs"}
+_clients_lock = threading.Lock()
+_clients: Dict[str, Any] = {}
+
+def client(name: str) -> Any:
+    """Shared boto3 client ('s3', 'sm' or 'sqs'), created on first use."""
+    c = _clients.get(name)
+    if c is None:
+        with _clients_lock:
+            c = _clients.get(name)
+            if c is None:
+                import boto3
+                c = _clients[name] = boto3.client(_CLIENT_SERVICES[name])
+    return c
+
+def __getattr__(name: str) -> Any:
+    # Keeps `from .aws_utils import s3` working without creating clients at import.
+    if name in _CLIENT_SERVICES:
+        return client(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _transfer_config():
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(multipart_threshold=16 * 1024 * 1024, multipart_chunksize=16 * 1024 * 1024,
+                          max_concurrency=4)
 
 def is_sm_arn(v: str | None) -> bool:
     return bool(v and v.startswith("arn:aws:secretsmanager:"))
 
 def get_secret_value_by_arn(arn: str) -> str:
-    resp = sm.get_secret_value(SecretId=arn)
+    resp = client("sm").get_secret_value(SecretId=arn)
     return resp.get("SecretString") or resp["SecretBinary"].decode()
 
 def env_or_secret(name: str) -> Optional[str]:
@@ -36,7 +63,7 @@ def list_all_common_prefixes(bucket: str, delimiter: str = "/") -> List[str]:
     prefixes: List[str] = []
     params = {"Bucket": bucket, "Delimiter": delimiter}
     while True:
-        resp = s3.list_objects_v2(**params)
+        resp = client("s3").list_objects_v2(**params)
         for p in resp.get("CommonPrefixes", []) or []:
             pr = p.get("Prefix", "")
             if pr:
@@ -51,7 +78,7 @@ def list_all_objects(bucket: str, prefix: str) -> List[Dict[str, Any]]:
     objs: List[Dict[str, Any]] = []
     params = {"Bucket": bucket, "Prefix": prefix}
     while True:
-        resp = s3.list_objects_v2(**params)
+        resp = client("s3").list_objects_v2(**params)
         for obj in resp.get("Contents", []) or []:
             objs.append(obj)
         token = resp.get("NextContinuationToken")
@@ -65,33 +92,153 @@ def pick_latest_prefix(prefixes: List[str]) -> str:
         raise RuntimeError("No adapter prefixes found in S3 bucket")
     return sorted(prefixes, reverse=True)[0]
 
+def resolve_latest_version(bucket: str) -> str:
+    """Read the version from the pointer object; fall back to listing prefixes."""
+    if ADAPTER_POINTER_KEY:
+        try:
+            raw = client("s3").get_object(Bucket=bucket, Key=ADAPTER_POINTER_KEY)["Body"].read().decode("utf-8").strip()
+            version = (json.loads(raw).get("version") if raw.startswith("{") else raw) or ""
+            if version.strip("/"):
+                return version.strip("/")
+        except client("s3").exceptions.NoSuchKey:
+            log.info("No adapter pointer s3://%s/%s; listing prefixes", bucket, ADAPTER_POINTER_KEY)
+    return pick_latest_prefix(list_all_common_prefixes(bucket, delimiter="/"))
+
+def read_adapter_manifest(path: str = LORA_ADAPTER_DIR) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(path, ADAPTER_MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _versions_root() -> str:
+    return os.path.join(os.path.dirname(LORA_ADAPTER_DIR.rstrip("/")) or "/", ".adapter-versions")
+
+def _reuse_or_download(key: str, meta: Dict[str, Any], dest: str, current: Dict[str, Any]) -> bool:
+    """Hard-link an unchanged file from the active version, else download it. True if downloaded."""
+    rel = meta["rel"]
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    prev = (current.get("files") or {}).get(rel)
+    src = os.path.join(LORA_ADAPTER_DIR, rel)
+    if prev and prev.get("etag") == meta["etag"] and prev.get("size") == meta["size"] \
+            and os.path.isfile(src) and os.path.getsize(src) == meta["size"]:
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copy2(src, dest)
+        return False
+    client("s3").download_file(ADAPTER_BUCKET, key, dest, Config=_transfer_config())
+    return True
+
+def _activate(version_dir: str) -> None:
+    """Point LORA_ADAPTER_DIR at version_dir with a single atomic rename."""
+    target = LORA_ADAPTER_DIR.rstrip("/")
+    os.makedirs(os.path.dirname(target) or "/", exist_ok=True)
+    if os.path.isdir(target) and not os.path.islink(target):
+        os.replace(target, os.path.join(_versions_root(), f"legacy-{int(time.time())}"))
+    tmp_link = f"{target}.tmp-{os.getpid()}"
+    if os.path.lexists(tmp_link):
+        os.unlink(tmp_link)
+    os.symlink(version_dir, tmp_link)
+    os.replace(tmp_link, target)
+
+def _prune_versions(keep: str) -> None:
+    root = _versions_root()
+    entries = sorted(
+        (os.path.join(root, d) for d in os.listdir(root)),
+        key=os.path.getmtime, reverse=True,
+    )
+    stale = [d for d in entries if d != keep][max(0, ADAPTER_KEEP_VERSIONS - 1):]
+    for d in stale:
+        shutil.rmtree(d, ignore_errors=True)
+
+@tracing.traced("adapter_sync")
 def download_latest_adapter_from_s3() -> str:
-    os.makedirs(LORA_ADAPTER_DIR, exist_ok=True)
-    prefixes = list_all_common_prefixes(ADAPTER_BUCKET, delimiter="/")
-    latest = pick_latest_prefix(prefixes)
+    """Sync the latest adapter version into LORA_ADAPTER_DIR.
+
+    A warm cache costs one GET of the pointer object. Otherwise only files
+    whose ETag or size changed are downloaded (in parallel), into a fresh
+    version directory that is swapped in atomically once complete.
+    """
+    latest = resolve_latest_version(ADAPTER_BUCKET)
+    current = read_adapter_manifest()
+    if current.get("version") == latest:
+        log.info("Adapter %s already present in %s", latest, LORA_ADAPTER_DIR)
+        return LORA_ADAPTER_DIR
     log.info("Latest adapter prefix in S3: %s", latest)
 
-    objs = list_all_objects(ADAPTER_BUCKET, latest + "/")
+    objs = [o for o in list_all_objects(ADAPTER_BUCKET, latest + "/") if not o["Key"].endswith("/")]
     if not objs:
         raise RuntimeError(f"No objects found under prefix: {latest}")
+    files = {
+        o["Key"]: {"rel": os.path.relpath(o["Key"], latest), "etag": o.get("ETag", "").strip('"'),
+                   "size": int(o.get("Size", 0))}
+        for o in objs
+    }
+
+    root = _versions_root()
+    final_dir = os.path.join(root, latest.replace("/", "_"))
+    staging = f"{final_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=ADAPTER_DOWNLOAD_WORKERS) as pool:
+        downloaded = sum(pool.map(
+            lambda kv: _reuse_or_download(kv[0], kv[1], os.path.join(staging, kv[1]["rel"]), current),
+            files.items(),
+        ))
+
+    manifest = {"version": latest, "files": {m["rel"]: {"etag": m["etag"], "size": m["size"]} for m in files.values()}}
+    with open(os.path.join(staging, ADAPTER_MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(staging, final_dir)
+    _activate(final_dir)
+    _prune_versions(final_dir)
+
+    log.info("Adapter %s synced to %s (downloaded=%d reused=%d)",
+             latest, LORA_ADAPTER_DIR, downloaded, len(files) - downloaded)
+    return LORA_ADAPTER_DIR
 
-    for obj in objs:
-        key = obj["Key"]
-        if key.endswith("/"):
-            continue
-        rel = os.path.relpath(key, latest)
-        local_path = os.path.join(LORA_ADAPTER_DIR, rel)
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        s3.download_file(ADAPTER_BUCKET, key, local_path)
+def adapter_version() -> str:
+    """Version (S3 prefix) of the adapter in LORA_ADAPTER_DIR, or 'local' if unknown."""
+    return read_adapter_manifest().get("version") or "local"
 
-    log.info("Adapter downloaded to %s", LORA_ADAPTER_DIR)
-    return LORA_ADAPTER_DIR
+def load_artifact_from_s3(bucket: str, key: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Header and all hunks of an artifact; reads both the v1 format and legacy JSON."""
+    with tracing.span("artifact_read") as sp:
+        obj = client("s3").get_object(Bucket=bucket, Key=key)
+        header, hunks = hunk_artifact.decode(obj["Body"].read())
+        sp.update(hunks=len(hunks), version=header.get("v"))
+    log.info("Artifact s3://%s/%s: v%s, %d hunks", bucket, key, header.get("v"), len(hunks))
+    return header, hunks
 
 def load_hunks_from_s3(bucket: str, key: str) -> List[Dict[str, Any]]:
-    obj = s3.get_object(Bucket=bucket, Key=key)
-    data = json.loads(obj["Body"].read())
-    hunks = data.get("hunks") or []
-    if not isinstance(hunks, list):
-        raise ValueError("Invalid artifact format: 'hunks' not a list")
-    return hunks
-
+    return load_artifact_from_s3(bucket, key)[1]
+
+def open_artifact_from_s3(bucket: str, key: str) -> hunk_artifact.ArtifactReader:
+    """Lazy reader over a v1 artifact: the header, then single blocks, via range GETs."""
+    def read(offset: int, length: int) -> bytes:
+        rng = f"bytes={offset}-{offset + max(1, length) - 1}"
+        return client("s3").get_object(Bucket=bucket, Key=key, Range=rng)["Body"].read()
+    return hunk_artifact.ArtifactReader(read)
+
+
+def promote_file_index(ref: Dict[str, Any], skip_files: Iterable[str] = ()) -> None:
+    """Make the dispatcher's staged file index of a reviewed head the PR's live one.
+
+    Files in `skip_files` lost hunks to the worker's own limits, so they are
+    left out and the next review of the PR covers them again.
+    """
+    s3 = client("s3")
+    index = json.loads(s3.get_object(Bucket=ref["s3_bucket"], Key=ref["staged_key"])["Body"].read())
+    for path in skip_files:
+        (index.get("files") or {}).pop(path, None)
+    s3.put_object(
+        Bucket=ref["s3_bucket"],
+        Key=ref["key"],
+        Body=json.dumps(index).encode("utf-8"),
+        ContentType="application/json",
+        ServerSideEncryption="AES256",
+    )
@@ -0,0 +1,286 @@
+"""Offline backfill: review many PRs or stored artifacts in one process, e.g.
+after rolling out a new adapter.
+
+    python -m worker.main --backfill manifest.jsonl --out results.jsonl [--dry-run]
+
+One job per manifest line, as JSON or shorthand:
+
+    {"owner": "acme", "repo": "api", "pr_number": 12}        current diff of the PR, from GitHub
+    {"artifact": "s3://bucket/key", "owner": ..., "repo": ..., "pr_number": ..., "head_sha": ...}
+    {"artifact": {"s3_bucket": ..., "s3_key": ...}, ...}     a dispatcher review message as is
+    acme/api#12
+    s3://bucket/key  or  artifacts/pr-12.bin                 PR fields from the v1 artifact header
+
+Up to BACKFILL_PREFETCH jobs are loaded ahead of the model, and hunks of
+consecutive jobs are pooled into prepare_comments calls of about
+BACKFILL_BATCH_HUNKS, so generation batches stay full across small PRs.
+
+Each finished job is appended to the results file at once. A rerun with the
+same file skips jobs that already have a result (failed ones are retried, and
+dry-run results do not count for a posting run), so an interrupted backfill
+resumes where it stopped. Unless dry-run, reviews are
+posted as on the live path (marker, idempotency store, superseded check) under
+delivery id `backfill-<adapter version>`, so rerunning for one adapter never
+posts twice.
+"""
+from __future__ import annotations
+
+import json
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from . import hunk_artifact, tracing
+from .logutil import setup_logger
+from .config import BACKFILL_BATCH_HUNKS, BACKFILL_PREFETCH, GITHUB_API_BASE, IGNORE_PATTERNS, LLM_DISABLED, utc_ts
+from .aws_utils import download_latest_adapter_from_s3, load_artifact_from_s3
+from .diff_hunks import ignored_path, parse_unified_hunks
+from .github_api import get_token, gh_request
+from .model_io import active_adapter_version, get_model
+from .review_logic import (
+    already_reviewed, head_moved, limit_hunks, log_cache_stats, mark_review, pick_line, prepare_comments,
+    submit_review,
+)
+from .review_store import DONE, POSTING
+
+log = setup_logger("backfill")
+
+_PR_RE = re.compile(r"^([\w.-]+)/([\w.-]+)#(\d+)$")
+
+
+def parse_job(line: str) -> Optional[Dict[str, Any]]:
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    m = _PR_RE.match(line)
+    if line.startswith("{"):
+        job = json.loads(line)
+    elif m:
+        job = {"owner": m.group(1), "repo": m.group(2), "pr_number": int(m.group(3))}
+    else:
+        job = {"artifact": line}
+    art = job.get("artifact")
+    if isinstance(art, dict):
+        job["artifact"] = f"s3://{art.get('s3_bucket')}/{art.get('s3_key')}"
+    if not job.get("artifact") and not (job.get("owner") and job.get("repo") and job.get("pr_number")):
+        raise ValueError(f"Manifest line is neither an artifact nor a PR: {line[:80]}")
+    job["id"] = job.get("artifact") or f"{job['owner']}/{job['repo']}#{job['pr_number']}"
+    return job
+
+
+def read_manifest(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [j for j in (parse_job(ln) for ln in f) if j]
+
+
+_POSTED_STATUSES = ("posted", "duplicate", "superseded")
+
+
+def completed_jobs(out_path: str, dry_run: bool = False) -> Set[str]:
+    """Ids of jobs an earlier run's output already covers: any result but `failed`
+    for a dry run, only those that reached GitHub (or had no need to) otherwise."""
+    done: Set[str] = set()
+    try:
+        with open(out_path, encoding="utf-8") as f:
+            for ln in f:
+                try:
+                    rec = json.loads(ln)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                status = rec.get("status")
+                if status in _POSTED_STATUSES or (dry_run and status != "failed"):
+                    done.add(rec.get("job"))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def _pr_hunks(owner: str, repo: str, pr: int, token: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Head SHA and hunks of the PR's current diff, with IGNORE_PATHS applied like the dispatcher."""
+    base = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/pulls/{pr}"
+    head_sha = (gh_request("GET", base, token).json().get("head") or {}).get("sha")
+    hunks: List[Dict[str, Any]] = []
+    url: Optional[str] = f"{base}/files?per_page=100"
+    while url:
+        r = gh_request("GET", url, token)
+        for f in r.json():
+            path = f.get("filename")
+            if path and not ignored_path(path, IGNORE_PATTERNS):
+                hunks.extend(parse_unified_hunks(f.get("patch") or "", path))
+        url = next((p[p.find("<") + 1 : p.find(">")] for p in (r.headers.get("Link") or "").split(",")
+                    if 'rel="next"' in p), None)
+    return head_sha, hunks
+
+
+def load_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    try:
+        art = job.get("artifact")
+        if not art:
+            job["head_sha"], hunks = _pr_hunks(job["owner"], job["repo"], int(job["pr_number"]), get_token())
+        else:
+            if art.startswith("s3://"):
+                bucket, _, key = art[len("s3://"):].partition("/")
+                header, hunks = load_artifact_from_s3(bucket, key)
+            else:
+                with open(art, "rb") as f:
+                    header, hunks = hunk_artifact.decode(f.read())
+            # v1 artifacts name their PR; the manifest line wins where both do.
+            for k in ("owner", "repo", "pr_number", "head_sha"):
+                if not job.get(k) and header.get(k):
+                    job[k] = header[k]
+        job["hunks"] = limit_hunks(hunks)
+    except Exception as e:
+        log.warning("Could not load %s: %s", job["id"], e)
+        job["error"] = f"load: {e}"
+        job["hunks"] = []
+    job["load_s"] = time.perf_counter() - t0
+    return job
+
+
+def _prefetched(pool: ThreadPoolExecutor, jobs: List[Dict[str, Any]], ahead: int) -> Iterator[Dict[str, Any]]:
+    """Loaded jobs in manifest order, with up to `ahead` loads in flight."""
+    pending: deque = deque()
+    for job in jobs:
+        pending.append(pool.submit(load_job, job))
+        if len(pending) >= ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _post(job: Dict[str, Any], delivery_id: str) -> str:
+    owner, repo, pr, head_sha = job.get("owner"), job.get("repo"), job.get("pr_number"), job.get("head_sha")
+    if not (owner and repo and pr and head_sha):
+        job["error"] = "owner, repo, pr_number and head_sha are needed to post"
+        return "failed"
+    pr = int(pr)
+    token = get_token()
+    with tracing.bind(service="worker", cid=f"{delivery_id}:{job['id']}"):
+        if already_reviewed(owner, repo, pr, token, delivery_id, head_sha):
+            return "duplicate"
+        if head_moved(owner, repo, pr, token, head_sha):
+            return "superseded"
+        mark_review(owner, repo, pr, delivery_id, head_sha, POSTING)
+        res = submit_review(owner, repo, pr, token, delivery_id, head_sha, job["comments"], len(job["hunks"]))
+        mark_review(owner, repo, pr, delivery_id, head_sha, DONE,
+                    review_ids=res["review_ids"], posted=res["posted"], failed=res["failed"])
+    job["review_ids"] = res["review_ids"]
+    return "posted"
+
+
+def _record(job: Dict[str, Any], status: str, adapter: str) -> Dict[str, Any]:
+    rec = {
+        "job": job["id"], "status": status, "owner": job.get("owner"), "repo": job.get("repo"),
+        "pr_number": job.get("pr_number"), "head_sha": job.get("head_sha"), "adapter": adapter,
+        "hunks": len(job["hunks"]),
+        "comments": [{"path": c["h"].get("file_path"), "line": pick_line(c["h"]), "body": c["t"],
+                      **({"status": c["status"]} if "status" in c else {})}
+                     for c in job.get("comments") or [] if c["t"]],
+        "load_s": round(job["load_s"], 3), "gen_s": round(job.get("gen_s", 0.0), 3),
+        "post_s": round(job.get("post_s", 0.0), 3), "ts": utc_ts(),
+    }
+    rec["latency_s"] = round(rec["load_s"] + rec["gen_s"] + rec["post_s"], 3)
+    for k in ("review_ids", "error"):
+        if job.get(k):
+            rec[k] = job[k]
+    return rec
+
+
+def _pct(xs: List[float], q: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * q))] if xs else 0.0
+
+
+def run_backfill(
+    manifest: str, out_path: str, dry_run: bool = False, batch_hunks: int = BACKFILL_BATCH_HUNKS,
+    prefetch: int = BACKFILL_PREFETCH, delivery_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Run every job of `manifest` not already in `out_path`; returns the run summary."""
+    jobs = read_manifest(manifest)
+    done = completed_jobs(out_path, dry_run)
+    todo = [j for j in jobs if j["id"] not in done]
+    log.info("Backfill: %d job(s) in manifest, %d already done, %d to run%s",
+             len(jobs), len(jobs) - len(todo), len(todo), " (dry run)" if dry_run else "")
+
+    if not LLM_DISABLED and todo:
+        try:
+            download_latest_adapter_from_s3()
+        except Exception as e:
+            log.warning("Adapter download failed (continuing without): %s", e)
+        # Load before the loader threads start (the inference pool forks here) and
+        # so the adapter version below is the one that generates.
+        try:
+            get_model()
+        except Exception as e:
+            log.warning("Model preload failed (will retry lazily): %s", e)
+    adapter = active_adapter_version()
+    delivery_id = delivery_id or f"backfill-{adapter}"
+
+    statuses: Dict[str, int] = {}
+    latencies: List[float] = []
+    cache_stats: Dict[str, int] = {}
+    n_hunks = 0
+    t_start = time.perf_counter()
+
+    with open(out_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=prefetch) as pool:
+        def finish(job: Dict[str, Any]) -> None:
+            nonlocal n_hunks
+            status = "failed" if job.get("error") else "reviewed"
+            if status == "reviewed" and not dry_run:
+                t0 = time.perf_counter()
+                try:
+                    status = _post(job, delivery_id)
+                except Exception as e:
+                    log.warning("Posting %s failed: %s", job["id"], e)
+                    job["error"], status = f"post: {e}", "failed"
+                job["post_s"] = time.perf_counter() - t0
+            rec = _record(job, status, adapter)
+            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            out.flush()
+            statuses[status] = statuses.get(status, 0) + 1
+            latencies.append(rec["latency_s"])
+            n_hunks += rec["hunks"]
+            wall = time.perf_counter() - t_start
+            log.info("[%d/%d] %s: %s, %d hunk(s) in %.2fs; %.2f hunks/s overall",
+                     sum(statuses.values()), len(todo), job["id"], status, rec["hunks"], rec["latency_s"],
+                     n_hunks / wall if wall else 0.0)
+
+        def run_group(group: List[Dict[str, Any]]) -> None:
+            hunks = [h for j in group for h in j["hunks"]]
+            t0 = time.perf_counter()
+            with tracing.span("backfill_batch", jobs=len(group), hunks=len(hunks)):
+                comments = prepare_comments(hunks, cache_stats) if hunks else []
+            gen_s = time.perf_counter() - t0
+            i = 0
+            for j in group:
+                j["comments"], j["gen_s"] = comments[i : i + len(j["hunks"])], gen_s
+                i += len(j["hunks"])
+                finish(j)
+
+        group: List[Dict[str, Any]] = []
+        for job in _prefetched(pool, todo, prefetch):
+            if job.get("error"):
+                finish(job)
+                continue
+            group.append(job)
+            if sum(len(j["hunks"]) for j in group) >= batch_hunks:
+                run_group(group)
+                group = []
+        if group:
+            run_group(group)
+
+    wall = time.perf_counter() - t_start
+    if cache_stats:
+        log_cache_stats(cache_stats)
+    summary = {
+        "jobs": len(todo), "skipped_done": len(jobs) - len(todo), "statuses": statuses, "hunks": n_hunks,
+        "wall_s": round(wall, 3), "hunks_per_s": round(n_hunks / wall, 3) if wall else 0.0,
+        "jobs_per_min": round(len(todo) * 60 / wall, 2) if wall else 0.0,
+        "latency_p50_s": _pct(latencies, 0.5), "latency_p90_s": _pct(latencies, 0.9),
+        "latency_max_s": max(latencies, default=0.0), "delivery_id": delivery_id, "out": out_path,
+    }
+    log.info("Backfill done: %s", json.dumps(summary))
+    return summary
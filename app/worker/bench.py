@@ -0,0 +1,874 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from .logutil import setup_logger
+
+log = setup_logger("bench")
+
+_SNIPPETS = [
+    "+    print(result)\n+    return result",
+    "+def load(path):\n+    f = open(path)\n+    data = f.read()\n+    return data",
+    "+    for i in range(len(items)):\n+        total = total + items[i]",
+    "+    try:\n+        conn.execute(query)\n+    except:\n+        pass",
+    "+API_KEY = \"secret\"\n+TIMEOUT = 30",
+    "+    if x == None:\n+        return False\n+    else:\n+        return True",
+    "+class Cache:\n+    def __init__(self):\n+        self.items = {}\n+\n+    def get(self, k):\n+        return self.items[k]",
+    "+    result = []\n+    for row in rows:\n+        if row.active:\n+            result.append(row.id)\n+    return result",
+]
+
+
+def sample_hunks(n: int) -> List[Dict[str, Any]]:
+    """Synthetic Python hunks of varied length, shaped like dispatcher artifacts."""
+    out: List[Dict[str, Any]] = []
+    for i in range(n):
+        body = _SNIPPETS[i % len(_SNIPPETS)]
+        body = "\n".join([body] * (1 + i % 3))
+        added = body.count("\n") + 1
+        out.append({
+            "file_path": f"src/module_{i}.py",
+            "patch_hunk": f"@@ -{10 * i},0 +{10 * i},{added} @@\n{body}",
+            "new_start": 10 * i, "new_lines": added,
+            "old_start": 10 * i, "old_lines": 0,
+        })
+    return out
+
+
+def bench_batch(sizes: List[int], n_hunks: int) -> int:
+    from .model_io import get_model, llm_suggest_batch
+
+    hunks = sample_hunks(n_hunks)
+    get_model()
+    llm_suggest_batch(hunks[:1], max_batch=1)
+
+    baseline: List[str] | None = None
+    mismatches = 0
+    for size in sizes:
+        t0 = time.perf_counter()
+        texts = llm_suggest_batch(hunks, max_batch=size)
+        dt = time.perf_counter() - t0
+        if baseline is None:
+            baseline = texts
+        diff = sum(1 for a, b in zip(baseline, texts) if a != b)
+        mismatches += diff
+        print(f"batch={size:<3d} hunks={len(hunks):<4d} time={dt:8.2f}s "
+              f"hunks/s={len(hunks) / dt:7.2f} parity={'ok' if not diff else f'{diff} mismatch'}")
+    return 1 if mismatches else 0
+
+
+def bench_earlystop(fixtures: str | None, n_hunks: int, sizes: List[int]) -> int:
+    """Tokens generated vs. kept with and without the sentence stopping criterion."""
+    from . import model_io
+
+    hunks = load_fixtures(fixtures, n_hunks)
+    tok, model = model_io.get_model()
+    encoded = model_io.encode_prompts(tok, hunks)
+    model_io._generate_batch(tok, model, encoded[:1], early_stop=False)
+
+    mismatches = 0
+    for size in sizes:
+        buckets = model_io._length_buckets([len(ids) for ids in encoded], size)
+        results: Dict[bool, List[str]] = {}
+        for early in (False, True):
+            stats: Dict[str, int] = {}
+            texts: List[str] = [""] * len(hunks)
+            t0 = time.perf_counter()
+            for bucket in buckets:
+                out = model_io._generate_batch(tok, model, [encoded[i] for i in bucket], early_stop=early, stats=stats)
+                for i, raw in zip(bucket, out):
+                    texts[i] = model_io.sanitize(raw)
+            dt = time.perf_counter() - t0
+            results[early] = texts
+            kept = stats["kept"]
+            print(f"batch={size:<3d} early_stop={str(early):<5s} time={dt:7.2f}s steps={stats['steps']:<5d} "
+                  f"generated={stats['generated']:<6d} kept={kept:<6d} kept/generated={kept / max(1, stats['generated']):6.1%}")
+        diff = sum(1 for a, b in zip(results[False], results[True]) if a != b)
+        mismatches += diff
+        print(f"batch={size:<3d} parity={'ok' if not diff else f'{diff} mismatch'}")
+    return 1 if mismatches else 0
+
+
+def bench_prefix(fixtures: str | None, n_hunks: int, sizes: List[int], repeat: int) -> int:
+    """Per-hunk latency with and without the prompt head's KV cache, per batch size, with parity."""
+    from . import model_io
+
+    hunks = load_fixtures(fixtures, n_hunks)
+    tok, model = model_io.get_model()
+    if model_io._model_ctx["prefix"] is None:
+        print(f"no prefix cache for backend={model_io._model_ctx['backend']} "
+              f"(PROMPT_PREFIX_CACHE={model_io.PROMPT_PREFIX_CACHE})")
+        return 1
+    encoded = model_io.encode_prompts(tok, hunks)
+    head = len(model_io._model_ctx["prefix"]["ids"])
+    prompt_tokens = sum(len(ids) for ids in encoded)
+    print(f"hunks={len(hunks)} head_tokens={head} prompt_tokens avg={prompt_tokens / len(encoded):.1f}")
+    model_io._generate_batch(tok, model, encoded[:1])
+
+    mismatches = 0
+    for size in sizes:
+        buckets = model_io._length_buckets([len(ids) for ids in encoded], size)
+        results: Dict[bool, List[str]] = {}
+        for cached in (False, True):
+            best = float("inf")
+            for _ in range(repeat):
+                stats: Dict[str, int] = {}
+                texts: List[str] = [""] * len(hunks)
+                t0 = time.perf_counter()
+                for bucket in buckets:
+                    out = model_io._generate_batch(tok, model, [encoded[i] for i in bucket], stats=stats,
+                                                   prefix_cache=cached)
+                    for i, raw in zip(bucket, out):
+                        texts[i] = model_io.sanitize(raw)
+                best = min(best, time.perf_counter() - t0)
+            results[cached] = texts
+            saved = stats.get("prefix_saved", 0)
+            print(f"batch={size:<3d} prefix_cache={str(cached):<5s} per_hunk={best / len(hunks) * 1000:8.2f}ms "
+                  f"prefill_saved={saved:<6d} ({saved / prompt_tokens:5.1%} of prompt tokens)")
+        diff = sum(1 for a, b in zip(results[False], results[True]) if a != b)
+        mismatches += diff
+        print(f"batch={size:<3d} parity={'ok' if not diff else f'{diff} mismatch'}")
+    return 1 if mismatches else 0
+
+
+def _pss_mb(pid: int) -> float:
+    """Proportional set size: pages shared copy-on-write count once across the processes sharing them."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for ln in f:
+                if ln.startswith("Pss:"):
+                    return int(ln.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _scaling_child(fixtures: str | None, n_hunks: int, cores: List[int]) -> int:
+    from . import infer_pool, model_io
+
+    hunks = load_fixtures(fixtures, n_hunks)
+    tok, model = model_io.get_model()
+    encoded = model_io.encode_prompts(tok, hunks)
+    batches = [[encoded[i] for i in b] for b in model_io._length_buckets([len(x) for x in encoded], model_io.GEN_BATCH_SIZE)]
+    flat = lambda outs: [t for texts in outs for t in texts]  # noqa: E731
+
+    t0 = time.perf_counter()
+    ref = flat([[model_io.sanitize(t) for t in model_io._generate_batch(tok, model, b)] for b in batches])
+    rows = [{"cores": 1, "procs": 0, "threads": 1, "hunks_per_s": len(hunks) / (time.perf_counter() - t0),
+             "mismatch": 0, "pss_mb": _pss_mb(os.getpid())}]
+    for n in cores:
+        for procs, threads in infer_pool.candidate_splits(n):
+            pool = infer_pool.InferencePool(procs, threads)
+            try:
+                pool.generate(batches[:procs])
+                t0 = time.perf_counter()
+                texts = flat(pool.generate(batches))
+                rate = len(hunks) / (time.perf_counter() - t0)
+                pss = sum(_pss_mb(w.pid) for w in pool._pool._pool)
+            finally:
+                pool.close()
+            rows.append({"cores": n, "procs": procs, "threads": threads, "hunks_per_s": rate,
+                         "mismatch": sum(a != b for a, b in zip(ref, texts)), "pss_mb": pss})
+    print("RESULT " + json.dumps({"available": infer_pool.available_cores(), "rows": rows}))
+    return 0
+
+
+def bench_scaling(fixtures: str | None, n_hunks: int, cores: List[int]) -> int:
+    """hunks/s per processes x threads split for each core count, against one
+    in-process single-threaded run; the child keeps one intra-op thread in the
+    parent so forking is safe."""
+    cmd = [sys.executable, "-m", "worker.bench", "scaling", "--child", "--hunks", str(n_hunks),
+           "--cores", ",".join(map(str, cores))]
+    if fixtures:
+        cmd += ["--fixtures", fixtures]
+    proc = subprocess.run(cmd, env={**os.environ, "INFER_PROCS": "1", "INFER_THREADS": "1"},
+                          capture_output=True, text=True)
+    line = next((ln for ln in proc.stdout.splitlines() if ln.startswith("RESULT ")), None)
+    if proc.returncode or not line:
+        print(f"scaling failed: {proc.stderr.strip().splitlines()[-1:] or proc.returncode}")
+        return 1
+    res = json.loads(line[len("RESULT "):])
+    avail = res["available"]
+    base = res["rows"][0]
+    print(f"available cores={avail}; in-process 1 thread: {base['hunks_per_s']:.2f} hunks/s pss={base['pss_mb']:.0f}MB")
+    mismatches = 0
+    for n in cores:
+        rows = [r for r in res["rows"][1:] if r["cores"] == n]
+        best = max(rows, key=lambda r: r["hunks_per_s"])
+        for r in rows:
+            mismatches += r["mismatch"]
+            print(f"cores={n:<2d} procs={r['procs']:<2d} threads={r['threads']:<2d} hunks/s={r['hunks_per_s']:7.2f} "
+                  f"speedup={r['hunks_per_s'] / base['hunks_per_s']:5.2f}x workers_pss={r['pss_mb']:7.0f}MB "
+                  f"parity={'ok' if not r['mismatch'] else str(r['mismatch']) + ' mismatch'}"
+                  f"{' <- pick' if r is best else ''}{' (oversubscribed)' if n > avail else ''}")
+    return 1 if mismatches else 0
+
+
+def load_fixtures(path: str | None, n: int) -> List[Dict[str, Any]]:
+    """Hunks from an artifact file (v1 or {"hunks": [...]} JSON), else synthetic ones."""
+    if not path:
+        return sample_hunks(n)
+    from .hunk_artifact import decode
+
+    with open(path, "rb") as f:
+        return decode(f.read())[1]
+
+
+def _added_coverage(tok, hunks: List[Dict[str, Any]], encoded: List[List[int]]) -> float:
+    kept = total = 0
+    for h, ids in zip(hunks, encoded):
+        text = tok.decode(ids)
+        for ln in (h.get("patch_hunk") or "").split("\n"):
+            if ln.startswith("+") and ln.strip("+ "):
+                total += 1
+                kept += ln in text
+    return kept / total if total else 1.0
+
+
+def bench_prompts(fixtures: str | None, n_hunks: int, repeat: int, generate: bool) -> int:
+    from . import model_io
+
+    hunks = load_fixtures(fixtures, n_hunks)
+    tok, model = model_io.get_model()
+    modes = {
+        "chars": lambda hs: [tok(model_io.build_prompt(h))["input_ids"] for h in hs],
+        "tokens": lambda hs: model_io.encode_prompts(tok, hs),
+    }
+    outputs: Dict[str, List[str]] = {}
+    for name, encode in modes.items():
+        encode(hunks[:1])
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            encoded = encode(hunks)
+        dt = (time.perf_counter() - t0) / repeat
+        lens = [len(ids) for ids in encoded]
+        print(f"{name:<6s} hunks={len(hunks):<4d} encode={dt * 1000:8.2f}ms "
+              f"tokens avg={sum(lens) / len(lens):6.1f} max={max(lens):4d} "
+              f"added_kept={_added_coverage(tok, hunks, encoded):.1%}")
+        if generate:
+            texts = []
+            for ids in encoded:
+                texts.extend(model_io._generate_batch(tok, model, [ids]))
+            outputs[name] = [model_io.sanitize(t) for t in texts]
+    if generate:
+        a, b = outputs["chars"], outputs["tokens"]
+        fb = lambda ts: sum(1 for t in ts if len(t) < 5) / len(ts)
+        print(f"suggestions: same={sum(x == y for x, y in zip(a, b)) / len(a):.1%} "
+              f"short(chars)={fb(a):.1%} short(tokens)={fb(b):.1%}")
+    return 0
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for ln in f:
+                if ln.startswith("VmRSS:"):
+                    return int(ln.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _backend_child(fixtures: str | None, n_hunks: int) -> int:
+    from . import model_io
+
+    hunks = load_fixtures(fixtures, n_hunks)
+    t0 = time.perf_counter()
+    model_io.get_model()
+    load_s = time.perf_counter() - t0
+    model_io.llm_suggest(hunks[0])
+    lat: List[float] = []
+    texts: List[str] = []
+    for h in hunks:
+        t0 = time.perf_counter()
+        texts.append(model_io.llm_suggest(h))
+        lat.append(time.perf_counter() - t0)
+    lat.sort()
+    print("RESULT " + json.dumps({
+        "backend": model_io._model_ctx["backend"], "load_s": load_s,
+        "p50_ms": 1000 * lat[len(lat) // 2], "p90_ms": 1000 * lat[int(len(lat) * 0.9)],
+        "rss_mb": _rss_mb(), "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "texts": texts,
+    }))
+    return 0
+
+
+def bench_backends(backends: List[str], fixtures: str | None, n_hunks: int) -> int:
+    """Run each backend in a fresh process so load time and RSS are not shared."""
+    results: Dict[str, Dict[str, Any]] = {}
+    for b in backends:
+        cmd = [sys.executable, "-m", "worker.bench", "backends", "--child", "--hunks", str(n_hunks)]
+        if fixtures:
+            cmd += ["--fixtures", fixtures]
+        proc = subprocess.run(cmd, env={**os.environ, "INFERENCE_BACKEND": b}, capture_output=True, text=True)
+        line = next((ln for ln in proc.stdout.splitlines() if ln.startswith("RESULT ")), None)
+        if proc.returncode or not line:
+            print(f"{b:<7s} failed: {proc.stderr.strip().splitlines()[-1:] or proc.returncode}")
+            continue
+        results[b] = json.loads(line[len("RESULT "):])
+
+    ref = (results.get("eager") or {}).get("texts")
+    for b, r in results.items():
+        parity = "n/a" if not ref else f"{sum(x == y for x, y in zip(ref, r['texts'])) / len(ref):.0%}"
+        print(f"{b:<7s} (ran {r['backend']:<6s}) load={r['load_s']:6.2f}s p50={r['p50_ms']:8.1f}ms "
+              f"p90={r['p90_ms']:8.1f}ms rss={r['rss_mb']:7.0f}MB peak={r['peak_rss_mb']:7.0f}MB "
+              f"greedy_parity_vs_eager={parity}")
+    return 0 if len(results) == len(backends) else 1
+
+
+def _coldstart_child() -> int:
+    t0 = time.perf_counter()
+    from . import model_io
+
+    model_io.get_model()
+    print("RESULT " + json.dumps({
+        "source": model_io._model_ctx["source"], "total_s": time.perf_counter() - t0,
+        **model_io.cold_start_timings(),
+    }))
+    return 0
+
+
+def bench_coldstart(modes: List[str], runs: int) -> int:
+    """Time-to-first-token of a fresh process, loading prebaked weights vs. the hub snapshot."""
+    failed = 0
+    for mode in modes:
+        env = dict(os.environ)
+        if mode == "hub":
+            env.update(PREBAKED_MODEL_DIR="/nonexistent", MODEL_OFFLINE=env.get("MODEL_OFFLINE", "false"))
+        rows = []
+        for _ in range(runs):
+            proc = subprocess.run([sys.executable, "-m", "worker.bench", "coldstart", "--child"],
+                                  env=env, capture_output=True, text=True)
+            line = next((ln for ln in proc.stdout.splitlines() if ln.startswith("RESULT ")), None)
+            if proc.returncode or not line:
+                print(f"{mode:<8s} failed: {proc.stderr.strip().splitlines()[-1:] or proc.returncode}")
+                failed += 1
+                break
+            rows.append(json.loads(line[len("RESULT "):]))
+        if not rows:
+            continue
+        avg = {k: sum(r.get(k, 0.0) for r in rows) / len(rows)
+               for k in ("total_s", "import_s", "weights_s", "adapter_s", "backend_s", "first_token_s")}
+        print(f"{mode:<8s} (ran {rows[0]['source']:<8s}) runs={len(rows)} "
+              + " ".join(f"{k}={v:6.2f}s" for k, v in avg.items()))
+    return 1 if failed else 0
+
+
+def _imports_child() -> int:
+    t0 = time.perf_counter()
+    from . import runner, service  # noqa: F401
+    from .health import ML_PACKAGES, check
+    from .review_logic import prepare_comments
+
+    import_s = time.perf_counter() - t0
+    check()
+    prepare_comments(sample_hunks(8))
+    print("RESULT " + json.dumps({
+        "import_s": import_s, "modules": len(sys.modules),
+        "heavy": [m for m in ML_PACKAGES if m in sys.modules],
+        "boto3": "boto3" in sys.modules,
+    }))
+    return 0
+
+
+def bench_imports(top: int) -> int:
+    """Import the worker and run the heuristic path with LLM_DISABLED; fail if the ML stack loads."""
+    env = {**os.environ, "LLM_DISABLED": "true"}
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-m", "worker.bench", "imports", "--child"],
+                          env=env, capture_output=True, text=True)
+    line = next((ln for ln in proc.stdout.splitlines() if ln.startswith("RESULT ")), None)
+    if proc.returncode or not line:
+        print(f"failed: {proc.stderr.strip().splitlines()[-1:] or proc.returncode}")
+        return 1
+    r = json.loads(line[len("RESULT "):])
+
+    rows = []
+    for ln in proc.stderr.splitlines():
+        parts = ln.split("|")
+        if ln.startswith("import time:") and len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    print(f"import={r['import_s'] * 1000:.0f}ms modules={r['modules']} boto3_loaded={r['boto3']}")
+    for us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {us / 1000:8.1f}ms  {name}")
+    if r["heavy"]:
+        print(f"FAIL: heuristic path imported {', '.join(r['heavy'])}")
+        return 1
+    print("ok: no ML packages imported")
+    return 0
+
+
+def _best_of(repeat: int, fn) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_artifact(sizes: List[int], repeat: int) -> int:
+    """Size and load time of legacy JSON vs. v1 artifacts, plus one-hunk range reads."""
+    from . import hunk_artifact
+
+    meta = {"owner": "o", "repo": "r", "pr_number": 1, "head_sha": "0" * 40}
+    for n in sizes:
+        hunks = sample_hunks(n)
+        legacy = json.dumps({"hunks": hunks}, ensure_ascii=False).encode("utf-8")
+        t_enc = _best_of(repeat, lambda: hunk_artifact.encode(hunks, meta))
+        v1 = hunk_artifact.encode(hunks, meta)
+        t_json = _best_of(repeat, lambda: hunk_artifact.decode(legacy))
+        t_v1 = _best_of(repeat, lambda: hunk_artifact.decode(v1))
+        assert hunk_artifact.decode(v1)[1] == hunks
+
+        fetched = [0]
+
+        def read(offset: int, length: int) -> bytes:
+            chunk = v1[offset:offset + length]
+            fetched[0] += len(chunk)
+            return chunk
+
+        def one() -> None:
+            fetched[0] = 0
+            hunk_artifact.ArtifactReader(read, prefetch=4096).get(n // 2)
+
+        t_one = _best_of(repeat, one)
+        print(f"hunks={n:<6d} json={len(legacy) / 1024:9.1f}KiB v1={len(v1) / 1024:8.1f}KiB "
+              f"ratio={len(legacy) / len(v1):5.1f}x encode={t_enc * 1000:7.1f}ms "
+              f"load json={t_json * 1000:7.1f}ms v1={t_v1 * 1000:7.1f}ms "
+              f"one_hunk={t_one * 1000:6.2f}ms/{fetched[0] / 1024:.1f}KiB")
+    return 0
+
+
+def bench_coalesce(pushes: int, interval: float, window: float, prs: int) -> int:
+    """Replay bursts of synchronize events through the debounce stage on a fake clock."""
+    import math
+
+    from . import coalesce
+    from .fakes import FakeClock, LocalSQS
+
+    clock = FakeClock()
+    sqs = LocalSQS(clock=clock)
+    events, reviews = "events", "reviews"
+    co = coalesce.Coalescer(coalesce.MemoryLatestStore(), window, clock=clock)
+    start = clock()
+    schedule = sorted((start + i * interval, pr, i) for pr in range(1, prs + 1) for i in range(pushes))
+    counts = {coalesce.FORWARD: 0, coalesce.HOLD: 0, coalesce.SUPERSEDED: 0}
+    latency = []
+
+    while schedule or sqs.pending(events):
+        while schedule and schedule[0][0] <= clock():
+            _, pr, i = schedule.pop(0)
+            sqs.send_message(QueueUrl=events, MessageBody=json.dumps({
+                "owner": "o", "repo": "r", "pr_number": pr, "delivery_id": f"d{pr}-{i}",
+                "action": "synchronize", "after": f"sha{i}",
+            }))
+        for m in sqs.receive_message(QueueUrl=events, MaxNumberOfMessages=10).get("Messages", []):
+            msg = json.loads(m["Body"])
+            sent_at = int(m["Attributes"]["SentTimestamp"]) / 1000
+            decision, delay, body = coalesce.route(co, msg, sent_at)
+            counts[decision] += 1
+            if decision == coalesce.HOLD:
+                sqs.send_message(QueueUrl=events, MessageBody=json.dumps(body), DelaySeconds=int(math.ceil(delay)))
+            elif decision == coalesce.FORWARD:
+                sqs.send_message(QueueUrl=reviews, MessageBody=json.dumps(msg))
+                latency.append(clock() - (start + (pushes - 1) * interval))
+            sqs.delete_message(QueueUrl=events, ReceiptHandle=m["ReceiptHandle"])
+        clock.advance(1.0)
+
+    forwarded = [json.loads(m["Body"])["after"]
+                 for m in sqs.receive_message(QueueUrl=reviews, MaxNumberOfMessages=prs * pushes).get("Messages", [])]
+    print(f"prs={prs} pushes={pushes} interval={interval}s window={window}s -> "
+          f"reviews={len(forwarded)} (heads {sorted(set(forwarded))}) superseded={counts[coalesce.SUPERSEDED]} "
+          f"holds={counts[coalesce.HOLD]} delay_after_last_push={max(latency or [0]):.0f}s")
+    # Every PR must end up reviewed at its newest head, whatever got coalesced on the way.
+    return 0 if forwarded.count(f"sha{pushes - 1}") == prs else 1
+
+
+def bench_idempotency(reviews: int, page: int) -> int:
+    """GitHub calls for the dedup check on a PR with `reviews` earlier bot reviews:
+    review-list scan vs. keyed store, including the `posting` reconciliation path."""
+    from types import SimpleNamespace
+
+    from . import review_logic, review_store
+    from .github_api import make_marker
+
+    bodies = [f"Automated review.\n\n{make_marker(f'old-{i}', f'sha{i}')}" for i in range(reviews)]
+    calls = [0]
+
+    def fake_request(method: str, url: str, token: str, **kw):
+        calls[0] += 1
+        start = int(url.rsplit("page=", 1)[1]) if "&page=" in url else 0
+        nxt = start + page
+        link = f'<{url.split("&page=")[0]}&page={nxt}>; rel="next"' if nxt < len(bodies) else ""
+        return SimpleNamespace(json=lambda: [{"body": b} for b in bodies[start:nxt]], headers={"Link": link})
+
+    real = review_logic.gh_request
+    review_logic.gh_request = fake_request
+    args = ("o", "r", 1, "token", "new-delivery", "newsha")
+    rows = []
+    try:
+        for label, store, state in (("scan", None, None), ("store:miss", review_store.LocalReviewStore(), None),
+                                    ("store:done", review_store.LocalReviewStore(), review_store.DONE),
+                                    ("store:posting", review_store.LocalReviewStore(), review_store.POSTING)):
+            review_store.set_review_store(store)
+            if state:
+                store.put(review_store.review_key(*args[:3], *args[4:]), state)
+            calls[0] = 0
+            t0 = time.perf_counter()
+            hit = review_logic.already_reviewed(*args)
+            rows.append((label, calls[0], hit, time.perf_counter() - t0))
+    finally:
+        review_logic.gh_request = real
+        review_store.set_review_store(None)
+
+    for label, n, hit, dt in rows:
+        print(f"reviews={reviews:<5d} {label:<14s} github_calls={n:<4d} duplicate={str(hit):<5s} {dt * 1000:7.2f}ms")
+    by = {label: (n, hit) for label, n, hit, _ in rows}
+    # Only the `done` record means duplicate, and neither store hit nor miss may touch GitHub.
+    expected = {"scan": False, "store:miss": False, "store:done": True, "store:posting": False}
+    ok = all(by[label][1] == hit for label, hit in expected.items())
+    return 0 if ok and by["store:miss"][0] == by["store:done"][0] == 0 else 1
+
+
+def bench_pipeline(hunks: int, files: int, gen_ms: float, post_ms: float, chunk: int) -> int:
+    """Sequential generate-then-post vs. the streaming pipeline, with generation
+    and GitHub latency simulated by sleeps; also checks that cancelling mid-run
+    stops cleanly without posting the summary."""
+    import threading
+    from types import SimpleNamespace
+
+    from . import pipeline, review_logic
+
+    data = sample_hunks(hunks)
+    for i, h in enumerate(data):
+        h["file_path"] = f"src/module_{i % files}.py"
+    posts: List[Dict[str, Any]] = []
+
+    def fake_suggest(batch):
+        time.sleep(gen_ms / 1000 * len(batch))
+        return [f"suggestion for {h['file_path']}:{h['new_start']}" for h in batch]
+
+    def fake_request(method: str, url: str, token: str, **kw):
+        time.sleep(post_ms / 1000)
+        posts.append({"t": time.perf_counter(), **(kw.get("json") or {})})
+        return SimpleNamespace(json=lambda: {"id": len(posts)}, headers={})
+
+    real = review_logic.suggest_batch, review_logic.gh_request, review_logic.get_cache
+    review_logic.suggest_batch, review_logic.gh_request = fake_suggest, fake_request
+    review_logic.get_cache = lambda: None
+    args = ("o", "r", 1, "token", "bench", "f" * 40)
+    try:
+        posts.clear()
+        t0 = time.perf_counter()
+        comments = review_logic.prepare_comments([dict(h) for h in data])
+        review_logic.submit_review(*args, comments, len(data))
+        seq = (posts[0]["t"] - t0, time.perf_counter() - t0, len(posts))
+
+        posts.clear()
+        res = pipeline.stream_review(*args, [dict(h) for h in data], post_chunk=chunk)
+        pipe = (res["first_post_s"], res["wall_s"], len(posts))
+        paths = [c["path"] for p in posts for c in p.get("comments", [])]
+        grouped = all(paths.index(p) + paths.count(p) - 1 == len(paths) - 1 - paths[::-1].index(p) for p in set(paths))
+
+        posts.clear()
+        cancel = threading.Event()
+        before = threading.active_count()
+        timer = threading.Timer(gen_ms / 1000 * hunks / 3, cancel.set)
+        timer.start()
+        res_c = pipeline.stream_review(*args, [dict(h) for h in data], cancel=cancel, post_chunk=chunk)
+        timer.join()
+        leaked = threading.active_count() - before
+        marker = any(review_logic.MARKER_PREFIX in (p.get("body") or "") for p in posts)
+    finally:
+        review_logic.suggest_batch, review_logic.gh_request, review_logic.get_cache = real
+
+    print(f"hunks={hunks} files={files} gen={gen_ms}ms/hunk post={post_ms}ms chunk={chunk}")
+    print(f"sequential first_comment={seq[0]:6.2f}s wall={seq[1]:6.2f}s reviews={seq[2]}")
+    print(f"pipelined  first_comment={pipe[0]:6.2f}s wall={pipe[1]:6.2f}s reviews={pipe[2]} "
+          f"posted={res['posted']} files_contiguous={grouped}")
+    print(f"cancelled  after={res_c['wall_s']:6.2f}s posted={res_c['posted']} reviews={len(posts)} "
+          f"summary_posted={marker} threads_left={leaked}")
+    ok = res["posted"] == hunks and grouped and res_c["cancelled"] and not marker and not leaked and pipe[0] < seq[0]
+    return 0 if ok else 1
+
+
+def bench_trace(hunks: int, post_ms: float) -> int:
+    """Per-stage span summary of one streamed review (real suggestions, fake
+    GitHub), collected with the in-memory exporter."""
+    from types import SimpleNamespace
+
+    from . import pipeline, review_logic, tracing
+
+    def fake_request(method: str, url: str, token: str, **kw):
+        time.sleep(post_ms / 1000)
+        return SimpleNamespace(json=lambda: {"id": 1}, headers={})
+
+    exporter = tracing.MemoryExporter()
+    prev = tracing.set_exporter(exporter)
+    real = review_logic.gh_request
+    review_logic.gh_request = fake_request
+    try:
+        with tracing.bind(service="worker", cid="bench-trace", received_at=time.time()):
+            with tracing.span("review", hunks=hunks):
+                res = pipeline.stream_review("o", "r", 1, "token", "bench-trace", "f" * 40, sample_hunks(hunks))
+    finally:
+        review_logic.gh_request = real
+        tracing.set_exporter(prev)
+
+    for name, row in sorted(exporter.summary().items(), key=lambda kv: -kv[1]["total_ms"]):
+        print(f"{name:<18s} count={row['count']:<4d} total={row['total_ms']:10.1f}ms "
+              f"p50={row['p50_ms']:9.2f}ms p99={row['p99_ms']:9.2f}ms")
+    for m in exporter.metrics():
+        print(f"{m['name']:<18s} {m['value']}{m['unit']}")
+    cids = {r.get("cid") for r in exporter.records}
+    print(f"records={len(exporter.records)} correlation_ids={sorted(c or '-' for c in cids)}")
+    return 0 if res["posted"] and cids == {"bench-trace"} else 1
+
+
+def _gh_user(login: str, uid: int) -> Dict[str, Any]:
+    base = f"https://api.github.com/users/{login}"
+    return {"login": login, "id": uid, "node_id": f"MDQ6VXNlcj{uid}", "avatar_url": f"https://avatars.githubusercontent.com/u/{uid}?v=4",
+            "gravatar_id": "", "url": base, "html_url": f"https://github.com/{login}", "type": "User", "site_admin": False,
+            **{f"{k}_url": f"{base}/{k}" for k in ("followers", "following", "gists", "starred", "subscriptions",
+                                                     "organizations", "repos", "events", "received_events")}}
+
+
+def _gh_repo(owner: str, name: str, rid: int) -> Dict[str, Any]:
+    base = f"https://api.github.com/repos/{owner}/{name}"
+    return {"id": rid, "node_id": f"R_kgDO{rid}", "name": name, "full_name": f"{owner}/{name}", "private": False,
+            "owner": _gh_user(owner, rid + 1), "html_url": f"https://github.com/{owner}/{name}",
+            "description": "Service " * 8, "fork": False, "url": base, "default_branch": "main",
+            "created_at": "2024-01-01T00:00:00Z", "updated_at": "2026-10-01T00:00:00Z", "size": 4096,
+            "stargazers_count": 12, "watchers_count": 12, "language": "Python", "topics": ["ci", "review", "aws"],
+            **{f"{k}_url": f"{base}/{k}" for k in (
+                "forks", "keys", "collaborators", "teams", "hooks", "issue_events", "events", "assignees", "branches",
+                "tags", "blobs", "git_tags", "git_refs", "trees", "statuses", "languages", "stargazers", "contributors",
+                "subscribers", "subscription", "commits", "git_commits", "comments", "issue_comment", "contents",
+                "compare", "merges", "archive", "downloads", "issues", "pulls", "milestones", "notifications",
+                "labels", "releases", "deployments")}}
+
+
+def sample_pr_event(i: int, action: str, size_kb: int, state: str = "open", draft: bool = False) -> bytes:
+    """A pull_request delivery shaped like GitHub's, padded to about `size_kb`
+    with PR description text and labels (real ones run from ~25 KB to MBs)."""
+    repo = _gh_repo("acme", f"service-{i % 7}", 1000 + i)
+    sha = f"{i:040x}"
+    pr = {
+        "url": f"{repo['url']}/pulls/{i}", "id": 5_000_000 + i, "node_id": f"PR_kwDO{i}", "number": i,
+        "state": state, "locked": False, "title": f"Change {i}", "user": _gh_user("dev", 42),
+        "body": "", "created_at": "2026-10-01T00:00:00Z", "updated_at": "2026-10-02T00:00:00Z",
+        "labels": [], "draft": draft,
+        "head": {"label": f"acme:feature-{i}", "ref": f"feature-{i}", "sha": sha, "user": _gh_user("dev", 42), "repo": repo},
+        "base": {"label": "acme:main", "ref": "main", "sha": "0" * 40, "user": _gh_user("acme", 7), "repo": repo},
+        "_links": {k: {"href": f"{repo['url']}/pulls/{i}/{k}"} for k in ("self", "html", "issue", "comments", "commits", "statuses")},
+        "additions": 120, "deletions": 40, "changed_files": 6, "commits": 3,
+    }
+    evt = {"action": action, "number": i, "pull_request": pr, "before": "1" * 40, "after": sha,
+           "repository": repo, "sender": _gh_user("dev", 42)}
+    raw = json.dumps(evt).encode()
+    pad = max(0, size_kb * 1024 - len(raw))
+    pr["labels"] = [{"id": n, "name": f"area/{n}", "color": "ededed", "default": False,
+                     "description": "Label \"quoted\" \u2713 text"} for n in range(pad // 1200)]
+    raw = json.dumps(evt).encode()
+    pr["body"] = ("Fixes the flaky retry path; see logs {\"a\": [1, 2]}.\n" * (max(0, size_kb * 1024 - len(raw)) // 48 + 1))
+    return json.dumps(evt).encode()
+
+
+def bench_webhook(sizes: List[int], n_events: int) -> int:
+    """Handler latency (p50/p99) and median peak allocation per call for each
+    payload size, full parse vs. the partial-scan fast path, on a realistic
+    mix of deliveries."""
+    import hashlib
+    import hmac
+    import importlib
+    import tracemalloc
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("WEBHOOK_SECRET_ARN", "bench-secret")
+    os.environ.setdefault("PR_EVENTS_SQS_URL", "https://sqs.local/bench")
+    handler = importlib.import_module("webhook.handler")
+    from .fakes import LocalSQS
+
+    class _Secrets:
+        def get_secret_value(self, SecretId: str) -> Dict[str, str]:
+            return {"SecretString": "s3cr3t"}
+
+    handler._sm, handler._sqs, handler.TRACE = _Secrets(), LocalSQS(), False
+    handler._secrets_cache.clear()
+    # Roughly what a busy repo sends: most actions are not ones we review.
+    mix = [("labeled", "open", False), ("review_requested", "open", False), ("assigned", "open", False),
+           ("closed", "closed", False), ("unlabeled", "open", False), ("synchronize", "open", True),
+           ("synchronize", "open", False), ("opened", "open", False), ("submitted", "open", False),
+           ("edited", "closed", False)]
+
+    def event(raw: bytes) -> Dict[str, Any]:
+        sig = "sha256=" + hmac.new(b"s3cr3t", raw, hashlib.sha256).hexdigest()
+        return {"headers": {"X-GitHub-Event": "pull_request", "X-GitHub-Delivery": "d",
+                            "X-Hub-Signature-256": sig}, "body": raw.decode(), "isBase64Encoded": False}
+
+    def pct(xs: List[float], q: float) -> float:
+        return sorted(xs)[min(len(xs) - 1, int(len(xs) * q))] * 1000
+
+    default_min = handler.FAST_PARSE_MIN_BYTES
+    mismatches = 0
+    for kb in sizes:
+        events = [event(sample_pr_event(i, a, kb, state=st, draft=dr))
+                  for i, (a, st, dr) in ((i, mix[i % len(mix)]) for i in range(n_events))]
+        results: Dict[str, List[int]] = {}
+        for mode, min_bytes in (("full", 1 << 62), ("fast", default_min)):
+            handler.FAST_PARSE_MIN_BYTES = min_bytes
+            lat: Dict[bool, List[float]] = {True: [], False: []}
+            codes: List[int] = []
+            for evt in events:
+                t0 = time.perf_counter()
+                code = handler.lambda_handler(evt, None)["statusCode"]
+                lat[code == 202].append(time.perf_counter() - t0)
+                codes.append(code)
+            # Peak allocation per call, in a separate pass since tracing skews timings.
+            peaks: Dict[bool, List[int]] = {True: [], False: []}
+            tracemalloc.start()
+            for evt, code in zip(events[: len(mix)], codes):
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                handler.lambda_handler(evt, None)
+                peaks[code == 202].append(tracemalloc.get_traced_memory()[1] - base)
+            tracemalloc.stop()
+            peak = {k: sorted(v)[len(v) // 2] if v else 0 for k, v in peaks.items()}
+            results[mode] = codes
+            print(f"size={kb:<4d}KB mode={mode:<4s} "
+                  f"ignored p50={pct(lat[False], .5):7.3f}ms p99={pct(lat[False], .99):7.3f}ms "
+                  f"peak={peak[False] / 1024:6.0f}KB | "
+                  f"queued p50={pct(lat[True], .5):7.3f}ms p99={pct(lat[True], .99):7.3f}ms "
+                  f"peak={peak[True] / 1024:6.0f}KB | all p99={pct(lat[False] + lat[True], .99):7.3f}ms "
+                  f"(ignored {len(lat[False])}/{len(codes)})")
+        diff = sum(a != b for a, b in zip(results["full"], results["fast"]))
+        mismatches += diff
+        print(f"size={kb:<4d}KB parity={'ok' if not diff else f'{diff} mismatch'}")
+    handler.FAST_PARSE_MIN_BYTES = default_min
+    return 1 if mismatches else 0
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="worker.bench", description="Worker micro-benchmarks")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    b = sub.add_parser("batch", help="hunks/sec of batched generation vs. batch size")
+    b.add_argument("--sizes", default="1,4,8")
+    b.add_argument("--hunks", type=int, default=16)
+
+    p = sub.add_parser("prompts", help="char truncation vs. token-budget prompt building")
+    p.add_argument("--fixtures", help="artifact JSON with real hunks")
+    p.add_argument("--hunks", type=int, default=64)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--generate", action="store_true", help="also compare generated suggestions")
+
+    k = sub.add_parser("backends", help="latency / RSS / greedy parity per INFERENCE_BACKEND")
+    k.add_argument("--backends", default="eager,merged,int8,onnx")
+    k.add_argument("--fixtures", help="artifact JSON with real hunks")
+    k.add_argument("--hunks", type=int, default=16)
+    k.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+
+    c = sub.add_parser("coldstart", help="cold-start phase timings, prebaked vs. hub weights")
+    c.add_argument("--modes", default="prebaked,hub")
+    c.add_argument("--runs", type=int, default=3)
+    c.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+
+    i = sub.add_parser("imports", help="import-time profile of the LLM_DISABLED path; fails if torch loads")
+    i.add_argument("--top", type=int, default=10)
+    i.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+
+    a = sub.add_parser("artifact", help="legacy JSON vs. v1 artifact size and load time")
+    a.add_argument("--sizes", default="10,1000,10000")
+    a.add_argument("--repeat", type=int, default=3)
+
+    co = sub.add_parser("coalesce", help="debounce of rapid synchronize events, on a fake clock")
+    co.add_argument("--pushes", type=int, default=5)
+    co.add_argument("--interval", type=float, default=3.0)
+    co.add_argument("--window", type=float, default=10.0)
+    co.add_argument("--prs", type=int, default=1)
+
+    d = sub.add_parser("idempotency", help="GitHub calls of the dedup check: review scan vs. keyed store")
+    d.add_argument("--reviews", type=int, default=500)
+    d.add_argument("--page", type=int, default=100)
+
+    pl = sub.add_parser("pipeline", help="time to first comment and wall time, sequential vs. pipelined posting")
+    pl.add_argument("--hunks", type=int, default=40)
+    pl.add_argument("--files", type=int, default=8)
+    pl.add_argument("--gen-ms", type=float, default=50.0)
+    pl.add_argument("--post-ms", type=float, default=150.0)
+    pl.add_argument("--chunk", type=int, default=10)
+
+    e = sub.add_parser("earlystop", help="tokens generated vs. kept, with and without the sentence stop")
+    e.add_argument("--fixtures", help="artifact JSON with real hunks")
+    e.add_argument("--hunks", type=int, default=16)
+    e.add_argument("--sizes", default="1,4")
+
+    tr = sub.add_parser("trace", help="per-stage span summary of one review, via the in-memory exporter")
+    tr.add_argument("--hunks", type=int, default=12)
+    tr.add_argument("--post-ms", type=float, default=100.0)
+
+    sc = sub.add_parser("scaling", help="hunks/s per processes x threads split of 1..8 cores, with parity and PSS")
+    sc.add_argument("--fixtures", help="artifact JSON with real hunks")
+    sc.add_argument("--hunks", type=int, default=16)
+    sc.add_argument("--cores", default="1,2,4,8")
+    sc.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+
+    wh = sub.add_parser("webhook", help="webhook handler p50/p99 latency and peak memory, full parse vs. fast path")
+    wh.add_argument("--sizes", default="30,200,1000", help="payload sizes in KB")
+    wh.add_argument("--events", type=int, default=200)
+
+    px = sub.add_parser("prefix", help="per-hunk latency with vs. without the prompt head's KV cache, with parity")
+    px.add_argument("--fixtures", help="artifact JSON with real hunks")
+    px.add_argument("--hunks", type=int, default=16)
+    px.add_argument("--sizes", default="1,4")
+    px.add_argument("--repeat", type=int, default=3)
+
+    args = ap.parse_args(argv)
+    from . import tracing
+    tracing.set_exporter(None)  # keep span lines out of benchmark output
+    if args.cmd == "batch":
+        return bench_batch([int(s) for s in args.sizes.split(",") if s], args.hunks)
+    if args.cmd == "prompts":
+        return bench_prompts(args.fixtures, args.hunks, args.repeat, args.generate)
+    if args.cmd == "backends":
+        if args.child:
+            return _backend_child(args.fixtures, args.hunks)
+        return bench_backends([b for b in args.backends.split(",") if b], args.fixtures, args.hunks)
+    if args.cmd == "coldstart":
+        if args.child:
+            return _coldstart_child()
+        return bench_coldstart([m for m in args.modes.split(",") if m], args.runs)
+    if args.cmd == "artifact":
+        return bench_artifact([int(x) for x in args.sizes.split(",") if x], args.repeat)
+    if args.cmd == "coalesce":
+        return bench_coalesce(args.pushes, args.interval, args.window, args.prs)
+    if args.cmd == "idempotency":
+        return bench_idempotency(args.reviews, args.page)
+    if args.cmd == "pipeline":
+        return bench_pipeline(args.hunks, args.files, args.gen_ms, args.post_ms, args.chunk)
+    if args.cmd == "earlystop":
+        return bench_earlystop(args.fixtures, args.hunks, [int(x) for x in args.sizes.split(",") if x])
+    if args.cmd == "trace":
+        return bench_trace(args.hunks, args.post_ms)
+    if args.cmd == "scaling":
+        cores = [int(x) for x in args.cores.split(",") if x]
+        if args.child:
+            return _scaling_child(args.fixtures, args.hunks, cores)
+        return bench_scaling(args.fixtures, args.hunks, cores)
+    if args.cmd == "webhook":
+        return bench_webhook([int(x) for x in args.sizes.split(",") if x], args.events)
+    if args.cmd == "prefix":
+        return bench_prefix(args.fixtures, args.hunks, [int(x) for x in args.sizes.split(",") if x], args.repeat)
+    if args.cmd == "imports":
+        return _imports_child() if args.child else bench_imports(args.top)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
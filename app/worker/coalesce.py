@@ -0,0 +1,116 @@
+"""Debounce PR events: only the newest event of a PR is forwarded, and only once
+the PR has been quiet for `window_sec`.
+
+Every event is noted in a per-PR "latest" record when first seen. An event that
+is no longer the latest is superseded; the latest one is held (re-queued with a
+delay) until the window since it arrived has passed, then forwarded.
+
+Standalone (stdlib only) so the dispatcher image can copy it, like gh_client.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+FORWARD = "forward"
+HOLD = "hold"
+SUPERSEDED = "superseded"
+
+MAX_DELAY_SEC = 900  # SQS DelaySeconds ceiling
+
+
+def pr_key(owner: str, repo: str, pr_number: Any) -> str:
+    return f"{owner}/{repo}#{pr_number}"
+
+
+class MemoryLatestStore:
+    """Latest event per PR in process memory, for local runs and simulations."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, Any]] = {}
+
+    def note(self, key: str, event_id: str, sha: Optional[str], seen_at: float) -> Dict[str, Any]:
+        with self._lock:
+            cur = self._data.get(key)
+            if cur is None or cur["seen_at"] <= seen_at:
+                cur = self._data[key] = {"event_id": event_id, "sha": sha, "seen_at": seen_at}
+            return dict(cur)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cur = self._data.get(key)
+            return dict(cur) if cur else None
+
+
+class DynamoLatestStore:
+    """Latest event per PR as `latest:<owner>/<repo>#<n>` items in a DynamoDB table keyed by `pk`."""
+
+    def __init__(self, table: Any, ttl_sec: int = 24 * 3600, prefix: str = "latest:"):
+        self._table = table
+        self._ttl = ttl_sec
+        self._prefix = prefix
+
+    @staticmethod
+    def _record(item: Dict[str, Any]) -> Dict[str, Any]:
+        return {"event_id": item.get("event_id"), "sha": item.get("sha"), "seen_at": float(item["seen_at"])}
+
+    def note(self, key: str, event_id: str, sha: Optional[str], seen_at: float) -> Dict[str, Any]:
+        from decimal import Decimal
+
+        try:
+            resp = self._table.update_item(
+                Key={"pk": self._prefix + key},
+                UpdateExpression="SET event_id = :e, sha = :s, seen_at = :t, #ttl = :x",
+                ConditionExpression="attribute_not_exists(pk) OR seen_at <= :t",
+                ExpressionAttributeNames={"#ttl": "ttl"},
+                ExpressionAttributeValues={
+                    ":e": event_id, ":s": sha, ":t": Decimal(str(seen_at)), ":x": int(time.time()) + self._ttl,
+                },
+                ReturnValues="ALL_NEW",
+            )
+            return self._record(resp["Attributes"])
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            return self.get(key) or {"event_id": event_id, "sha": sha, "seen_at": seen_at}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self._table.get_item(Key={"pk": self._prefix + key}, ConsistentRead=True).get("Item")
+        return self._record(item) if item else None
+
+
+class Coalescer:
+    def __init__(self, store: Any, window_sec: float, clock: Callable[[], float] = time.time):
+        self.store = store
+        self.window_sec = window_sec
+        self._clock = clock
+
+    def offer(self, key: str, event_id: str, sha: Optional[str], seen_at: float, noted: bool) -> Tuple[str, float]:
+        """Decide one event: (FORWARD, 0), (SUPERSEDED, 0) or (HOLD, delay_sec).
+
+        `noted` is True for events already recorded on an earlier pass, which
+        are only checked against the latest record, never re-recorded.
+        """
+        latest = self.store.get(key) if noted else self.store.note(key, event_id, sha, seen_at)
+        if latest and latest["event_id"] != event_id:
+            return SUPERSEDED, 0.0
+        wait = (latest["seen_at"] if latest else seen_at) + self.window_sec - self._clock()
+        if wait > 0:
+            return HOLD, min(wait, MAX_DELAY_SEC)
+        return FORWARD, 0.0
+
+
+def route(coalescer: Coalescer, msg: Dict[str, Any], sent_at: float) -> Tuple[str, float, Dict[str, Any]]:
+    """Apply `coalescer` to one queue message.
+
+    Returns (decision, delay_sec, body); on HOLD, `body` is what to re-queue:
+    the message plus the time it was first seen, so later passes keep the
+    original arrival time.
+    """
+    state = msg.get("coalesce") or {}
+    seen_at = float(state.get("seen_at") or sent_at)
+    decision, delay = coalescer.offer(
+        pr_key(msg.get("owner"), msg.get("repo"), msg.get("pr_number")),
+        str(msg.get("delivery_id")), msg.get("after"), seen_at, noted=bool(state),
+    )
+    return decision, delay, {**msg, "coalesce": {"seen_at": seen_at}}
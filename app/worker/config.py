@@ -3,6 +3,7 @@ import os
 import datetime as _dt
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
 
 GITHUB_API_BASE = os.getenv("GITHUB_API_BASE", "https://api.github.com")
 USER_AGENT = os.getenv("GITHUB_USER_AGENT", "ecs-reviewer")
@@ -16,17 +17,63 @@ MAX_BODY_CHARS = int(os.getenv("MAX_BODY_CHARS", "250"))
 IDEMPOTENCY = os.getenv("IDEMPOTENCY", "true").lower() == "true"
 MARKER_PREFIX = os.getenv("MARKER_PREFIX", "ecs")
 HTTP_TIMEOUT_SEC = float(os.getenv("HTTP_TIMEOUT_SEC", "12"))
+GITHUB_MAX_RETRIES = int(os.getenv("GITHUB_MAX_RETRIES", "3"))
+GITHUB_RATE_PER_SEC = float(os.getenv("GITHUB_RATE_PER_SEC", "10"))
+GITHUB_BURST = int(os.getenv("GITHUB_BURST", "20"))
+REVIEW_STORE_BACKEND = os.getenv("REVIEW_STORE_BACKEND", "none").lower()
+REVIEW_STORE_TABLE = os.getenv("REVIEW_STORE_TABLE", "")
+REVIEW_STORE_TTL_SEC = int(os.getenv("REVIEW_STORE_TTL_SEC", str(30 * 24 * 3600)))
+SKIP_SUPERSEDED = os.getenv("SKIP_SUPERSEDED", "true").lower() == "true"
+REVIEW_MAX_COMMENTS = max(1, int(os.getenv("REVIEW_MAX_COMMENTS", "50") or 1))
+PIPELINE_POSTING = os.getenv("PIPELINE_POSTING", "true").lower() == "true"
+PIPELINE_QUEUE_SIZE = max(1, int(os.getenv("PIPELINE_QUEUE_SIZE", "16") or 1))
+PIPELINE_POST_CHUNK = max(1, int(os.getenv("PIPELINE_POST_CHUNK", "10") or 1))
+PIPELINE_HEAD_CHECK_SEC = float(os.getenv("PIPELINE_HEAD_CHECK_SEC", "30"))
 
 MODEL_ID = os.getenv("MODEL_ID", "Salesforce/codegen-350M-multi")
 MODEL_DIR = os.getenv("MODEL_DIR", "/models")
 GEN_MAX_NEW_TOKENS = int(os.getenv("GEN_MAX_NEW_TOKENS", "64"))
+GEN_EARLY_STOP = os.getenv("GEN_EARLY_STOP", "true").lower() == "true"
 TRUNCATE_HUNK_CHARS = int(os.getenv("TRUNCATE_HUNK_CHARS", "600"))
+PROMPT_PATCH_TOKENS = int(os.getenv("PROMPT_PATCH_TOKENS", "192") or 0)
+PROMPT_PREFIX_CACHE = os.getenv("PROMPT_PREFIX_CACHE", "true").lower() == "true"
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager").strip().lower()
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "").strip() or os.path.join(MODEL_DIR, "onnx")
+PREBAKED_MODEL_DIR = os.getenv("PREBAKED_MODEL_DIR", "").strip() or os.path.join(MODEL_DIR, "prebaked")
+MODEL_OFFLINE = os.getenv("MODEL_OFFLINE", os.getenv("HF_HUB_OFFLINE", "false")).lower() in ("1", "true")
 LLM_DISABLED = os.getenv("LLM_DISABLED", "false").lower() == "true"
 MAX_HUNKS_LIMIT = int(os.getenv("MAX_HUNKS", "0") or 0)
+HUNK_TOKEN_BUDGET = int(os.getenv("HUNK_TOKEN_BUDGET", "0") or 0)
+MAX_HUNKS_PER_FILE = int(os.getenv("MAX_HUNKS_PER_FILE", "0") or 0)
+GEN_BATCH_SIZE = max(1, int(os.getenv("GEN_BATCH_SIZE", "4") or 1))
+INFER_PROCS = os.getenv("INFER_PROCS", "1").strip().lower() or "1"
+INFER_THREADS = int(os.getenv("INFER_THREADS", "0") or 0)
+INFER_CALIBRATION_FILE = os.getenv("INFER_CALIBRATION_FILE", "/tmp/infer_calibration.json")
+INFER_CALIBRATION_HUNKS = int(os.getenv("INFER_CALIBRATION_HUNKS", "16") or 1)
 
 ADAPTER_BUCKET = os.getenv("ADAPTER_BUCKET", "codegen-350m-finetune-adapters")
 LORA_ADAPTER_DIR = os.getenv("LORA_ADAPTER_DIR", "").strip() or "/models/adapters/latest"
 os.environ["LORA_ADAPTER_DIR"] = LORA_ADAPTER_DIR
+ADAPTER_POINTER_KEY = os.getenv("ADAPTER_POINTER_KEY", "LATEST")
+ADAPTER_DOWNLOAD_WORKERS = max(1, int(os.getenv("ADAPTER_DOWNLOAD_WORKERS", "8") or 1))
+ADAPTER_KEEP_VERSIONS = max(1, int(os.getenv("ADAPTER_KEEP_VERSIONS", "2") or 1))
+
+SUGGEST_CACHE = os.getenv("SUGGEST_CACHE", "true").lower() == "true"
+SUGGEST_CACHE_MAX_ENTRIES = int(os.getenv("SUGGEST_CACHE_MAX_ENTRIES", "4096"))
+SUGGEST_CACHE_TTL_SEC = int(os.getenv("SUGGEST_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+SUGGEST_CACHE_BACKEND = os.getenv("SUGGEST_CACHE_BACKEND", "none").lower()
+SUGGEST_CACHE_BUCKET = os.getenv("SUGGEST_CACHE_BUCKET", "")
+SUGGEST_CACHE_PREFIX = os.getenv("SUGGEST_CACHE_PREFIX", "suggestions/")
+SUGGEST_CACHE_TABLE = os.getenv("SUGGEST_CACHE_TABLE", "")
+
+REVIEW_QUEUE_URL = os.getenv("REVIEW_QUEUE_URL", "")
+SERVE_CONCURRENCY = max(1, int(os.getenv("SERVE_CONCURRENCY", "2") or 1))
+SERVE_WAIT_SEC = int(os.getenv("SERVE_WAIT_SEC", "20"))
+SERVE_VISIBILITY_SEC = int(os.getenv("SERVE_VISIBILITY_SEC", "300"))
+
+BACKFILL_BATCH_HUNKS = max(1, int(os.getenv("BACKFILL_BATCH_HUNKS", "64") or 1))
+BACKFILL_PREFETCH = max(1, int(os.getenv("BACKFILL_PREFETCH", "4") or 1))
+IGNORE_PATTERNS = os.getenv("IGNORE_PATHS", "package-lock.json,^.*/dist/.*,^.*/build/.*").split(",")
 
 
 def utc_ts() -> int:
@@ -0,0 +1,59 @@
+"""Split GitHub file patches into the hunk dicts the rest of the pipeline uses:
+
+    {"file_path", "patch_hunk", "new_start", "new_lines", "old_start", "old_lines"}
+
+Standalone (stdlib only) so the dispatcher image can copy it, like gh_client.
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, Iterable, Iterator, List
+
+_HUNK_HDR_RE = re.compile(r"@@\s*-(\d+)(?:,(\d+))?\s+\+(\d+)(?:,(\d+))?\s+@@")
+
+
+def parse_unified_hunks(patch: str, file_path: str) -> Iterator[Dict[str, Any]]:
+    """Yield unified diff hunks from a file patch, one at a time."""
+    if not patch:
+        return
+    buf: List[str] = []
+    hdr = None
+    for line in patch.splitlines():
+        m = _HUNK_HDR_RE.match(line)
+        if m:
+            if hdr:
+                yield _hunk(file_path, hdr, buf)
+            hdr, buf = m, [line]
+        elif hdr:
+            buf.append(line)
+    if hdr:
+        yield _hunk(file_path, hdr, buf)
+
+
+def _hunk(file_path: str, m: "re.Match[str]", buf: List[str]) -> Dict[str, Any]:
+    return {
+        "file_path": file_path,
+        "patch_hunk": "\n".join(buf),
+        "new_start": int(m.group(3)), "new_lines": int(m.group(4) or "0"),
+        "old_start": int(m.group(1)), "old_lines": int(m.group(2) or "0")
+    }
+
+
+def ignored_path(path: str, patterns: Iterable[str]) -> bool:
+    """True if `path` matches a pattern: a regex when it starts with ^, else a substring."""
+    path = path or ""
+    for pat in patterns:
+        pat = pat.strip()
+        if not pat:
+            continue
+        try:
+            if pat.startswith("^"):
+                if re.match(pat, path):
+                    return True
+            else:
+                if pat in path:
+                    return True
+        except re.error:
+            if pat in path:
+                return True
+    return False
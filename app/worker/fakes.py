@@ -0,0 +1,524 @@
+"""In-process stand-ins for AWS and GitHub, for simulations, benchmarks and the
+load test harness (loadtest.py). Stdlib only.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeClock:
+    """Manually advanced clock; pass it as `clock=` wherever a time source is injectable."""
+
+    def __init__(self, start: float = 1_700_000_000.0):
+        self.now = start
+        self._lock = threading.Lock()
+
+    def __call__(self) -> float:
+        with self._lock:
+            return self.now
+
+    def advance(self, seconds: float) -> float:
+        with self._lock:
+            self.now += seconds
+            return self.now
+
+
+class LocalSQS:
+    """In-memory stand-in for the subset of the boto3 SQS client the worker uses.
+
+    Visibility timeouts and long polling behave like SQS closely enough to
+    exercise `ReviewService` without AWS; `clock` can be swapped for a fake.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic, default_visibility: int = 30):
+        self._clock = clock
+        self._default_visibility = default_visibility
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._queues: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.deleted: List[str] = []
+
+    def _queue(self, url: str) -> Dict[str, Dict[str, Any]]:
+        return self._queues.setdefault(url, {})
+
+    def send_message(self, QueueUrl: str, MessageBody: str, DelaySeconds: int = 0, **kw) -> Dict[str, Any]:
+        mid = f"m-{next(self._ids)}"
+        with self._cond:
+            now = self._clock()
+            self._queue(QueueUrl)[mid] = {
+                "MessageId": mid, "Body": MessageBody, "visible_at": now + DelaySeconds, "sent_at": now,
+                "receipt": None, "receive_count": 0, "attrs": kw,
+            }
+            self._cond.notify_all()
+        return {"MessageId": mid}
+
+    def send_message_batch(self, QueueUrl: str, Entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        ok = []
+        for e in Entries:
+            e = dict(e)
+            entry_id = e.pop("Id")
+            ok.append({"Id": entry_id, **self.send_message(QueueUrl=QueueUrl, **e)})
+        return {"Successful": ok, "Failed": []}
+
+    def _visible(self, url: str, limit: int) -> List[Dict[str, Any]]:
+        now = self._clock()
+        return [m for m in self._queue(url).values() if m["visible_at"] <= now][:limit]
+
+    def receive_message(self, QueueUrl: str, MaxNumberOfMessages: int = 1, WaitTimeSeconds: int = 0,
+                        VisibilityTimeout: int | None = None, **kw) -> Dict[str, Any]:
+        deadline = time.monotonic() + WaitTimeSeconds
+        vis = self._default_visibility if VisibilityTimeout is None else VisibilityTimeout
+        with self._cond:
+            msgs = self._visible(QueueUrl, MaxNumberOfMessages)
+            while not msgs and time.monotonic() < deadline:
+                self._cond.wait(timeout=min(0.1, max(0.0, deadline - time.monotonic())))
+                msgs = self._visible(QueueUrl, MaxNumberOfMessages)
+            out = []
+            for m in msgs:
+                m["receive_count"] += 1
+                m["receipt"] = f"{m['MessageId']}#{m['receive_count']}"
+                m["visible_at"] = self._clock() + vis
+                out.append({
+                    "MessageId": m["MessageId"], "ReceiptHandle": m["receipt"], "Body": m["Body"],
+                    "Attributes": {"SentTimestamp": str(int(m["sent_at"] * 1000))},
+                })
+        return {"Messages": out} if out else {}
+
+    def _by_receipt(self, url: str, receipt: str) -> Dict[str, Any]:
+        for m in self._queue(url).values():
+            if m["receipt"] == receipt:
+                return m
+        raise KeyError(f"ReceiptHandleIsInvalid: {receipt}")
+
+    def delete_message(self, QueueUrl: str, ReceiptHandle: str) -> Dict[str, Any]:
+        with self._cond:
+            m = self._by_receipt(QueueUrl, ReceiptHandle)
+            del self._queue(QueueUrl)[m["MessageId"]]
+            self.deleted.append(m["MessageId"])
+        return {}
+
+    def change_message_visibility(self, QueueUrl: str, ReceiptHandle: str, VisibilityTimeout: int) -> Dict[str, Any]:
+        with self._cond:
+            m = self._by_receipt(QueueUrl, ReceiptHandle)
+            m["visible_at"] = self._clock() + VisibilityTimeout
+            self._cond.notify_all()
+        return {}
+
+    def pending(self, QueueUrl: str) -> int:
+        with self._cond:
+            return len(self._queue(QueueUrl))
+
+
+class _AwsError(Exception):
+    """Shaped like botocore's ClientError: the code is under response["Error"]["Code"]."""
+
+    def __init__(self, code: str, message: str = "", **extra: Any):
+        super().__init__(f"{code}: {message}" if message else code)
+        self.response = {"Error": {"Code": code, "Message": message}, **extra}
+
+
+class NoSuchKey(_AwsError):
+    pass
+
+
+class ConditionalCheckFailedException(_AwsError):
+    pass
+
+
+class TransactionCanceledException(_AwsError):
+    pass
+
+
+class LocalS3:
+    """In-memory stand-in for the S3 client calls the dispatcher and worker make."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._objects: Dict[Tuple[str, str], Tuple[bytes, Dict[str, Any]]] = {}
+        self.exceptions = SimpleNamespace(NoSuchKey=NoSuchKey)
+        self.calls: Dict[str, int] = {}
+
+    def _count(self, op: str) -> None:
+        with self._lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+
+    def put_object(self, Bucket: str, Key: str, Body: Any, **kw) -> Dict[str, Any]:
+        self._count("put_object")
+        data = Body.encode("utf-8") if isinstance(Body, str) else bytes(Body)
+        with self._lock:
+            self._objects[(Bucket, Key)] = (data, kw)
+        return {"ETag": f'"{len(data):x}"'}
+
+    def get_object(self, Bucket: str, Key: str, Range: Optional[str] = None, **kw) -> Dict[str, Any]:
+        self._count("get_object")
+        with self._lock:
+            hit = self._objects.get((Bucket, Key))
+        if hit is None:
+            raise NoSuchKey("NoSuchKey", f"s3://{Bucket}/{Key}")
+        data = hit[0]
+        if Range:
+            start, _, end = Range[len("bytes="):].partition("-")
+            data = data[int(start) : int(end) + 1 if end else None]
+        return {"Body": io.BytesIO(data), "ContentLength": len(data), "ContentType": hit[1].get("ContentType")}
+
+    def keys(self, bucket: str) -> List[str]:
+        with self._lock:
+            return sorted(k for b, k in self._objects if b == bucket)
+
+
+def _plain(attr: Dict[str, Any]) -> Any:
+    """Low-level DynamoDB attribute ({"S": ...}, {"N": ...}) to a plain value."""
+    (kind, v), = attr.items()
+    if kind == "N":
+        return Decimal(v)
+    if kind == "M":
+        return {k: _plain(x) for k, x in v.items()}
+    if kind == "L":
+        return [_plain(x) for x in v]
+    return v
+
+
+class LocalTable:
+    """One table of LocalDynamoDB; items are keyed by their `pk` attribute, as in every table here."""
+
+    def __init__(self, db: "LocalDynamoDB", name: str):
+        self._db = db
+        self.name = name
+        self.meta = SimpleNamespace(client=db)
+
+    def put_item(self, Item: Dict[str, Any], ConditionExpression: Optional[str] = None, **kw) -> Dict[str, Any]:
+        self._db._count("put_item")
+        with self._db._lock:
+            items = self._db._items(self.name)
+            if ConditionExpression == "attribute_not_exists(pk)" and Item["pk"] in items:
+                raise ConditionalCheckFailedException("ConditionalCheckFailedException")
+            items[Item["pk"]] = dict(Item)
+        return {}
+
+    def get_item(self, Key: Dict[str, Any], **kw) -> Dict[str, Any]:
+        self._db._count("get_item")
+        with self._db._lock:
+            item = self._db._items(self.name).get(Key["pk"])
+        return {"Item": dict(item)} if item is not None else {}
+
+    def delete_item(self, Key: Dict[str, Any], **kw) -> Dict[str, Any]:
+        self._db._count("delete_item")
+        with self._db._lock:
+            self._db._items(self.name).pop(Key["pk"], None)
+        return {}
+
+    def __len__(self) -> int:
+        with self._db._lock:
+            return len(self._db._items(self.name))
+
+
+class LocalDynamoDB:
+    """Stands in for both boto3's DynamoDB resource (`Table(name)`) and its client
+    (`transact_write_items` with conditional Puts, the `exceptions` namespace)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+        self.exceptions = SimpleNamespace(
+            ConditionalCheckFailedException=ConditionalCheckFailedException,
+            TransactionCanceledException=TransactionCanceledException,
+        )
+        self.meta = SimpleNamespace(client=self)
+        self.calls: Dict[str, int] = {}
+
+    def _count(self, op: str) -> None:
+        with self._lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+
+    def _items(self, table: str) -> Dict[Any, Dict[str, Any]]:
+        return self._tables.setdefault(table, {})
+
+    def Table(self, name: str) -> LocalTable:
+        return LocalTable(self, name)
+
+    def transact_write_items(self, TransactItems: List[Dict[str, Any]], **kw) -> Dict[str, Any]:
+        """All-or-nothing Puts; `attribute_not_exists(pk)` is the only condition understood."""
+        self._count("transact_write_items")
+        with self._lock:
+            puts = [(t["Put"]["TableName"], {k: _plain(v) for k, v in t["Put"]["Item"].items()},
+                     t["Put"].get("ConditionExpression")) for t in TransactItems]
+            reasons = [{"Code": "ConditionalCheckFailed"}
+                       if cond == "attribute_not_exists(pk)" and item["pk"] in self._items(table) else {"Code": "None"}
+                       for table, item, cond in puts]
+            if any(r["Code"] != "None" for r in reasons):
+                raise TransactionCanceledException("TransactionCanceledException", CancellationReasons=reasons)
+            for table, item, _ in puts:
+                self._items(table)[item["pk"]] = item
+        return {}
+
+
+class LocalSecrets:
+    """Secrets Manager stand-in: `get_secret_value` over a dict of id -> string."""
+
+    def __init__(self, values: Dict[str, str]):
+        self.values = dict(values)
+        self.calls = 0
+
+    def get_secret_value(self, SecretId: str, **kw) -> Dict[str, Any]:
+        self.calls += 1
+        if SecretId not in self.values:
+            raise _AwsError("ResourceNotFoundException", SecretId)
+        return {"SecretString": self.values[SecretId]}
+
+
+def _split_hunks(patch: str) -> List[str]:
+    hunks: List[str] = []
+    for line in patch.splitlines():
+        if line.startswith("@@") or not hunks:
+            hunks.append(line)
+        else:
+            hunks[-1] += "\n" + line
+    return hunks
+
+
+def _patch_since(old: str, new: str) -> str:
+    """The hunks of `new` that `old` does not have, i.e. what the commits in between added."""
+    seen = set(_split_hunks(old))
+    return "\n".join(h for h in _split_hunks(new) if h not in seen)
+
+
+class FakeGitHub:
+    """Local HTTP server for the slice of the GitHub REST API the services use:
+    PR, PR files, reviews (list and create), inline comments and compare.
+
+    Every request sleeps `latency_ms` (+ up to `jitter_ms`). With `rate_per_sec`
+    set, requests beyond a `burst`-sized bucket get GitHub's primary rate-limit
+    response (403, X-RateLimit-Remaining: 0, X-RateLimit-Reset). GET responses
+    carry ETags, and a matching If-None-Match gets a 304 that is not charged,
+    as on GitHub. Calls are counted per route; created reviews are kept with
+    their arrival time for latency accounting.
+    """
+
+    _ROUTES = [
+        ("pull", re.compile(r"^/repos/([^/]+)/([^/]+)/pulls/(\d+)$")),
+        ("files", re.compile(r"^/repos/([^/]+)/([^/]+)/pulls/(\d+)/files$")),
+        ("reviews", re.compile(r"^/repos/([^/]+)/([^/]+)/pulls/(\d+)/reviews$")),
+        ("comments", re.compile(r"^/repos/([^/]+)/([^/]+)/pulls/(\d+)/comments$")),
+        ("compare", re.compile(r"^/repos/([^/]+)/([^/]+)/compare/(.+)$")),
+    ]
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_per_sec: float = 0.0,
+                 burst: int = 0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_per_sec = rate_per_sec
+        self.burst = max(1, burst or int(rate_per_sec) or 1)
+        self._rand = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self._ids = itertools.count(1)
+        self._prs: Dict[Tuple[str, str, int], Dict[str, Any]] = {}
+        self._history: Dict[Tuple[str, str], List[Tuple[str, Dict[str, Any]]]] = {}
+        self.reviews: List[Dict[str, Any]] = []
+        self.comments: List[Dict[str, Any]] = []
+        self.calls: Dict[str, int] = {}
+        self.rate_limited = 0
+        self.not_modified = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    # -- state ---------------------------------------------------------------
+
+    def set_pr(self, owner: str, repo: str, number: int, head_sha: str, files: List[Dict[str, Any]],
+               base_sha: str = "0" * 40, state: str = "open") -> None:
+        """Create or update (push to) a PR; `files` are GitHub file entries (filename, patch, sha)."""
+        with self._lock:
+            self._history.setdefault((owner, repo), []).append((head_sha, {f["filename"]: f for f in files}))
+            self._prs[(owner, repo, int(number))] = {
+                "number": int(number), "state": state, "draft": False,
+                "head": {"sha": head_sha, "ref": f"pr-{number}"}, "base": {"sha": base_sha, "ref": "main"},
+                "files": list(files),
+            }
+
+    def reviews_for(self, owner: str, repo: str, number: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [r for r in self.reviews if (r["owner"], r["repo"], r["pr"]) == (owner, repo, int(number))]
+
+    def commented_lines(self, owner: str, repo: str, number: int) -> Set[Tuple[str, int]]:
+        """(path, line) of every inline comment on the PR, from reviews and single comments."""
+        lines = {tuple(x) for r in self.reviews_for(owner, repo, number) for x in r["lines"]}
+        with self._lock:
+            lines.update((c.get("path"), c.get("line")) for c in self.comments
+                         if (c["owner"], c["repo"], c["pr"]) == (owner, repo, int(number)))
+        return lines
+
+    def pr_files(self, owner: str, repo: str, number: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._prs[(owner, repo, int(number))]["files"])
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"calls": dict(sorted(self.calls.items())), "total": sum(self.calls.values()),
+                    "rate_limited": self.rate_limited, "not_modified": self.not_modified,
+                    "reviews": len(self.reviews), "inline_comments": len(self.comments)}
+
+    # -- server --------------------------------------------------------------
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        gh = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *a: Any) -> None:
+                pass
+
+            def _handle(self) -> None:
+                n = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(n) if n else b""
+                status, headers, payload = gh.handle(self.command, self.path, dict(self.headers), body)
+                data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-github", daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _take_token(self) -> bool:
+        if self.rate_per_sec <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate_per_sec)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            self.rate_limited += 1
+            return False
+
+    def handle(self, method: str, raw_path: str, headers: Dict[str, str], body: bytes
+               ) -> Tuple[int, Dict[str, str], Any]:
+        """One request: (status, headers, JSON payload or None)."""
+        if self.latency_ms or self.jitter_ms:
+            with self._lock:
+                jitter = self._rand.uniform(0, self.jitter_ms)
+            time.sleep((self.latency_ms + jitter) / 1000)
+        url = urlsplit(raw_path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        route, m = next(((name, rx.match(url.path)) for name, rx in self._ROUTES if rx.match(url.path)),
+                        ("unknown", None))
+        with self._lock:
+            key = f"{method} {route}"
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+        if method != "GET" and not self._take_token():
+            return self._limited()
+        status, extra, payload = self._dispatch(method, route, m, query, body)
+        if method == "GET" and status == 200:
+            etag = '"%s"' % hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+            if headers.get("If-None-Match") == etag:
+                with self._lock:
+                    self.not_modified += 1
+                return 304, {"ETag": etag}, None
+            extra["ETag"] = etag
+        # GETs are charged after the ETag check, writes before they take effect.
+        if method == "GET" and not self._take_token():
+            return self._limited()
+        return status, extra, payload
+
+    @staticmethod
+    def _limited() -> Tuple[int, Dict[str, str], Any]:
+        reset = str(int(time.time()) + 1)
+        return 403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset}, {"message": "API rate limit exceeded"}
+
+    def _page(self, items: List[Any], base: str, query: Dict[str, str]) -> Tuple[Dict[str, str], List[Any]]:
+        per_page = max(1, int(query.get("per_page", 30)))
+        page = max(1, int(query.get("page", 1)))
+        last = max(1, (len(items) + per_page - 1) // per_page)
+        links = []
+        if page < last:
+            links.append(f'<{base}?per_page={per_page}&page={page + 1}>; rel="next"')
+            links.append(f'<{base}?per_page={per_page}&page={last}>; rel="last"')
+        return ({"Link": ", ".join(links)} if links else {}), items[(page - 1) * per_page : page * per_page]
+
+    def _dispatch(self, method: str, route: str, m: Any, query: Dict[str, str], body: bytes
+                  ) -> Tuple[int, Dict[str, str], Any]:
+        if m is None:
+            return 404, {}, {"message": "Not Found"}
+        if route == "compare":
+            return self._compare(m.group(1), m.group(2), m.group(3))
+        owner, repo, number = m.group(1), m.group(2), int(m.group(3))
+        base = f"{self.base_url}/repos/{owner}/{repo}/pulls/{number}/{route}"
+        with self._lock:
+            pr = self._prs.get((owner, repo, number))
+        if pr is None:
+            return 404, {}, {"message": "Not Found"}
+        if route == "pull" and method == "GET":
+            return 200, {}, {k: v for k, v in pr.items() if k != "files"}
+        if route == "files" and method == "GET":
+            link, page = self._page(pr["files"], base, query)
+            return 200, link, page
+        if route == "reviews" and method == "GET":
+            link, page = self._page(
+                [{"id": r["id"], "body": r["body"], "commit_id": r["commit_id"]}
+                 for r in self.reviews_for(owner, repo, number)], base, query)
+            return 200, link, page
+        if route == "reviews" and method == "POST":
+            data = json.loads(body or b"{}")
+            review = {"id": next(self._ids), "owner": owner, "repo": repo, "pr": number, "t": time.time(),
+                      "commit_id": data.get("commit_id") or pr["head"]["sha"], "body": data.get("body") or "",
+                      "comments": len(data.get("comments") or []),
+                      "lines": [(c.get("path"), c.get("line")) for c in data.get("comments") or []]}
+            with self._lock:
+                self.reviews.append(review)
+            return 200, {}, {"id": review["id"], "body": review["body"]}
+        if route == "comments" and method == "POST":
+            data = json.loads(body or b"{}")
+            with self._lock:
+                self.comments.append({"owner": owner, "repo": repo, "pr": number, "t": time.time(), **data})
+            return 201, {}, {"id": next(self._ids)}
+        return 405, {}, {"message": "Method Not Allowed"}
+
+    def _compare(self, owner: str, repo: str, spec: str) -> Tuple[int, Dict[str, str], Any]:
+        """base...head over the pushes seen by set_pr: files whose blob changed in between,
+        each with a patch of only the hunks that are not in its patch at base."""
+        base, _, head = spec.partition("...")
+        with self._lock:
+            states = {sha: (i, files) for i, (sha, files) in enumerate(self._history.get((owner, repo), []))}
+        if base not in states or head not in states:
+            return 404, {}, {"message": "Not Found"}
+        (bi, old), (hi, new) = states[base], states[head]
+        changed = []
+        for name, f in new.items():
+            before = old.get(name) or {}
+            if before.get("sha") != f.get("sha"):
+                changed.append({**f, "patch": _patch_since(before.get("patch") or "", f.get("patch") or "")})
+        return 200, {}, {"status": "ahead" if hi > bi else "identical" if hi == bi else "behind",
+                         "files": changed}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self._server.server_address[0]}:{self._server.server_address[1]}" if self._server else ""
@@ -0,0 +1,245 @@
+"""Pooled, retrying GitHub REST client shared by the worker and the dispatcher.
+
+Standalone on purpose (stdlib + requests only): the dispatcher image copies
+this file next to its handler, so it must not import anything from `worker`.
+"""
+from __future__ import annotations
+
+import bisect
+import hashlib
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger("gh-client")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_IDEMPOTENT = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+class TokenBucket:
+    """Client-side request budget for one installation/token.
+
+    Refills at `rate` requests/sec up to `burst`; `block_until` lets the
+    server's own rate-limit headers pause the bucket until the reset time.
+    """
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float], sleep: Callable[[float], None]):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def block_until(self, ts: float) -> None:
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, ts)
+
+    def acquire(self) -> float:
+        """Take one token, sleeping as needed; returns seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                if self.rate > 0:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                delay = max(0.0, self._blocked_until - now)
+                if not delay:
+                    if self.rate <= 0 or self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    delay = (1 - self._tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[Tuple[str, int], int] = {}
+        self.retries = 0
+        self.not_modified = 0
+        self.throttled_sec = 0.0
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+
+    def observe(self, method: str, status: int, seconds: float) -> None:
+        with self._lock:
+            self.requests[(method, status)] = self.requests.get((method, status), 0) + 1
+            self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.latency_sum += seconds
+
+    def add(self, field: str, value: float = 1) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.latency_counts)
+            return {
+                "requests": {f"{m} {s}": n for (m, s), n in sorted(self.requests.items())},
+                "total": total,
+                "retries": self.retries,
+                "not_modified": self.not_modified,
+                "throttled_sec": round(self.throttled_sec, 3),
+                "latency_buckets": {
+                    **{f"le_{b}": c for b, c in zip(LATENCY_BUCKETS, self.latency_counts)},
+                    "le_inf": self.latency_counts[-1],
+                },
+                "latency_avg": round(self.latency_sum / total, 4) if total else 0.0,
+            }
+
+
+class GitHubClient:
+    def __init__(
+        self,
+        user_agent: str,
+        timeout: float,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 30.0,
+        rate_per_sec: float = 10.0,
+        burst: int = 20,
+        pool_size: int = 16,
+        etag_cache_size: int = 256,
+        session: Optional[requests.Session] = None,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self.session = session or requests.Session()
+        if session is None:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+        self._etag_size = etag_cache_size
+        self._etags: "OrderedDict[str, Tuple[str, requests.Response]]" = OrderedDict()
+        self._etags_lock = threading.Lock()
+        self.metrics = Metrics()
+
+    @staticmethod
+    def _budget_key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+    def _bucket(self, token: str) -> TokenBucket:
+        key = self._budget_key(token)
+        with self._buckets_lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = TokenBucket(self.rate_per_sec, self.burst, self._clock, self._sleep)
+            return b
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _rate_limit_wait(self, resp: requests.Response) -> Optional[float]:
+        """Seconds to wait if `resp` is a primary/secondary rate-limit response, else None."""
+        if resp.status_code not in (403, 429):
+            return None
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after and retry_after.strip().isdigit():
+            return float(retry_after)
+        if resp.headers.get("X-RateLimit-Remaining") == "0":
+            reset = resp.headers.get("X-RateLimit-Reset", "")
+            return max(0.0, float(reset) - self._clock()) if reset.isdigit() else 60.0
+        if resp.status_code == 429 or "rate limit" in (resp.text or "").lower():
+            return 60.0
+        return None
+
+    def _observe_limits(self, bucket: TokenBucket, resp: requests.Response) -> None:
+        if resp.headers.get("X-RateLimit-Remaining") == "0":
+            reset = resp.headers.get("X-RateLimit-Reset", "")
+            if reset.isdigit() and float(reset) - self._clock() <= self.backoff_cap * 4:
+                bucket.block_until(float(reset))
+
+    def _etag_key(self, url: str, token: str, params: Any) -> str:
+        return f"{self._budget_key(token)} {url} {params!r}"
+
+    def _etag_get(self, key: str) -> Optional[Tuple[str, requests.Response]]:
+        with self._etags_lock:
+            hit = self._etags.get(key)
+            if hit is not None:
+                self._etags.move_to_end(key)
+            return hit
+
+    def _etag_put(self, key: str, resp: requests.Response) -> None:
+        etag = resp.headers.get("ETag")
+        if not etag:
+            return
+        with self._etags_lock:
+            self._etags[key] = (etag, resp)
+            self._etags.move_to_end(key)
+            while len(self._etags) > self._etag_size:
+                self._etags.popitem(last=False)
+
+    def request(self, method: str, url: str, token: str, **kw) -> requests.Response:
+        method = method.upper()
+        headers = dict(kw.pop("headers", None) or {})
+        headers.setdefault("Accept", "application/vnd.github+json")
+        headers.setdefault("Authorization", f"Bearer {token}")
+        headers.setdefault("User-Agent", self.user_agent)
+        timeout = kw.pop("timeout", self.timeout)
+
+        etag_key = self._etag_key(url, token, kw.get("params")) if method == "GET" and self._etag_size else None
+        cached = self._etag_get(etag_key) if etag_key else None
+        if cached:
+            headers.setdefault("If-None-Match", cached[0])
+
+        bucket = self._bucket(token)
+        attempt = 0
+        while True:
+            waited = bucket.acquire()
+            if waited:
+                self.metrics.add("throttled_sec", waited)
+            t0 = time.perf_counter()
+            try:
+                resp = self.session.request(method, url, headers=headers, timeout=timeout, **kw)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.observe(method, 0, time.perf_counter() - t0)
+                if method not in _IDEMPOTENT or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                log.warning("%s %s failed (%s); retry %d in %.1fs", method, url, e, attempt + 1, delay)
+            else:
+                self.metrics.observe(method, resp.status_code, time.perf_counter() - t0)
+                self._observe_limits(bucket, resp)
+
+                if resp.status_code == 304 and cached:
+                    self.metrics.add("not_modified")
+                    return cached[1]
+
+                delay = self._rate_limit_wait(resp)
+                retryable = delay is not None or (resp.status_code >= 500 and method in _IDEMPOTENT)
+                if not retryable or attempt >= self.max_retries or (delay or 0) > self.backoff_cap * 4:
+                    resp.raise_for_status()
+                    if etag_key:
+                        self._etag_put(etag_key, resp)
+                    return resp
+                if delay is None:
+                    delay = self._backoff(attempt)
+                else:
+                    delay += random.uniform(0, self.backoff_base)
+                log.warning("%s %s -> %d; retry %d in %.1fs", method, url, resp.status_code, attempt + 1, delay)
+            attempt += 1
+            self.metrics.add("retries")
+            self._sleep(delay)
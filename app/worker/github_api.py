@@ -8,6 +8,7 @@ import jwt
 import requests
 
 from .logutil import setup_logger
+from .gh_client import GitHubClient
 from .aws_utils import get_secret_value_by_arn
 from .config import (
     MARKER_PREFIX,
@@ -17,12 +18,20 @@ from .config import (
     GITHUB_TOKEN_SECRET_ARN,            
     GITHUB_APP_PRIVATE_KEY_SECRET_ARN,   
     GITHUB_APP_INSTALLATION_ID_ARN,
-    GITHUB_APP_ID_ARN 
+    GITHUB_APP_ID_ARN,
+    GITHUB_MAX_RETRIES,
+    GITHUB_RATE_PER_SEC,
+    GITHUB_BURST,
 )
 from .config import utc_ts
 
 log = setup_logger("github")
 
+client = GitHubClient(
+    USER_AGENT, HTTP_TIMEOUT_SEC,
+    max_retries=GITHUB_MAX_RETRIES, rate_per_sec=GITHUB_RATE_PER_SEC, burst=GITHUB_BURST,
+)
+
 def _resolve_numeric_id_from_arn_env(arn: str) -> str:
     raw = (get_secret_value_by_arn(arn) or "").strip()
 
@@ -54,14 +63,7 @@ def _build_app_jwt(app_id_num: str, private_key_pem: str) -> str:
 
 def _fetch_installation_token(app_jwt: str, installation_id_num: str) -> Dict[str, Any]:
     url = f"{GITHUB_API_BASE}/app/installations/{installation_id_num}/access_tokens"
-    headers = {
-        "Accept": "application/vnd.github+json",
-        "Authorization": f"Bearer {app_jwt}",
-        "User-Agent": USER_AGENT,
-    }
-    resp = requests.post(url, headers=headers, timeout=HTTP_TIMEOUT_SEC)
-    resp.raise_for_status()
-    return resp.json()
+    return client.request("POST", url, app_jwt).json()
 
 
 _app_token_ctx: Dict[str, Any] = {"token": None, "exp_ts": 0}
@@ -102,13 +104,10 @@ def get_token() -> str:
     raise RuntimeError("Missing credentials: set ARNs for App (ID, INSTALLATION_ID, PRIVATE_KEY) or PAT.")
 
 def gh_request(method: str, url: str, token: str, **kw) -> requests.Response:
-    headers = kw.pop("headers", {})
-    headers.setdefault("Accept", "application/vnd.github+json")
-    headers.setdefault("Authorization", f"Bearer {token}")
-    headers.setdefault("User-Agent", USER_AGENT)
-    resp = requests.request(method, url, headers=headers, timeout=HTTP_TIMEOUT_SEC, **kw)
-    resp.raise_for_status()
-    return resp
+    return client.request(method, url, token, **kw)
+
+def gh_metrics() -> Dict[str, Any]:
+    return client.metrics.snapshot()
 
 
 def make_marker(delivery_id: str | None, head_sha: str | None) -> str:
@@ -0,0 +1,40 @@
+"""Container health check that stays cheap: it looks for the ML packages and
+model files on disk but never imports torch/transformers/peft.
+
+    python -m worker.health
+"""
+from __future__ import annotations
+
+import importlib.util
+import os
+import sys
+from typing import List
+
+from .config import LLM_DISABLED, MODEL_DIR, MODEL_OFFLINE, PREBAKED_MODEL_DIR
+
+ML_PACKAGES = ("torch", "transformers", "peft", "huggingface_hub")
+
+
+def check() -> List[str]:
+    problems: List[str] = []
+    if LLM_DISABLED:
+        return problems
+    for pkg in ML_PACKAGES:
+        if importlib.util.find_spec(pkg) is None:
+            problems.append(f"package {pkg} not installed")
+    if MODEL_OFFLINE and not any(
+        os.path.isfile(os.path.join(d, "config.json")) for d in (PREBAKED_MODEL_DIR, MODEL_DIR)
+    ):
+        problems.append(f"offline, but no model in {PREBAKED_MODEL_DIR} or {MODEL_DIR}")
+    return problems
+
+
+def main() -> int:
+    problems = check()
+    for p in problems:
+        print(f"unhealthy: {p}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
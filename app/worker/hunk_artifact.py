@@ -0,0 +1,145 @@
+"""Versioned, compressed hunk artifact passed from the dispatcher to the worker.
+
+Layout (v1):
+
+    b"HNKA" | u8 version | u32 header length | gzip(header JSON) | block 0 | block 1 | ...
+
+The header carries owner/repo/pr_number/head_sha, the block table
+`[[offset, length], ...]` (offsets relative to the first block) and a per-hunk
+index `[[block, start, length], ...]` into the decompressed block. Each block
+is an independent gzip member holding newline-separated hunk JSON, so a reader
+can fetch one block with a range request, and `zcat` over the block region
+yields plain NDJSON.
+
+Standalone (stdlib only) so the dispatcher image can copy it, like gh_client.
+Artifacts written before v1 (`{"hunks": [...]}` JSON) are still readable.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import struct
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+MAGIC = b"HNKA"
+VERSION = 1
+CONTENT_TYPE = "application/vnd.hunk-artifact"
+DEFAULT_BLOCK_BYTES = 64 * 1024
+_PREFIX = struct.Struct(">4sBI")
+
+RangeReader = Callable[[int, int], bytes]
+
+
+class ArtifactError(ValueError):
+    pass
+
+
+def encode(
+    hunks: Sequence[Dict[str, Any]],
+    meta: Optional[Dict[str, Any]] = None,
+    block_bytes: int = DEFAULT_BLOCK_BYTES,
+    level: int = 6,
+) -> bytes:
+    """Serialize `hunks` with header fields from `meta` (owner, repo, pr_number, head_sha, ...)."""
+    blocks: List[bytes] = []
+    table: List[List[int]] = []
+    index: List[List[int]] = []
+    buf = bytearray()
+    offset = 0
+
+    def flush() -> None:
+        nonlocal offset
+        if buf:
+            z = gzip.compress(bytes(buf), compresslevel=level, mtime=0)
+            blocks.append(z)
+            table.append([offset, len(z)])
+            offset += len(z)
+            buf.clear()
+
+    for h in hunks:
+        line = json.dumps(h, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        if buf and len(buf) + len(line) > block_bytes:
+            flush()
+        index.append([len(blocks), len(buf), len(line) - 1])
+        buf += line
+    flush()
+
+    header = dict(meta or {})
+    header.update(v=VERSION, codec="gzip", count=len(index), blocks=table, hunks=index)
+    head = gzip.compress(json.dumps(header, separators=(",", ":")).encode("utf-8"), mtime=0)
+    return b"".join([_PREFIX.pack(MAGIC, VERSION, len(head)), head, *blocks])
+
+
+def is_artifact(prefix: bytes) -> bool:
+    return prefix[:4] == MAGIC
+
+
+class ArtifactReader:
+    """Random access over an artifact through `read(offset, length)`, e.g. S3 range GETs.
+
+    Only the header is read up front; blocks are fetched on demand and the last
+    one is kept, so walking hunks in order costs one read per block.
+    """
+
+    def __init__(self, read: RangeReader, prefetch: int = 64 * 1024):
+        first = read(0, prefetch)
+        if len(first) < _PREFIX.size or not is_artifact(first):
+            raise ArtifactError("not a hunk artifact")
+        _, version, head_len = _PREFIX.unpack_from(first)
+        if version > VERSION:
+            raise ArtifactError(f"unsupported artifact version {version}")
+        end = _PREFIX.size + head_len
+        raw = first[_PREFIX.size:end]
+        if len(raw) < head_len:
+            raw += read(len(first), end - len(first))
+        self.header: Dict[str, Any] = json.loads(gzip.decompress(raw))
+        self._read = read
+        self._data_start = end
+        # Blocks that came along with the header read need no second request.
+        self._tail = first[end:]
+        self._block: Tuple[int, bytes] = (-1, b"")
+        self.reads = 1 + (len(first) < end)
+
+    def __len__(self) -> int:
+        return int(self.header.get("count", 0))
+
+    def _block_bytes(self, b: int) -> bytes:
+        if self._block[0] != b:
+            off, length = self.header["blocks"][b]
+            if off + length <= len(self._tail):
+                z = self._tail[off:off + length]
+            else:
+                z = self._read(self._data_start + off, length)
+                self.reads += 1
+            self._block = (b, gzip.decompress(z))
+        return self._block[1]
+
+    def get(self, i: int) -> Dict[str, Any]:
+        b, start, length = self.header["hunks"][i]
+        return json.loads(self._block_bytes(b)[start:start + length])
+
+    def iter(self, indices: Optional[Iterable[int]] = None) -> Iterator[Dict[str, Any]]:
+        if indices is not None:
+            for i in indices:
+                yield self.get(i)
+            return
+        # Whole-artifact walk: one json.loads per block rather than per hunk.
+        for b in range(len(self.header["blocks"])):
+            yield from json.loads(b"[" + b",".join(self._block_bytes(b).rstrip(b"\n").split(b"\n")) + b"]")
+
+
+def bytes_reader(data: bytes) -> RangeReader:
+    return lambda offset, length: data[offset:offset + length]
+
+
+def decode(data: bytes) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """(header, hunks) from a v1 artifact or a legacy `{"hunks": [...]}` JSON body."""
+    if not is_artifact(data):
+        legacy = json.loads(data)
+        hunks = (legacy.get("hunks") or []) if isinstance(legacy, dict) else legacy
+        if not isinstance(hunks, list):
+            raise ArtifactError("Invalid artifact format: 'hunks' not a list")
+        header = {k: v for k, v in legacy.items() if k != "hunks"} if isinstance(legacy, dict) else {}
+        return {**header, "v": 0, "count": len(hunks)}, hunks
+    r = ArtifactReader(bytes_reader(data), prefetch=len(data))
+    return r.header, list(r.iter())
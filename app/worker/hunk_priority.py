@@ -0,0 +1,151 @@
+"""Rank diff hunks by cheap signals and pick the ones worth a model call.
+
+Standalone (stdlib + numpy) so the dispatcher image can copy it next to its
+handler, the same way it does with gh_client.
+"""
+from __future__ import annotations
+
+import math
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Hunks = Sequence[Dict[str, Any]]
+Signal = Callable[[Hunks], np.ndarray]
+
+CHARS_PER_TOKEN = 3.5
+PROMPT_OVERHEAD_TOKENS = 40
+
+LANGUAGE_WEIGHTS = {
+    ".py": 1.0, ".pyi": 0.8,
+    ".js": 0.8, ".jsx": 0.8, ".ts": 0.8, ".tsx": 0.8, ".go": 0.8, ".java": 0.8, ".rb": 0.8,
+    ".c": 0.7, ".cc": 0.7, ".cpp": 0.7, ".h": 0.6, ".rs": 0.7, ".sh": 0.6, ".sql": 0.6,
+    ".tf": 0.5, ".yml": 0.3, ".yaml": 0.3, ".toml": 0.3, ".cfg": 0.3, ".ini": 0.3, ".json": 0.2,
+    ".md": 0.1, ".rst": 0.1, ".txt": 0.1, ".lock": 0.0, ".svg": 0.0,
+}
+DEFAULT_LANGUAGE_WEIGHT = 0.4
+
+RISK_TOKENS = (
+    "eval(", "exec(", "pickle.load", "yaml.load", "subprocess", "os.system", "shell=true",
+    "password", "passwd", "secret", "api_key", "token", "verify=false", "md5", "sha1",
+    "except:", "except exception", "todo", "fixme", "%s", ".format(",
+)
+_RISK_RES = [re.compile(re.escape(t)) for t in RISK_TOKENS]
+_TEST_PATH_RE = re.compile(r"(^|/)(tests?|spec|__tests__)/|(^|/)test_[^/]*$|_test\.\w+$|\.spec\.\w+$", re.I)
+
+
+def _patch(h: Dict[str, Any]) -> str:
+    return h.get("patch_hunk") or ""
+
+
+def added_lines(hunks: Hunks) -> np.ndarray:
+    n = np.fromiter((_patch(h).count("\n+") for h in hunks), dtype=np.float32, count=len(hunks))
+    return np.minimum(np.log1p(n) / math.log1p(50), 1.0)
+
+
+def _per_path(hunks: Hunks, fn: Callable[[str], float]) -> np.ndarray:
+    """Evaluate a path-only feature once per distinct file, not once per hunk."""
+    memo: Dict[str, float] = {}
+    out = np.empty(len(hunks), dtype=np.float32)
+    for i, h in enumerate(hunks):
+        path = h.get("file_path") or ""
+        v = memo.get(path)
+        if v is None:
+            v = memo[path] = fn(path)
+        out[i] = v
+    return out
+
+
+def _language_weight(path: str) -> float:
+    base = path.rpartition("/")[2]
+    ext = base[base.rfind("."):].lower() if "." in base else ""
+    return LANGUAGE_WEIGHTS.get(ext, DEFAULT_LANGUAGE_WEIGHT)
+
+
+def language(hunks: Hunks) -> np.ndarray:
+    return _per_path(hunks, _language_weight)
+
+
+def risk_patterns(hunks: Hunks) -> np.ndarray:
+    # One pass per literal over the concatenated, lower-cased patches, then
+    # match offsets are mapped back to hunks; far cheaper than a regex per hunk.
+    patches = [_patch(h) for h in hunks]
+    ends = np.cumsum(np.fromiter((len(p) + 1 for p in patches), dtype=np.int64, count=len(patches)))
+    text = "\n".join(patches).lower()
+    starts = [m.start() for rx in _RISK_RES for m in rx.finditer(text)]
+    n = np.bincount(np.searchsorted(ends, starts, side="right"), minlength=len(hunks))[: len(hunks)]
+    return np.minimum(n.astype(np.float32), 3.0) / 3.0
+
+
+def non_test_path(hunks: Hunks) -> np.ndarray:
+    return _per_path(hunks, lambda p: 0.0 if _TEST_PATH_RE.search(p) else 1.0)
+
+
+DEFAULT_SIGNALS: Dict[str, Tuple[float, Signal]] = {
+    "added_lines": (1.0, added_lines),
+    "language": (1.0, language),
+    "risk_patterns": (1.5, risk_patterns),
+    "non_test_path": (0.5, non_test_path),
+}
+
+
+def estimate_tokens(hunks: Hunks) -> np.ndarray:
+    chars = np.fromiter((len(_patch(h)) for h in hunks), dtype=np.float32, count=len(hunks))
+    return np.ceil(chars / CHARS_PER_TOKEN) + PROMPT_OVERHEAD_TOKENS
+
+
+class HunkRanker:
+    """Weighted sum of vectorized signals; each signal maps N hunks to N scores in [0, 1]."""
+
+    def __init__(self, signals: Optional[Dict[str, Tuple[float, Signal]]] = None):
+        self.signals: Dict[str, Tuple[float, Signal]] = dict(DEFAULT_SIGNALS if signals is None else signals)
+
+    def register(self, name: str, weight: float, fn: Signal) -> None:
+        self.signals[name] = (weight, fn)
+
+    def score(self, hunks: Hunks) -> np.ndarray:
+        total = np.zeros(len(hunks), dtype=np.float32)
+        for weight, fn in self.signals.values():
+            if weight:
+                total += weight * fn(hunks)
+        return total
+
+    def select(
+        self,
+        hunks: Hunks,
+        max_hunks: int = 0,
+        token_budget: int = 0,
+        per_file_cap: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """Pick the best-scoring hunks under the count, token and per-file limits.
+
+        Limits of 0 are disabled. Selected hunks keep their original order.
+        """
+        if not hunks:
+            return []
+        scores = self.score(hunks)
+        tokens = estimate_tokens(hunks).tolist()
+        order = np.argsort(-scores, kind="stable")
+        min_tokens = min(tokens)
+
+        picked: List[int] = []
+        per_file: Dict[str, int] = {}
+        spent = 0.0
+        for i in order.tolist():
+            if max_hunks and len(picked) >= max_hunks:
+                break
+            path = hunks[i].get("file_path") or ""
+            if per_file_cap and per_file.get(path, 0) >= per_file_cap:
+                continue
+            if token_budget and spent + tokens[i] > token_budget:
+                if spent + min_tokens > token_budget:
+                    break
+                continue
+            picked.append(i)
+            per_file[path] = per_file.get(path, 0) + 1
+            spent += tokens[i]
+        return [hunks[i] for i in sorted(picked)]
+
+
+default_ranker = HunkRanker()
@@ -0,0 +1,209 @@
+"""Data-parallel inference over forked worker processes.
+
+The parent loads the model once (with a single intra-op thread, so no OpenMP
+pool exists at fork time) and then forks INFER_PROCS workers. Workers share
+the weights copy-on-write: inference only reads them, so those pages are never
+copied and memory grows by activations and KV cache per worker, not by a full
+model. The parent still tokenizes and buckets prompts by length. Each
+micro-batch of token ids goes to whichever worker is free, and only ids and
+the sanitized strings cross the process boundary.
+
+INFER_PROCS=auto runs `calibrate` once: each processes x threads split of the
+available cores generates a small sample, and the fastest split wins. The
+result is cached in INFER_CALIBRATION_FILE per core count and model.
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .logutil import setup_logger
+from .config import (
+    GEN_BATCH_SIZE, INFER_PROCS, INFER_THREADS, INFER_CALIBRATION_FILE, INFER_CALIBRATION_HUNKS, MODEL_ID,
+)
+
+log = setup_logger("infer-pool")
+
+_CALIBRATION_SNIPPETS = [
+    "+    total = 0\n+    for item in items:\n+        total += item.price\n+    return total",
+    "+def load(path):\n+    with open(path) as f:\n+        return json.load(f)",
+    "+    if user is None:\n+        print('missing user')\n+        return None",
+]
+
+
+def available_cores() -> int:
+    """CPUs this process may use: the cgroup CPU quota (ECS/Fargate vCPUs) if
+    set, else the scheduler affinity mask, else os.cpu_count()."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cores = os.cpu_count() or 1
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            q, period = f.read().split()[:2]
+            if q != "max":
+                quota = int(q) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                q = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                if q > 0:
+                    quota = q / int(f.read())
+        except (OSError, ValueError):
+            pass
+    if quota:
+        cores = min(cores, max(1, int(quota + 0.5)))
+    return max(1, cores)
+
+
+def candidate_splits(cores: int) -> List[Tuple[int, int]]:
+    """(processes, threads) pairs that use exactly `cores`, processes ascending."""
+    return [(p, cores // p) for p in range(1, cores + 1) if cores % p == 0]
+
+
+def _init_worker(threads: int) -> None:
+    import torch
+
+    # Ctrl-C and SIGTERM are the parent's to handle; it closes the pool.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    torch.set_num_threads(max(1, threads))
+
+
+def _worker_generate(batch_ids: List[List[int]]) -> List[str]:
+    from . import model_io
+
+    tok, model = model_io._model_ctx["tokenizer"], model_io._model_ctx["model"]
+    return [model_io.sanitize(t) for t in model_io._generate_batch(tok, model, batch_ids)]
+
+
+class InferencePool:
+    """`procs` forked workers with `threads` intra-op threads each; the model
+    must already be loaded in this process."""
+
+    def __init__(self, procs: int, threads: int):
+        self.procs = max(1, procs)
+        self.threads = max(1, threads)
+        ctx = multiprocessing.get_context("fork")
+        self._pool = ctx.Pool(self.procs, initializer=_init_worker, initargs=(self.threads,))
+
+    def generate(self, batches: Sequence[List[List[int]]]) -> List[List[str]]:
+        """Sanitized suggestions per micro-batch, in order; batches run on free workers as they come."""
+        return self._pool.map(_worker_generate, list(batches), chunksize=1)
+
+    def close(self) -> None:
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self) -> None:
+        self._pool.terminate()
+        self._pool.join()
+
+
+def _calibration_ids(tok, n: int) -> List[List[int]]:
+    from .model_io import encode_prompts
+
+    hunks = [{"patch_hunk": f"@@ -{i},0 +{i},4 @@\n" + _CALIBRATION_SNIPPETS[i % len(_CALIBRATION_SNIPPETS)]}
+             for i in range(n)]
+    return encode_prompts(tok, hunks)
+
+
+def measure(procs: int, threads: int, ids: List[List[int]], batch: int = GEN_BATCH_SIZE) -> float:
+    """Prompts per second of one split on `ids` (pool start-up excluded)."""
+    batches = [ids[i : i + batch] for i in range(0, len(ids), batch)]
+    pool = InferencePool(procs, threads)
+    try:
+        pool.generate(batches[:procs])  # fork + first-call overhead out of the timing
+        t0 = time.perf_counter()
+        pool.generate(batches)
+        return len(ids) / (time.perf_counter() - t0)
+    finally:
+        pool.close()
+
+
+def calibrate(tok, cores: int, n_hunks: int = INFER_CALIBRATION_HUNKS) -> Dict[str, Any]:
+    ids = _calibration_ids(tok, max(n_hunks, GEN_BATCH_SIZE))
+    table = []
+    for procs, threads in candidate_splits(cores):
+        rate = measure(procs, threads, ids)
+        table.append({"procs": procs, "threads": threads, "hunks_per_s": round(rate, 3)})
+        log.info("Calibration %dx%d: %.2f hunks/s", procs, threads, rate)
+    best = max(table, key=lambda r: r["hunks_per_s"])
+    return {"cores": cores, "model": MODEL_ID, "procs": best["procs"], "threads": best["threads"], "table": table}
+
+
+def _cached_calibration(cores: int) -> Optional[Dict[str, Any]]:
+    try:
+        with open(INFER_CALIBRATION_FILE, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if data.get("cores") == cores and data.get("model") == MODEL_ID else None
+
+
+def _save_calibration(data: Dict[str, Any]) -> None:
+    try:
+        tmp = INFER_CALIBRATION_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, INFER_CALIBRATION_FILE)
+    except OSError as e:
+        log.warning("Could not cache calibration in %s: %s", INFER_CALIBRATION_FILE, e)
+
+
+def plan(tok=None) -> Tuple[int, int]:
+    """(processes, threads) to run with, from INFER_PROCS / INFER_THREADS or calibration."""
+    cores = available_cores()
+    if INFER_PROCS == "auto":
+        data = _cached_calibration(cores)
+        if data is None and tok is not None and cores > 1:
+            data = calibrate(tok, cores)
+            _save_calibration(data)
+        if data is not None:
+            return data["procs"], data["threads"]
+        return 1, INFER_THREADS or min(2, cores)
+    procs = max(1, int(INFER_PROCS or 1))
+    if procs == 1:
+        return 1, INFER_THREADS or min(2, cores)
+    return procs, INFER_THREADS or max(1, cores // procs)
+
+
+def pool_requested() -> bool:
+    return INFER_PROCS == "auto" or int(INFER_PROCS or 1) > 1
+
+
+_pool_lock = threading.Lock()
+_pool_ctx: Dict[str, Any] = {"pool": None, "built": False}
+
+
+def start(tok) -> Optional[InferencePool]:
+    """Fork the pool (once) for the loaded model; None means generate in-process."""
+    with _pool_lock:
+        if not _pool_ctx["built"]:
+            procs, threads = plan(tok)
+            if procs > 1:
+                _pool_ctx["pool"] = InferencePool(procs, threads)
+            else:
+                import torch
+                torch.set_num_threads(threads)
+            _pool_ctx["built"] = True
+            log.info("Inference: %d process(es) x %d thread(s) on %d core(s)", procs, threads, available_cores())
+        return _pool_ctx["pool"]
+
+
+def get_pool() -> Optional[InferencePool]:
+    return _pool_ctx["pool"]
+
+
+def shutdown() -> None:
+    with _pool_lock:
+        pool, _pool_ctx["pool"] = _pool_ctx["pool"], None
+    if pool is not None:
+        pool.close()
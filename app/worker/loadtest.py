@@ -0,0 +1,439 @@
+"""End-to-end load test: webhook -> dispatcher -> worker in one process.
+
+GitHub is a local `FakeGitHub` server with configurable latency and rate
+limit; SQS, S3, DynamoDB and Secrets Manager are the in-memory stand-ins from
+fakes.py. The services run unmodified: the webhook and dispatcher Lambda
+handlers are imported from their directories and get the fakes in place of
+their boto3 clients, and the worker runs as `ReviewService` threads. The
+model is a tiny random-weight CodeGen built on the fly (`--model heuristic`
+uses the heuristic reviewer instead), so the numbers measure the pipeline,
+not the model.
+
+    python -m worker.loadtest --profile steady --prs 20 --rate 2
+    python -m worker.loadtest --profile burst --prs 40 --gh-rate 20 --json
+    python -m worker.loadtest --profile pushes --prs 5 --pushes 3 --debounce 2
+
+Profiles:
+  steady  PRs opened at --rate per second
+  burst   all PRs opened at once
+  pushes  PRs opened at --rate, then each pushed to --pushes times,
+          --push-interval seconds apart (synchronize events)
+
+Each run reports end-to-end latency percentiles from webhook receipt to the
+first comment and to review done, throughput, webhook status codes, review
+outcomes, GitHub calls by route (including rate-limited and 304 responses)
+and per-stage span timings. Service settings not set here (GEN_BATCH_SIZE,
+PIPELINE_POSTING, ...) are taken from the environment; MAX_HUNKS defaults to
+room for every hunk of a PR.
+
+It also checks coverage: every hunk of every PR's final diff must have an
+inline comment once the queues drain, whatever got debounced, superseded or
+reviewed incrementally on the way. The exit status is 1 if a hunk was missed
+or the run timed out.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import hmac
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .fakes import FakeGitHub, LocalDynamoDB, LocalS3, LocalSecrets, LocalSQS
+
+EVENTS_URL = "https://sqs.local/000000000000/pr-events"
+REVIEW_URL = "https://sqs.local/000000000000/review-jobs"
+ARTIFACTS_BUCKET = "loadtest-artifacts"
+IDEMPOTENCY_TABLE = "loadtest-idempotency"
+REVIEW_TABLE = "loadtest-reviews"
+WEBHOOK_SECRET_ID = "loadtest-webhook-secret"
+WEBHOOK_SECRET = "loadtest"
+OWNER = "acme"
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_WORKER_DIR = os.path.join(_APP_DIR, "worker")
+
+
+def build_tiny_model(path: str, seed: int = 0) -> str:
+    """A 2-layer CodeGen with random weights and a small byte-level BPE
+    tokenizer, saved like a hub snapshot; generation cost is realistic in
+    shape, not in size."""
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import CodeGenConfig, CodeGenForCausalLM, PreTrainedTokenizerFast
+
+    from .bench import _SNIPPETS
+
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel()
+    bpe.decoder = decoders.ByteLevel()
+    bpe.train_from_iterator(
+        _SNIPPETS * 20 + ["You are a senior code reviewer. Suggestion: Code:"] * 20,
+        trainers.BpeTrainer(vocab_size=400, special_tokens=["<|endoftext|>"],
+                            initial_alphabet=pre_tokenizers.ByteLevel.alphabet()),
+    )
+    tok = PreTrainedTokenizerFast(tokenizer_object=bpe, eos_token="<|endoftext|>")
+    torch.manual_seed(seed)
+    cfg = CodeGenConfig(vocab_size=len(tok), n_embd=64, n_layer=2, n_head=4, n_positions=1024, rotary_dim=8,
+                        bos_token_id=0, eos_token_id=0)
+    CodeGenForCausalLM(cfg).save_pretrained(path)
+    tok.save_pretrained(path)
+    return path
+
+
+def _configure_env(gh_url: str, args: argparse.Namespace, model_dir: Optional[str]) -> None:
+    """Environment for the three services; must run before any of them is imported."""
+    os.environ.update({
+        "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+        "GITHUB_API_BASE": gh_url,
+        "GITHUB_TOKEN": "loadtest-token",
+        "WEBHOOK_SECRET_ARN": WEBHOOK_SECRET_ID,
+        "PR_EVENTS_SQS_URL": EVENTS_URL,
+        "EVENTS_QUEUE_URL": EVENTS_URL,
+        "TARGET_QUEUE_URL": REVIEW_URL,
+        "ARTIFACTS_BUCKET": ARTIFACTS_BUCKET,
+        "IDEMPOTENCY_TABLE": IDEMPOTENCY_TABLE,
+        "DEBOUNCE_SEC": str(args.debounce),
+        "TRACE": "false",
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # The hunk cap would leave hunks unreviewed by design, which the coverage check cannot tell apart.
+    os.environ.setdefault("MAX_HUNKS", str(args.files + args.pushes))
+    if model_dir is None:
+        os.environ["LLM_DISABLED"] = "true"
+    else:
+        os.environ.update({
+            "LLM_DISABLED": "false", "MODEL_ID": model_dir, "MODEL_DIR": model_dir, "MODEL_OFFLINE": "1",
+            "PREBAKED_MODEL_DIR": os.path.join(model_dir, "prebaked"),
+            "LORA_ADAPTER_DIR": os.path.join(model_dir, "no-adapter"), "ADAPTER_BUCKET": "",
+        })
+
+
+def _load_service(name: str, path: str) -> Any:
+    """Import a Lambda `handler.py` under its own module name (both are called `handler`)."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def _file(pr: int, idx: int, rev: int) -> Dict[str, Any]:
+    from .bench import _SNIPPETS
+
+    body = _SNIPPETS[(pr + idx + rev) % len(_SNIPPETS)]
+    lines = body.count("\n") + 1
+    start = 10 + 20 * rev
+    patch = f"@@ -{start},0 +{start},{lines} @@ def handler_{idx}():\n{body}"
+    return {"filename": f"src/svc_{pr}/mod_{idx}.py", "status": "modified", "additions": lines, "deletions": 0,
+            "sha": hashlib.sha1(f"{pr}/{idx}/{rev}".encode()).hexdigest(), "patch": patch}
+
+
+def _head(pr: int, rev: int) -> str:
+    return hashlib.sha1(f"head/{pr}/{rev}".encode()).hexdigest()
+
+
+def _delivery(pr: int, action: str, head: str, before: Optional[str]) -> bytes:
+    """A pull_request webhook body carrying the fields GitHub sends, with real-looking repo/user objects."""
+    from .bench import _gh_repo, _gh_user
+
+    repo = _gh_repo(OWNER, f"svc-{pr}", 1000 + pr)
+    evt: Dict[str, Any] = {
+        "action": action, "number": pr, "repository": repo, "sender": _gh_user("dev", 42),
+        "pull_request": {
+            "number": pr, "state": "open", "draft": False, "title": f"Change {pr}",
+            "user": _gh_user("dev", 42), "head": {"sha": head, "ref": f"pr-{pr}", "repo": repo},
+            "base": {"sha": "0" * 40, "ref": "main", "repo": repo},
+        },
+    }
+    if before:
+        evt.update(before=before, after=head)
+    return json.dumps(evt).encode()
+
+
+def schedule(profile: str, prs: int, rate: float, pushes: int, push_interval: float) -> List[Tuple[float, int, int]]:
+    """(seconds from start, PR number, revision) per delivery; revision 0 opens the PR."""
+    gap = 1.0 / rate if rate > 0 else 0.0
+    out: List[Tuple[float, int, int]] = []
+    for i in range(prs):
+        t = 0.0 if profile == "burst" else i * gap
+        out.append((t, i + 1, 0))
+        if profile == "pushes":
+            out.extend((t + k * push_interval, i + 1, k) for k in range(1, pushes + 1))
+    return sorted(out)
+
+
+def _pct(xs: List[float], q: float) -> Optional[float]:
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return round(xs[min(len(xs) - 1, int(len(xs) * q))], 3)
+
+
+class LoadTest:
+    """One run of a load profile against the wired-up services."""
+
+    def __init__(self, args: argparse.Namespace, gh: FakeGitHub):
+        self.args = args
+        self.gh = gh
+        self.sqs = LocalSQS(clock=time.time, default_visibility=60)
+        self.s3 = LocalS3()
+        self.ddb = LocalDynamoDB()
+        self.secrets = LocalSecrets({WEBHOOK_SECRET_ID: WEBHOOK_SECRET})
+        self.webhook_codes: Dict[int, int] = {}
+        self.dispatch_failures = 0
+        self._stop = threading.Event()
+
+        sys.path.insert(0, _WORKER_DIR)
+        self.webhook = _load_service("loadtest_webhook", os.path.join(_APP_DIR, "webhook", "handler.py"))
+        self.webhook._sm, self.webhook._sqs, self.webhook.TRACE = self.secrets, self.sqs, False
+
+        import coalesce
+        import tracing as dispatcher_tracing
+
+        self.dispatcher = _load_service("loadtest_dispatcher", os.path.join(_APP_DIR, "dispatcher", "handler.py"))
+        d = self.dispatcher
+        d.sqs, d.s3, d.sm = self.sqs, self.s3, self.secrets
+        d.ddb = self.ddb.Table(IDEMPOTENCY_TABLE)
+        d.ddb_client = self.ddb.meta.client
+        if d.coalescer is not None:
+            # DynamoLatestStore needs update_item expressions the local table does not implement.
+            d.coalescer = coalesce.Coalescer(coalesce.MemoryLatestStore(), d.DEBOUNCE_SEC)
+
+        from . import aws_utils, runner, tracing
+        from .review_store import DynamoReviewStore, LocalReviewStore, set_review_store
+
+        aws_utils._clients.update(s3=self.s3, sqs=self.sqs)
+        runner.get_token = lambda: "loadtest-token"
+        if args.review_store == "memory":
+            set_review_store(LocalReviewStore())
+        elif args.review_store == "dynamodb":
+            set_review_store(DynamoReviewStore(REVIEW_TABLE, 3600, resource=self.ddb))
+        else:
+            set_review_store(None)
+
+        self.exporter = tracing.MemoryExporter()
+        tracing.set_exporter(self.exporter)
+        dispatcher_tracing.set_exporter(self.exporter)
+        self.runner = runner
+
+    # -- services ------------------------------------------------------------
+
+    def _dispatch_loop(self) -> None:
+        """What the SQS -> Lambda event source mapping does for the dispatcher."""
+        while not self._stop.is_set():
+            msgs = self.sqs.receive_message(QueueUrl=EVENTS_URL, MaxNumberOfMessages=10, WaitTimeSeconds=1,
+                                            VisibilityTimeout=60).get("Messages") or []
+            if not msgs:
+                continue
+            event = {"Records": [{"messageId": m["MessageId"], "body": m["Body"], "attributes": m["Attributes"]}
+                                 for m in msgs]}
+            try:
+                failed = {f["itemIdentifier"] for f in self.dispatcher.lambda_handler(event, None)["batchItemFailures"]}
+            except Exception as e:
+                print(f"dispatcher batch failed: {e}", file=sys.stderr)
+                failed = {m["MessageId"] for m in msgs}
+            self.dispatch_failures += len(failed)
+            for m in msgs:
+                if m["MessageId"] in failed:
+                    self.sqs.change_message_visibility(QueueUrl=EVENTS_URL, ReceiptHandle=m["ReceiptHandle"],
+                                                       VisibilityTimeout=1)
+                else:
+                    self.sqs.delete_message(QueueUrl=EVENTS_URL, ReceiptHandle=m["ReceiptHandle"])
+
+    def _deliver(self, pr: int, rev: int) -> None:
+        head = _head(pr, rev)
+        # Each push appends a hunk to the PR's first file; the other files keep their blobs.
+        files = [self._first_file(pr, rev)] + [_file(pr, i, 0) for i in range(1, self.args.files)]
+        self.gh.set_pr(OWNER, f"svc-{pr}", pr, head, files)
+        raw = _delivery(pr, "opened" if rev == 0 else "synchronize", head, _head(pr, rev - 1) if rev else None)
+        sig = "sha256=" + hmac.new(WEBHOOK_SECRET.encode(), raw, hashlib.sha256).hexdigest()
+        resp = self.webhook.lambda_handler({
+            "headers": {"X-GitHub-Event": "pull_request", "X-GitHub-Delivery": f"lt-{pr}-{rev}",
+                        "X-Hub-Signature-256": sig},
+            "body": raw.decode("utf-8"), "isBase64Encoded": False,
+        }, None)
+        self.webhook_codes[resp["statusCode"]] = self.webhook_codes.get(resp["statusCode"], 0) + 1
+
+    def _first_file(self, pr: int, rev: int) -> Dict[str, Any]:
+        parts = [_file(pr, 0, r) for r in range(rev + 1)]
+        f = dict(parts[-1])
+        f["patch"] = "\n".join(p["patch"] for p in parts)
+        f["additions"] = sum(p["additions"] for p in parts)
+        return f
+
+    def coverage(self) -> Dict[str, Any]:
+        """Hunks of each PR's final diff that never got an inline comment."""
+        from .diff_hunks import parse_unified_hunks
+        from .review_logic import pick_line
+
+        hunks, missed = 0, []
+        for pr in range(1, self.args.prs + 1):
+            commented = self.gh.commented_lines(OWNER, f"svc-{pr}", pr)
+            for f in self.gh.pr_files(OWNER, f"svc-{pr}", pr):
+                for h in parse_unified_hunks(f["patch"], f["filename"]):
+                    hunks += 1
+                    if (h["file_path"], pick_line(h)) not in commented:
+                        missed.append(f"#{pr} {h['file_path']}:{pick_line(h)}")
+        return {"hunks": hunks, "unreviewed": missed}
+
+    def _drained(self) -> bool:
+        return self.sqs.pending(EVENTS_URL) == 0 and self.sqs.pending(REVIEW_URL) == 0
+
+    def run(self) -> Dict[str, Any]:
+        from .service import ReviewService
+
+        a = self.args
+        plan = schedule(a.profile, a.prs, a.rate, a.pushes, a.push_interval)
+        svc = ReviewService(REVIEW_URL, self.runner.handle_event, sqs_client=self.sqs, concurrency=a.workers,
+                            wait_sec=1, visibility_sec=120)
+        threads = [threading.Thread(target=self._dispatch_loop, name="dispatcher", daemon=True),
+                   threading.Thread(target=svc.run, name="review-service", daemon=True)]
+        for t in threads:
+            t.start()
+
+        t0 = time.time()
+        for offset, pr, rev in plan:
+            delay = t0 + offset - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self._deliver(pr, rev)
+        sent_s = time.time() - t0
+        deadline = time.time() + a.timeout
+        while not self._drained() and time.time() < deadline:
+            time.sleep(0.2)
+        wall = time.time() - t0
+        timed_out = not self._drained()
+
+        svc.stop()
+        self._stop.set()
+        for t in threads:
+            t.join(timeout=30)
+        return self.report(plan, wall, sent_s, timed_out, svc.stats)
+
+    # -- report --------------------------------------------------------------
+
+    def report(self, plan: List[Tuple[float, int, int]], wall: float, sent_s: float, timed_out: bool,
+               service_stats: Dict[str, int]) -> Dict[str, Any]:
+        exp = self.exporter
+        first = [m["value"] for m in exp.metrics("first_comment_s")]
+        done = [m["value"] for m in exp.metrics("review_done_s")]
+        reviews = [s for s in exp.spans("review") if s.get("service") == "worker"]
+        outcomes: Dict[str, int] = {}
+        for s in reviews:
+            key = s.get("outcome") or ("error" if not s["ok"] else "unknown")
+            outcomes[key] = outcomes.get(key, 0) + 1
+        posted = [s for s in reviews if s.get("outcome") == "posted"]
+        hunks = sum(int(s.get("hunks") or 0) for s in posted)
+        lat = {name: {"p50": _pct(xs, .5), "p90": _pct(xs, .9), "p99": _pct(xs, .99), "max": _pct(xs, 1.0),
+                      "n": len(xs)} for name, xs in (("first_comment_s", first), ("review_done_s", done))}
+        from .github_api import gh_metrics
+        from .model_io import prefix_cache_stats
+
+        return {
+            "profile": self.args.profile, "model": self.args.model, "deliveries": len(plan),
+            "prs": self.args.prs, "workers": self.args.workers, "wall_s": round(wall, 3),
+            "send_s": round(sent_s, 3), "timed_out": timed_out,
+            "latency": lat,
+            "throughput": {"reviews_per_min": round(len(posted) * 60 / wall, 2) if wall else 0.0,
+                           "hunks_per_s": round(hunks / wall, 2) if wall else 0.0},
+            "webhook": {str(k): v for k, v in sorted(self.webhook_codes.items())},
+            "outcomes": outcomes,
+            "service": dict(service_stats), "dispatch_failures": self.dispatch_failures,
+            "github": {**self.gh.snapshot(), "dispatcher_client": self.dispatcher.gh.metrics.snapshot(),
+                       "worker_client": gh_metrics()},
+            "aws": {"s3": dict(self.s3.calls), "dynamodb": dict(self.ddb.calls), "secrets": self.secrets.calls,
+                    "sqs_deleted": len(self.sqs.deleted)},
+            "prefix_cache": prefix_cache_stats(),
+            "coverage": self.coverage(),
+            "stages": exp.summary(),
+        }
+
+
+def _print_report(r: Dict[str, Any]) -> None:
+    print(f"profile={r['profile']} model={r['model']} prs={r['prs']} deliveries={r['deliveries']} "
+          f"workers={r['workers']} wall={r['wall_s']:.1f}s (sending {r['send_s']:.1f}s)"
+          + ("  TIMED OUT" if r["timed_out"] else ""))
+    for name, s in r["latency"].items():
+        if s["n"]:
+            print(f"  {name:<16s} n={s['n']:<4d} p50={s['p50']:.2f}s p90={s['p90']:.2f}s "
+                  f"p99={s['p99']:.2f}s max={s['max']:.2f}s")
+        else:
+            print(f"  {name:<16s} n=0")
+    t = r["throughput"]
+    print(f"  throughput       {t['reviews_per_min']:.1f} reviews/min, {t['hunks_per_s']:.2f} hunks/s")
+    print(f"  webhook          {r['webhook']}")
+    print(f"  outcomes         {r['outcomes']} service={r['service']} dispatch_failures={r['dispatch_failures']}")
+    g = r["github"]
+    print(f"  github           total={g['total']} rate_limited={g['rate_limited']} not_modified={g['not_modified']} "
+          f"reviews={g['reviews']} inline_comments={g['inline_comments']}")
+    for route, n in g["calls"].items():
+        print(f"    {route:<16s} {n}")
+    print(f"  aws              {r['aws']}")
+    print(f"  prefix_cache     {r['prefix_cache']}")
+    c = r["coverage"]
+    print(f"  coverage         {c['hunks'] - len(c['unreviewed'])}/{c['hunks']} hunks commented"
+          + (f"; missed {c['unreviewed']}" if c["unreviewed"] else ""))
+    print("  stages")
+    for name, s in sorted(r["stages"].items(), key=lambda kv: -kv[1]["total_ms"]):
+        print(f"    {name:<18s} n={s['count']:<5d} p50={s['p50_ms']:9.2f}ms p99={s['p99_ms']:9.2f}ms")
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="worker.loadtest", description="End-to-end load test with local stand-ins")
+    ap.add_argument("--profile", choices=("steady", "burst", "pushes"), default="steady")
+    ap.add_argument("--prs", type=int, default=10)
+    ap.add_argument("--rate", type=float, default=2.0, help="PRs opened per second (steady, pushes)")
+    ap.add_argument("--pushes", type=int, default=2, help="synchronize events per PR (pushes)")
+    ap.add_argument("--push-interval", type=float, default=1.0)
+    ap.add_argument("--files", type=int, default=4, help="changed files per PR, one hunk each")
+    ap.add_argument("--workers", type=int, default=2, help="ReviewService concurrency")
+    ap.add_argument("--model", choices=("tiny", "heuristic"), default="tiny")
+    ap.add_argument("--model-dir", help="reuse a model directory instead of building the tiny model")
+    ap.add_argument("--gh-latency-ms", type=float, default=20.0)
+    ap.add_argument("--gh-jitter-ms", type=float, default=10.0)
+    ap.add_argument("--gh-rate", type=float, default=0.0, help="GitHub requests/s before 403 rate limiting (0: off)")
+    ap.add_argument("--gh-burst", type=int, default=0)
+    ap.add_argument("--debounce", type=float, default=0.0, help="dispatcher DEBOUNCE_SEC")
+    ap.add_argument("--review-store", choices=("none", "memory", "dynamodb"), default="none")
+    ap.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for the queues to drain")
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = ap.parse_args(argv)
+
+    gh = FakeGitHub(latency_ms=args.gh_latency_ms, jitter_ms=args.gh_jitter_ms,
+                    rate_per_sec=args.gh_rate, burst=args.gh_burst)
+    gh_url = gh.start()
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as tmp:
+        model_dir = None
+        if args.model == "tiny":
+            model_dir = args.model_dir or os.path.join(tmp, "model")
+        # Before any worker module is imported: config reads the environment once.
+        _configure_env(gh_url, args, model_dir)
+        if model_dir is not None and not args.model_dir:
+            build_tiny_model(model_dir)
+        try:
+            test = LoadTest(args, gh)
+            if model_dir is not None:
+                from .model_io import get_model
+                get_model()  # cold start is not part of any review's latency
+            report = test.run()
+        finally:
+            gh.stop()
+            from . import infer_pool
+            infer_pool.shutdown()
+
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        _print_report(report)
+    return 1 if report["timed_out"] or report["coverage"]["unreviewed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,10 +1,33 @@
 from __future__ import annotations
+import json
 import logging
 import os
-from .config import LOG_LEVEL
+from . import tracing
+from .config import LOG_LEVEL, LOG_FORMAT
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, carrying the trace context (cid, service) of the emitting code."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        out.update((k, v) for k, v in tracing.current().items() if k != "received_at")
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str)
+
 
 def setup_logger(name: str) -> logging.Logger:
     level = LOG_LEVEL
+    if LOG_FORMAT == "json" and not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        logging.basicConfig(level=level, handlers=[handler])
     logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(message)s")
     log = logging.getLogger(name)
     log.setLevel(level)
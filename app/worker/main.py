@@ -1,6 +1,30 @@
 from __future__ import annotations
+import argparse
 import sys
 from .runner import entrypoint
 
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="worker.main")
+    ap.add_argument("--serve", action="store_true",
+                    help="long-poll REVIEW_QUEUE_URL and keep the model loaded across messages")
+    ap.add_argument("--backfill", metavar="MANIFEST",
+                    help="review every PR / artifact listed in MANIFEST (JSON lines) in this process")
+    ap.add_argument("--out", default="backfill-results.jsonl",
+                    help="backfill results file; jobs already in it are skipped")
+    ap.add_argument("--dry-run", action="store_true", help="backfill: generate and record, post nothing")
+    ap.add_argument("--batch-hunks", type=int, help="backfill: hunks per prepare_comments call")
+    args = ap.parse_args(argv)
+    if args.backfill:
+        from .backfill import run_backfill
+        kw = {"batch_hunks": args.batch_hunks} if args.batch_hunks else {}
+        summary = run_backfill(args.backfill, args.out, dry_run=args.dry_run, **kw)
+        return 1 if summary["statuses"].get("failed") else 0
+    if args.serve:
+        from .service import serve
+        return serve()
+    return entrypoint()
+
+
 if __name__ == "__main__":
-    sys.exit(entrypoint())
+    sys.exit(main())
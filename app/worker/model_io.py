@@ -1,30 +1,34 @@
 from __future__ import annotations
 
+import json
 import os
 import re
 import threading
-from typing import Any, Dict, Tuple
-
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from huggingface_hub import snapshot_download
-from huggingface_hub.utils import HfHubHTTPError, RepositoryNotFoundError
-from peft import PeftModel
+import time
+from typing import Any, Dict, List, Tuple
 
+from . import infer_pool, tracing
 from .logutil import setup_logger
+from .aws_utils import adapter_version
 from .config import (
     MODEL_DIR, MODEL_ID, GEN_MAX_NEW_TOKENS, TRUNCATE_HUNK_CHARS,
-    LORA_ADAPTER_DIR, MAX_BODY_CHARS, LLM_DISABLED
+    LORA_ADAPTER_DIR, MAX_BODY_CHARS, LLM_DISABLED, GEN_BATCH_SIZE, PROMPT_PATCH_TOKENS,
+    INFERENCE_BACKEND, ONNX_CACHE_DIR, PREBAKED_MODEL_DIR, MODEL_OFFLINE, GEN_EARLY_STOP, PROMPT_PREFIX_CACHE,
 )
 
 log = setup_logger("model-io")
 
 os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
 os.environ.setdefault("OMP_NUM_THREADS", "1")
-torch.set_num_threads(max(1, min(2, os.cpu_count() or 1)))
 
 _model_lock = threading.Lock()
-_model_ctx = {"tokenizer": None, "model": None}
+_model_ctx = {"tokenizer": None, "model": None, "backend": None, "source": None, "adapter": None, "prefix": None}
+_cold_start: Dict[str, float] = {}
+
+PREBAKE_META_FILE = "prebake.json"
+
+BACKENDS = ("eager", "merged", "int8", "onnx")
+ADAPTER_NONE = "none"  # active adapter when none could be loaded: the base weights ran
 
 _DIFF_MARK_RE = re.compile(
     r"^(\+|-|@@|diff --git|index [0-9a-f]+\.\.[0-9a-f]+|\\ No newline)",
@@ -32,6 +36,10 @@ _DIFF_MARK_RE = re.compile(
 )
 
 def _download_model(repo_id: str) -> str:
+    if MODEL_OFFLINE:
+        return MODEL_DIR
+    from huggingface_hub import snapshot_download
+
     return snapshot_download(
         repo_id=repo_id,
         local_dir=MODEL_DIR,
@@ -39,6 +47,142 @@ def _download_model(repo_id: str) -> str:
         token=None
     )
 
+def _merge_adapter(model):
+    from peft import PeftModel
+
+    if isinstance(model, PeftModel):
+        model = model.merge_and_unload()
+        model.eval()
+    return model
+
+# Dynamic int8 is not token-for-token with eager: greedy decoding diverges
+# from the first near-tie that rounding flips. What it does hold is the
+# next-token distribution, teacher-forced on the same prompt, at cosine
+# similarity >= this value to the merged fp32 model at every position.
+INT8_LOGITS_MIN_COSINE = 0.99
+
+def _quantize_int8(model):
+    import torch
+
+    if model.device.type != "cpu":
+        raise RuntimeError("dynamic int8 quantization is CPU-only")
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _export_onnx(model, tok):
+    from optimum.onnxruntime import ORTModelForCausalLM
+
+    out_dir = os.path.join(ONNX_CACHE_DIR, _adapter_tag())
+    if not os.path.isfile(os.path.join(out_dir, "model.onnx")):
+        staging = out_dir + ".src"
+        model.save_pretrained(staging, safe_serialization=True)
+        tok.save_pretrained(staging)
+        ORTModelForCausalLM.from_pretrained(staging, export=True).save_pretrained(out_dir)
+        log.info("Exported ONNX model to %s", out_dir)
+    return ORTModelForCausalLM.from_pretrained(out_dir)
+
+def _adapter_tag() -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{MODEL_ID}-{active_adapter_version()}")
+
+def _apply_backend(model, tok, backend: str):
+    """Wrap the eager model for `backend`; any failure falls back to what we already have."""
+    if backend not in BACKENDS:
+        log.warning("Unknown INFERENCE_BACKEND %r; using eager", backend)
+        return model, "eager"
+    if backend == "eager":
+        return model, "eager"
+    try:
+        model = _merge_adapter(model)
+    except Exception as e:
+        log.warning("Adapter merge failed, using eager: %s", e)
+        return model, "eager"
+    try:
+        if backend == "int8":
+            model = _quantize_int8(model)
+        elif backend == "onnx":
+            model = _export_onnx(model, tok)
+    except Exception as e:
+        log.warning("Backend %s unavailable, using merged: %s", backend, e)
+        return model, "merged"
+    return model, backend
+
+def _read_prebake_meta(path: str = PREBAKED_MODEL_DIR) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(path, PREBAKE_META_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _prebake_stale(meta: Dict[str, Any]) -> bool:
+    baked = meta.get("adapter_version")
+    return bool(baked) and adapter_version() not in ("local", baked)
+
+def _usable_prebake() -> Dict[str, Any]:
+    """Metadata of the image's prebaked weights if they fit the current config, else {}."""
+    meta = _read_prebake_meta()
+    if not meta or meta.get("model_id") != MODEL_ID:
+        return {}
+    if _prebake_stale(meta):
+        if not MODEL_OFFLINE:
+            log.info("Prebaked adapter %s superseded by %s; loading from the hub",
+                     meta["adapter_version"], adapter_version())
+            return {}
+        log.warning("Prebaked adapter %s differs from synced %s; offline, keeping the prebaked one",
+                    meta["adapter_version"], adapter_version())
+    return meta
+
+def active_adapter_version() -> str:
+    """Adapter the model runs (or will run) with: the build-time merge or the synced one.
+
+    Before the model is loaded this is a prediction; once loaded it is what
+    actually ran, ADAPTER_NONE if the adapter failed to load.
+    """
+    if _model_ctx["adapter"]:
+        return _model_ctx["adapter"]
+    meta = _read_prebake_meta()
+    if meta.get("model_id") == MODEL_ID and meta.get("adapter_version") and (MODEL_OFFLINE or not _prebake_stale(meta)):
+        return meta["adapter_version"]
+    return adapter_version()
+
+def _load_weights(path: str, prebaked: bool = False):
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    local_only = prebaked or MODEL_OFFLINE
+    tok = AutoTokenizer.from_pretrained(path, use_fast=True, local_files_only=local_only)
+    tok.padding_side = "right"
+    tok.truncation_side = "left"
+    if tok.pad_token is None and tok.eos_token is not None:
+        tok.pad_token = tok.eos_token
+
+    # safetensors are memory-mapped; with low_cpu_mem_usage the weights are
+    # paged in from the image layer instead of being read and copied up front.
+    model = AutoModelForCausalLM.from_pretrained(
+        path,
+        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+        low_cpu_mem_usage=True,
+        local_files_only=local_only,
+        use_safetensors=True if prebaked else None,
+    )
+    model.eval()
+    return tok, model
+
+def _load_from_hub():
+    from huggingface_hub.utils import HfHubHTTPError, RepositoryNotFoundError
+
+    tried = [MODEL_ID, "bigcode/santacoder"]
+    last_err = None
+    for mid in tried:
+        try:
+            return _load_weights(_download_model(mid))
+        except (RepositoryNotFoundError, HfHubHTTPError, Exception) as e:
+            last_err = e
+            log.warning("Model %s not available: %s", mid, e)
+    raise RuntimeError(f"Could not load any model; last error: {last_err}")
+
+def cold_start_timings() -> Dict[str, Any]:
+    """Seconds spent per cold-start phase (import, weights, adapter, backend, first_token)."""
+    return dict(_cold_start)
+
 def get_model():
     if _model_ctx["model"] is not None:
         return _model_ctx["tokenizer"], _model_ctx["model"]
@@ -46,56 +190,205 @@ def get_model():
         if _model_ctx["model"] is not None:
             return _model_ctx["tokenizer"], _model_ctx["model"]
 
-        tried = [MODEL_ID, "bigcode/santacoder"]
-        last_err = None
-        for mid in tried:
+        # The ML stack is imported here, on first model use, so heuristic-only
+        # runs (LLM_DISABLED) never load torch.
+        t0 = time.perf_counter()
+        import torch
+        import transformers  # noqa: F401
+        from peft import PeftModel
+
+        # With a process pool the parent stays single-threaded until it forks:
+        # an OpenMP thread pool does not survive fork() in the children.
+        pooled = infer_pool.pool_requested()
+        torch.set_num_threads(1 if pooled else infer_pool.plan()[1])
+        _cold_start["import_s"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        meta = _usable_prebake()
+        model = None
+        if meta:
             try:
-                local_dir = _download_model(mid)
-                tok = AutoTokenizer.from_pretrained(local_dir, use_fast=True)
-                tok.padding_side = "right"
-                tok.truncation_side = "left"
-                if tok.pad_token is None and tok.eos_token is not None:
-                    tok.pad_token = tok.eos_token
-
-                model = AutoModelForCausalLM.from_pretrained(
-                    local_dir,
-                    torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                    low_cpu_mem_usage=True,
-                )
+                tok, model = _load_weights(PREBAKED_MODEL_DIR, prebaked=True)
+            except Exception as e:
+                log.warning("Prebaked model in %s unusable: %s", PREBAKED_MODEL_DIR, e)
+                meta = {}
+        if model is None:
+            tok, model = _load_from_hub()
+        source = "prebaked" if meta else "hub"
+        _cold_start["weights_s"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        adapter = meta.get("adapter_version") or ADAPTER_NONE
+        if meta.get("adapter_version"):
+            log.info("Using adapter %s merged at build time", meta["adapter_version"])
+        elif LORA_ADAPTER_DIR:
+            try:
+                model = PeftModel.from_pretrained(model, LORA_ADAPTER_DIR)
                 model.eval()
+                adapter = adapter_version()
+                log.info("LoRA adapter loaded from %s", LORA_ADAPTER_DIR)
+            except Exception as e:
+                log.warning("Could not load LoRA adapter (base weights only): %s", e)
+        _cold_start["adapter_s"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        model, backend = _apply_backend(model, tok, INFERENCE_BACKEND)
+        _cold_start["backend_s"] = time.perf_counter() - t0
+        log.info("Inference backend: %s", backend)
 
-                if LORA_ADAPTER_DIR:
-                    try:
-                        model = PeftModel.from_pretrained(model, LORA_ADAPTER_DIR)
-                        model.eval()
-                        log.info("LoRA adapter loaded from %s", LORA_ADAPTER_DIR)
-                    except Exception as e:
-                        log.warning("Could not load LoRA adapter: %s", e)
-
-                _model_ctx["tokenizer"], _model_ctx["model"] = tok, model
-                return tok, model
-            except (RepositoryNotFoundError, HfHubHTTPError, Exception) as e:
-                last_err = e
-                log.warning("Model %s not available: %s", mid, e)
-        raise RuntimeError(f"Could not load any model; last error: {last_err}")
+        t0 = time.perf_counter()
+        try:
+            prefix = _build_prefix_cache(tok, model, backend)
+        except Exception as e:
+            log.warning("Prompt prefix cache unavailable (full prefill per prompt): %s", e)
+            prefix = None
+        _cold_start["prefix_s"] = time.perf_counter() - t0
+
+        try:
+            _cold_start["first_token_s"] = _first_token(tok, model)
+        except Exception as e:
+            log.warning("Warm-up generation failed: %s", e)
+        log.info("Cold start from %s: %s", source, " ".join(f"{k}={v:.2f}s" for k, v in _cold_start.items()))
+        tracing.record("model_load", sum(_cold_start.values()), source=source, backend=backend,
+                       **{k: round(v, 3) for k, v in _cold_start.items()})
+
+        _model_ctx.update(
+            tokenizer=tok, model=model, backend=backend, source=source, prefix=prefix, adapter=adapter,
+        )
+        if pooled and backend == "onnx":
+            # onnxruntime sessions own native thread pools that fork() does not carry over.
+            log.warning("INFER_PROCS ignored for the onnx backend; generating in-process")
+        elif pooled:
+            try:
+                infer_pool.start(tok)
+            except Exception as e:
+                log.warning("Inference pool unavailable (generating in-process): %s", e)
+                torch.set_num_threads(infer_pool.plan()[1])
+        return tok, model
+
+PROMPT_HEAD = (
+    "You are a senior code reviewer. Give exactly 1 short, actionable suggestion to improve the change.\n"
+    "Code:\n"
+)
+PROMPT_TAIL = "\nSuggestion:\n"
 
 def build_prompt(h: Dict[str, Any]) -> str:
     patch = (h.get("patch_hunk", "") or "")
     if TRUNCATE_HUNK_CHARS > 0 and len(patch) > TRUNCATE_HUNK_CHARS:
         patch = patch[:TRUNCATE_HUNK_CHARS] + "\n... [truncated]"
-    return (
-        "You are a senior code reviewer. Give exactly 1 short, actionable suggestion to improve the change.\n"
-        "Code:\n"
-        f"{patch}\n"
-        "Suggestion:\n"
-    )
+    return f"{PROMPT_HEAD}{patch}{PROMPT_TAIL}"
+
+def generation_signature() -> str:
+    """Everything besides the hunk itself that determines a suggestion's text."""
+    return "|".join([
+        MODEL_ID, PROMPT_HEAD, PROMPT_TAIL,
+        f"max_new={min(GEN_MAX_NEW_TOKENS, 64)}", "greedy",
+        f"backend={_model_ctx['backend'] or INFERENCE_BACKEND}",
+        f"trunc={TRUNCATE_HUNK_CHARS}", f"ptok={PROMPT_PATCH_TOKENS}", f"body={MAX_BODY_CHARS}",
+    ])
+
+_tmpl_ctx: Dict[str, Any] = {"tok": None}
+
+def _template_ids(tok) -> Dict[str, List[int]]:
+    """Token ids of the fixed prompt pieces, encoded once per tokenizer."""
+    if _tmpl_ctx["tok"] is not tok:
+        _tmpl_ctx.update(
+            tok=tok,
+            head=tok(PROMPT_HEAD)["input_ids"],
+            tail=tok(PROMPT_TAIL)["input_ids"],
+            nl=tok("\n")["input_ids"],
+            gap=tok("...")["input_ids"],
+        )
+    return _tmpl_ctx
+
+def _line_order(lines: List[str]) -> List[int]:
+    """Line indices in keep-first order: hunk header, added lines, then
+    context/removed lines by distance to the nearest added line."""
+    n = len(lines)
+    dist = [n] * n
+    last = None
+    for i, ln in enumerate(lines):
+        if ln.startswith("+"):
+            last = i
+        if last is not None:
+            dist[i] = i - last
+    last = None
+    for i in range(n - 1, -1, -1):
+        if lines[i].startswith("+"):
+            last = i
+        if last is not None:
+            dist[i] = min(dist[i], last - i)
+
+    def rank(i: int) -> Tuple[int, int, int]:
+        ln = lines[i]
+        if ln.startswith("@@"):
+            return (0, 0, i)
+        if ln.startswith("+"):
+            return (1, 0, i)
+        return (2, dist[i], i)
+    return sorted(range(n), key=rank)
+
+def _fit_lines(line_ids: List[List[int]], order: List[int], budget: int, nl_len: int) -> Dict[int, List[int]]:
+    kept: Dict[int, List[int]] = {}
+    left = budget
+    for i in order:
+        cost = len(line_ids[i]) + nl_len
+        if cost <= left:
+            kept[i] = line_ids[i]
+            left -= cost
+        else:
+            if left > nl_len:
+                kept[i] = line_ids[i][: left - nl_len]
+            break
+    return kept
+
+def encode_prompts(tok, hunks: List[Dict[str, Any]]) -> List[List[int]]:
+    """Token ids for each hunk's prompt, with the patch trimmed to PROMPT_PATCH_TOKENS.
+
+    The template is encoded once and cached; all patch lines of all hunks go
+    through a single tokenizer call. Lines are kept by `_line_order` and cut
+    at token boundaries, and skipped runs are marked with "...".
+    """
+    if PROMPT_PATCH_TOKENS <= 0:
+        return [tok(build_prompt(h))["input_ids"] for h in hunks]
+
+    t = _template_ids(tok)
+    split = [(h.get("patch_hunk", "") or "").split("\n") for h in hunks]
+    flat = [ln for lines in split for ln in lines]
+    flat_ids = tok(flat)["input_ids"] if flat else []
+
+    out: List[List[int]] = []
+    pos = 0
+    for lines in split:
+        line_ids = flat_ids[pos : pos + len(lines)]
+        pos += len(lines)
+        kept = _fit_lines(line_ids, _line_order(lines), PROMPT_PATCH_TOKENS, len(t["nl"]))
+        body: List[int] = []
+        prev = -1
+        for i in sorted(kept):
+            if body:
+                body += t["nl"]
+            if i != prev + 1:
+                body += t["gap"] + t["nl"]
+            body += kept[i]
+            prev = i
+        if kept and prev != len(lines) - 1:
+            body += t["nl"] + t["gap"]
+        out.append(t["head"] + body + t["tail"])
+    return out
+
+_FENCE_RE = re.compile(r"```.*?```", re.S)
+_LABEL_RE = re.compile(r"^\s*(Suggestion|Review)\s*:?\s*", re.I)
+_SENTENCE_END_RE = re.compile(r"[.!?]\s")
+_MARKER_WORDS = ("@@", "diff --git", "index ", "\\ no newline")
+_INDEX_PREFIX_RE = re.compile(r"index [0-9a-f]*\.?\.?", re.I)
 
 def sanitize(text: str) -> str:
     t = (text or "").strip()
-    t = re.sub(r"```.*?```", "", t, flags=re.S)
+    t = _FENCE_RE.sub("", t)
     lines = [ln for ln in t.splitlines() if not _DIFF_MARK_RE.match(ln.strip())]
     t = " ".join(ln.strip() for ln in lines if ln.strip())
-    t = re.sub(r"^\s*(Suggestion|Review)\s*:?\s*", "", t, flags=re.I)
+    t = _LABEL_RE.sub("", t)
     t = t.split("\n", 1)[0]
     parts = re.split(r"(?<=[.!?])\s+", t)
     t = (parts[0] if parts else t).strip()
@@ -103,27 +396,244 @@ def sanitize(text: str) -> str:
         t = t[:MAX_BODY_CHARS].rstrip()
     return t or "Consider adding a unit test for this change."
 
-def llm_suggest(h: Dict[str, Any]) -> str:
-    tok, model = get_model()
-    prompt = build_prompt(h)
-    inputs = tok(prompt, return_tensors="pt").to(model.device)
-    input_len = inputs["input_ids"].shape[1]
+def _maybe_marker(line: str) -> bool:
+    """True if more text could still turn `line` into a diff-marker line."""
+    low = line.lower()
+    return any(w.startswith(low) for w in _MARKER_WORDS) or bool(_INDEX_PREFIX_RE.fullmatch(line))
+
+def sentence_settled(text: str) -> bool:
+    """True once no continuation of `text` can change `sanitize`'s result, i.e.
+    the first sentence has ended or MAX_BODY_CHARS of it are fixed.
+
+    Only text that sanitize is sure to keep counts: an unclosed code fence and
+    everything after it, diff-marker lines, and a last line that could still
+    turn into a diff marker are all left out, so echoed code never ends
+    generation early.
+    """
+    t = (text or "").rstrip("\ufffd").lstrip()  # a trailing partial UTF-8 sequence decodes as U+FFFD
+    if t.count("```") % 2:
+        t = t[: t.rfind("```")]
+    lines = _FENCE_RE.sub("", t).splitlines(keepends=True)
+    partial = lines.pop() if lines and lines[-1] == lines[-1].splitlines()[0] else ""
+    kept = [ln.strip() for ln in lines if ln.strip() and not _DIFF_MARK_RE.match(ln.strip())]
+    tail = partial.lstrip()
+    # The last line may still grow; it counts unstripped (a trailing space is a real boundary).
+    open_line = bool(tail) and not _DIFF_MARK_RE.match(tail) and not _maybe_marker(tail)
+    if open_line:
+        kept.append(tail)
+    joined = " ".join(kept)
+    label = _LABEL_RE.match(joined)
+    if label and label.end() == len(joined):
+        return False
+    body = joined[label.end():] if label else joined
+    if not body:
+        return False
+    if MAX_BODY_CHARS > 0 and len(body.rstrip()) >= MAX_BODY_CHARS:
+        return True
+    if _SENTENCE_END_RE.search(body):
+        return True
+    # A finished line ending in punctuation ends the sentence whatever comes next.
+    return not open_line and body[-1] in ".!?"
+
+def _length_buckets(lengths: List[int], max_batch: int) -> List[List[int]]:
+    """Group prompt indices into micro-batches of similar token length."""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    step = max(1, max_batch)
+    return [order[i : i + step] for i in range(0, len(order), step)]
+
+def _sentence_stop(tok, width: int):
+    """Per-row stopping criterion: a row is done once `sentence_settled` holds
+    for its decoded continuation; generate() ends when every row is done."""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class SentenceStop(StoppingCriteria):
+        def __init__(self):
+            self.done: List[bool] = []
+
+        def __call__(self, input_ids, scores, **kwargs):
+            if not self.done:
+                self.done = [False] * input_ids.shape[0]
+            for i, row in enumerate(input_ids):
+                if not self.done[i]:
+                    self.done[i] = sentence_settled(tok.decode(row[width:], skip_special_tokens=True))
+            return torch.tensor(self.done, dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([SentenceStop()])
+
+def _token_counts(tok, row, eos_id) -> Tuple[int, int]:
+    """(generated, kept) for one row of new tokens: tokens up to the first
+    EOS/pad, and the fewest leading ones that already sanitize to the result."""
+    hits = (row == eos_id).nonzero()
+    n = int(hits[0]) if len(hits) else len(row)
+    want = sanitize(tok.decode(row[:n], skip_special_tokens=True))
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if sanitize(tok.decode(row[:mid], skip_special_tokens=True)) == want:
+            hi = mid
+        else:
+            lo = mid + 1
+    return n, lo
+
+_prefix_lock = threading.Lock()
+_prefix_stats: Dict[str, int] = {"rows": 0, "saved_tokens": 0}
+
+def _build_prefix_cache(tok, model, backend: str) -> Dict[str, Any] | None:
+    """Key/value cache of PROMPT_HEAD, prefilled once per model load.
+
+    Every prompt starts with the head's token ids, so generation can resume
+    from this cache and prefill only the patch and tail. Not built for onnx,
+    whose exported session takes no precomputed past, nor for int8: dynamic
+    quantization scales activations per call, so a head prefilled on its own
+    would not give the same outputs as the full prompt.
+    """
+    if not PROMPT_PREFIX_CACHE or backend in ("onnx", "int8"):
+        return None
+    import torch
+
+    ids = _template_ids(tok)["head"]
+    with torch.no_grad():
+        out = model(input_ids=torch.tensor([ids], dtype=torch.long).to(model.device), use_cache=True)
+    past = out.past_key_values
+    if hasattr(past, "to_legacy_cache"):
+        past = past.to_legacy_cache()
+    return {"ids": list(ids), "past": tuple(tuple(t) for t in past)}
+
+def _prefix_for(model, batch_ids: List[List[int]], enabled: bool | None = None) -> Dict[str, Any] | None:
+    """The cached head if every prompt of the batch starts with it, else None.
+
+    Char-truncated prompts (PROMPT_PATCH_TOKENS=0) are encoded whole, and BPE
+    may merge across the end of the head; those fall back to a full prefill.
+    """
+    prefix = _model_ctx["prefix"]
+    if not (PROMPT_PREFIX_CACHE if enabled is None else enabled) or prefix is None:
+        return None
+    if model is not _model_ctx["model"]:
+        return None
+    head = prefix["ids"]
+    n = len(head)
+    return prefix if all(len(ids) > n and ids[:n] == head for ids in batch_ids) else None
+
+def _count_prefix(rows: int, saved: int) -> None:
+    with _prefix_lock:
+        _prefix_stats["rows"] += rows
+        _prefix_stats["saved_tokens"] += saved
+
+def prefix_cache_stats() -> Dict[str, int]:
+    """Prompts that started from the cached head, and the prefill tokens that saved."""
+    with _prefix_lock:
+        return dict(_prefix_stats)
+
+def _generate_batch(tok, model, batch_ids: List[List[int]], early_stop: bool | None = None,
+                    stats: Dict[str, int] | None = None, prefix_cache: bool | None = None) -> List[str]:
+    """Greedy-decode one micro-batch, left-padded to its own longest prompt.
+
+    With early stop (GEN_EARLY_STOP) each row stops as soon as its sanitized
+    suggestion can no longer change, so the result is the same as a full run.
+
+    With the prompt head's cache (PROMPT_PREFIX_CACHE) only the rest of each
+    prompt is prefilled. The padding then goes between head and patch instead
+    of in front: the head keeps positions 0..n-1 in every row, and position
+    ids and attention mask are the same as in the uncached layout.
+    """
+    import torch
+
+    width = max(len(ids) for ids in batch_ids)
+    pad_id = tok.pad_token_id if tok.pad_token_id is not None else tok.eos_token_id
+    prefix = _prefix_for(model, batch_ids, prefix_cache)
+    n = len(prefix["ids"]) if prefix else 0
+    input_ids = torch.tensor(
+        [ids[:n] + [pad_id] * (width - len(ids)) + ids[n:] for ids in batch_ids], dtype=torch.long
+    ).to(model.device)
+    attention_mask = torch.tensor(
+        [[1] * n + [0] * (width - len(ids)) + [1] * (len(ids) - n) for ids in batch_ids], dtype=torch.long
+    ).to(model.device)
+    past = None
+    if prefix:
+        rows = len(batch_ids)
+        past = tuple(tuple(t.expand(rows, -1, -1, -1) for t in layer) for layer in prefix["past"])
+    early_stop = GEN_EARLY_STOP if early_stop is None else early_stop
     with torch.no_grad():
         out = model.generate(
-            **inputs,
+            input_ids=input_ids,
+            attention_mask=attention_mask,
             max_new_tokens=min(GEN_MAX_NEW_TOKENS, 64),
             do_sample=False,
             eos_token_id=tok.eos_token_id,
             pad_token_id=tok.eos_token_id,
+            stopping_criteria=_sentence_stop(tok, width) if early_stop else None,
+            past_key_values=past,
+        )
+    if stats is not None:
+        stats["rows"] = stats.get("rows", 0) + len(batch_ids)
+        stats["prefix_saved"] = stats.get("prefix_saved", 0) + n * len(batch_ids)
+        stats["steps"] = stats.get("steps", 0) + out.shape[1] - width
+        for row in out[:, width:]:
+            generated, kept = _token_counts(tok, row, tok.eos_token_id)
+            stats["generated"] = stats.get("generated", 0) + generated
+            stats["kept"] = stats.get("kept", 0) + kept
+    return [tok.decode(row[width:], skip_special_tokens=True) for row in out]
+
+def _first_token(tok, model) -> float:
+    """Prefill the fixed prompt head and decode one token; returns the seconds taken."""
+    import torch
+
+    ids = _template_ids(tok)["head"]
+    t0 = time.perf_counter()
+    with torch.no_grad():
+        model.generate(
+            input_ids=torch.tensor([ids], dtype=torch.long).to(model.device),
+            attention_mask=torch.ones(1, len(ids), dtype=torch.long).to(model.device),
+            max_new_tokens=1,
+            do_sample=False,
+            pad_token_id=tok.eos_token_id,
         )
-    text = tok.decode(out[0][input_len:], skip_special_tokens=True)
-    return sanitize(text)
+    return time.perf_counter() - t0
+
+def llm_suggest_batch(hunks: List[Dict[str, Any]], max_batch: int | None = None) -> List[str]:
+    tok, model = get_model()
+    with tracing.span("tokenize", hunks=len(hunks)):
+        encoded = encode_prompts(tok, hunks)
+    results: List[str] = [""] * len(hunks)
+    buckets = _length_buckets([len(ids) for ids in encoded], max_batch or GEN_BATCH_SIZE)
+    # Forked workers hold the same cached head, so the saving is known here.
+    saved: List[int] = []
+    for bucket in buckets:
+        prefix = _prefix_for(model, [encoded[i] for i in bucket])
+        saved.append(len(prefix["ids"]) * len(bucket) if prefix else 0)
+    _count_prefix(sum(len(b) for b, s in zip(buckets, saved) if s), sum(saved))
+    pool = infer_pool.get_pool()
+    if pool is not None:
+        # Workers decode and sanitize; only token ids and final strings cross processes.
+        with tracing.span("generate", hunks=len(hunks), procs=pool.procs,
+                          prompt_tokens=sum(len(ids) for ids in encoded), prefix_saved=sum(saved)):
+            outs = pool.generate([[encoded[i] for i in bucket] for bucket in buckets])
+        for bucket, texts in zip(buckets, outs):
+            for i, text in zip(bucket, texts):
+                results[i] = text
+        return results
+    for bucket, bucket_saved in zip(buckets, saved):
+        with tracing.span("generate", hunks=len(bucket), prompt_tokens=sum(len(encoded[i]) for i in bucket),
+                          prefix_saved=bucket_saved):
+            texts = _generate_batch(tok, model, [encoded[i] for i in bucket])
+        with tracing.span("sanitize", hunks=len(bucket)):
+            for i, text in zip(bucket, texts):
+                results[i] = sanitize(text)
+    return results
+
+def llm_suggest(h: Dict[str, Any]) -> str:
+    return llm_suggest_batch([h], max_batch=1)[0]
+
+_FALLBACK_LOGGING = "Replace prints with proper logging and disable debug logs in production."
+_FALLBACK_DEFAULT = "Consider adding a unit test and improving naming for clarity."
+FALLBACK_SUGGESTIONS = frozenset({_FALLBACK_LOGGING, _FALLBACK_DEFAULT})
 
 def heuristic_fallback(h: Dict[str, Any]) -> str:
     patch = h.get("patch_hunk", "") or ""
     if "print(" in patch or "console.log(" in patch:
-        return "Replace prints with proper logging and disable debug logs in production."
-    return "Consider adding a unit test and improving naming for clarity."
+        return _FALLBACK_LOGGING
+    return _FALLBACK_DEFAULT
 
 def suggest(h: Dict[str, Any]) -> str:
     if LLM_DISABLED:
@@ -136,3 +646,13 @@ def suggest(h: Dict[str, Any]) -> str:
     except Exception as e:
         log.warning("LLM failed, using fallback: %s", e)
         return heuristic_fallback(h)
+
+def suggest_batch(hunks: List[Dict[str, Any]], max_batch: int | None = None) -> List[str]:
+    if LLM_DISABLED or not hunks:
+        return [heuristic_fallback(h) for h in hunks]
+    try:
+        texts = llm_suggest_batch(hunks, max_batch=max_batch)
+    except Exception as e:
+        log.warning("LLM batch failed, using fallback: %s", e)
+        return [heuristic_fallback(h) for h in hunks]
+    return [t if t and len(t) >= 5 else heuristic_fallback(h) for h, t in zip(hunks, texts)]
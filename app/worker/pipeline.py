@@ -0,0 +1,189 @@
+"""Generate-and-post pipeline: suggestions are posted to GitHub while the model
+is still working through the rest of the PR.
+
+A producer thread generates in GEN_BATCH_SIZE batches, file by file, into a
+bounded queue (so generation stalls rather than piling up if GitHub is slow).
+The calling thread drains it and posts a review once PIPELINE_POST_CHUNK
+comments of completed files are ready, so each file's comments arrive together
+and in diff order. The summary with the idempotency marker goes on the last
+review, which means a marker on the PR still implies the whole run finished.
+
+Every earlier part carries a hidden part marker naming the hunks it covered.
+A retry after a run died mid-stream passes those in as `resume` and only
+generates and posts the rest.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from . import tracing
+from .logutil import setup_logger
+from .config import (
+    GEN_BATCH_SIZE, PIPELINE_HEAD_CHECK_SEC, PIPELINE_POST_CHUNK, PIPELINE_QUEUE_SIZE, REVIEW_MAX_COMMENTS,
+)
+from .review_logic import (
+    comment_key, log_cache_stats, part_marker, prepare_comments, review_counts, submit_chunk, summary_body,
+)
+
+log = setup_logger("pipeline")
+
+_END = object()
+
+
+class _Failed:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def order_by_file(hunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Group hunks by file in first-seen order, each file's hunks by position in the diff."""
+    files: Dict[str, List[Dict[str, Any]]] = {}
+    for h in hunks:
+        files.setdefault(h.get("file_path") or "", []).append(h)
+    return [h for hs in files.values() for h in sorted(hs, key=lambda h: int(h.get("new_start") or 0))]
+
+
+def _put(q: "queue.Queue[Any]", item: Any, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def stream_review(
+    owner: str, repo: str, pr: int, token: str, delivery_id: str, head_sha: str,
+    hunks: List[Dict[str, Any]],
+    head_moved: Optional[Callable[[], bool]] = None,
+    cancel: Optional[threading.Event] = None,
+    post_chunk: int = PIPELINE_POST_CHUNK,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    head_check_sec: float = PIPELINE_HEAD_CHECK_SEC,
+    resume: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Generate and post a review for `hunks`; same result shape as submit_review
+    plus `cancelled`, `first_post_s` and `wall_s`.
+
+    `head_moved` is polled before the first post, before the summary, and at
+    most every `head_check_sec` in between; if it returns True, or `cancel` is
+    set, generation stops after the current batch, nothing more is posted and
+    the summary is left out.
+
+    `resume` is posted_parts() of an interrupted run: hunks it lists count as
+    posted and are not generated again.
+    """
+    done_keys = set((resume or {}).get("keys") or ())
+    ordered, resumed = [], []
+    for h in order_by_file(hunks):
+        (resumed if done_keys and comment_key(h) in done_keys else ordered).append(h)
+    if resumed:
+        log.info("Resuming: %d of %d hunks already posted", len(resumed), len(hunks))
+    cancel = cancel or threading.Event()
+    stop = threading.Event()
+    q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, queue_size))
+    stats: Dict[str, int] = {}
+    t0 = time.perf_counter()
+
+    def produce() -> None:
+        try:
+            for i in range(0, len(ordered), GEN_BATCH_SIZE):
+                if stop.is_set():
+                    return
+                for c in prepare_comments(ordered[i : i + GEN_BATCH_SIZE], stats):
+                    if not _put(q, c, stop):
+                        return
+            _put(q, _END, stop)
+        except BaseException as e:
+            _put(q, _Failed(e), stop)
+
+    comments: List[Dict[str, Any]] = [{"h": h, "t": None, "status": "posted"} for h in resumed]
+    ready: List[Dict[str, Any]] = []
+    current: List[Dict[str, Any]] = []
+    current_file: Optional[str] = None
+    review_ids: List[Any] = list((resume or {}).get("review_ids") or [])
+    first_post: List[float] = []
+    last_check: List[float] = []
+    parts = [len(review_ids)]
+
+    def may_post(final: bool) -> bool:
+        if cancel.is_set():
+            return False
+        if head_moved is None:
+            return True
+        now = time.monotonic()
+        if final or not last_check or now - last_check[0] >= head_check_sec:
+            last_check[:] = [now]
+            if head_moved():
+                log.info("Head moved past %s; stopping the review pipeline", head_sha[:7])
+                cancel.set()
+                return False
+        return True
+
+    def post(chunk: List[Dict[str, Any]], final: bool) -> None:
+        parts[0] += 1
+        body = (summary_body(delivery_id, head_sha, len(comments), len(hunks)) if final
+                else f"Automated review (part {parts[0]}).\n\n{part_marker(delivery_id, head_sha, chunk)}")
+        review_ids.extend(submit_chunk(
+            owner, repo, pr, token, delivery_id, head_sha, body, chunk,
+            summary=(len(comments), len(hunks)) if final else None, label=f"part {parts[0]}",
+        ))
+        if not first_post:
+            first_post.append(time.perf_counter() - t0)
+            tracing.since_received("first_comment_s")
+
+    producer = threading.Thread(target=tracing.wrap(produce), name="review-gen", daemon=True)
+    producer.start()
+    finished = False
+    try:
+        while not cancel.is_set():
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _END:
+                finished = True
+                break
+            if isinstance(item, _Failed):
+                raise item.exc
+            c = item
+            c["status"] = "pending" if c["t"] else "skipped"
+            comments.append(c)
+            path = c["h"].get("file_path") or ""
+            if path != current_file:
+                ready += current
+                current, current_file = [], path
+            if c["t"]:
+                current.append(c)
+            if len(current) >= REVIEW_MAX_COMMENTS:
+                ready += current
+                current = []
+            while len(ready) >= post_chunk:
+                if not may_post(final=False):
+                    break
+                chunk, ready = ready[:REVIEW_MAX_COMMENTS], ready[REVIEW_MAX_COMMENTS:]
+                post(chunk, final=False)
+
+        if finished and may_post(final=True):
+            rest = ready + current
+            tail = [rest[i : i + REVIEW_MAX_COMMENTS] for i in range(0, len(rest), REVIEW_MAX_COMMENTS)] or [[]]
+            for chunk in tail[:-1]:
+                post(chunk, final=False)
+            post(tail[-1], final=True)
+    finally:
+        stop.set()
+        producer.join()
+
+    if stats:
+        log_cache_stats(stats)
+    cancelled = not finished or cancel.is_set()
+    if cancelled:
+        log.info("Review pipeline cancelled after %d of %d hunks", len(comments), len(hunks))
+    return {
+        "review_ids": review_ids, **review_counts(comments), "cancelled": cancelled,
+        "first_post_s": first_post[0] if first_post else None, "wall_s": time.perf_counter() - t0,
+    }
@@ -0,0 +1,89 @@
+"""Build-time step: bake the base model (and optionally a merged LoRA adapter)
+into the image as safetensors, so worker tasks start without hub access.
+
+Standalone (no `worker` imports): the Dockerfile runs it in a separate stage
+that only has requirements installed, which keeps the layer cached across code
+changes.
+
+    python prebake.py --model-id Salesforce/codegen-350M-multi \
+        --adapter models/adapters/codegen350m_lora --out /models/prebaked
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+PREBAKE_META_FILE = "prebake.json"
+ADAPTER_MANIFEST_FILE = ".manifest.json"
+
+
+def _adapter_version(adapter_dir: str, explicit: str) -> str:
+    if explicit:
+        return explicit
+    try:
+        with open(os.path.join(adapter_dir, ADAPTER_MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f).get("version") or "baked"
+    except (OSError, ValueError):
+        return "baked"
+
+
+def prebake(model_id: str, out_dir: str, adapter_dir: str = "", adapter_version: str = "") -> dict:
+    import torch
+    from huggingface_hub import snapshot_download
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    t0 = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="prebake-") as tmp:
+        src = model_id if os.path.isdir(model_id) else snapshot_download(repo_id=model_id, local_dir=tmp)
+        tok = AutoTokenizer.from_pretrained(src, use_fast=True)
+        model = AutoModelForCausalLM.from_pretrained(src, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+
+        merged = None
+        if adapter_dir and os.path.isfile(os.path.join(adapter_dir, "adapter_config.json")):
+            from peft import PeftModel
+
+            model = PeftModel.from_pretrained(model, adapter_dir).merge_and_unload()
+            merged = _adapter_version(adapter_dir, adapter_version)
+        elif adapter_dir:
+            print(f"prebake: no adapter in {adapter_dir}; baking the base model only", file=sys.stderr)
+
+        staging = out_dir.rstrip("/") + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        model.eval()
+        model.save_pretrained(staging, safe_serialization=True)
+        tok.save_pretrained(staging)
+
+    meta = {
+        "model_id": model_id,
+        "adapter_version": merged,
+        "dtype": "float32",
+        "created": int(time.time()),
+        "bake_sec": round(time.perf_counter() - t0, 1),
+    }
+    with open(os.path.join(staging, PREBAKE_META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(staging, out_dir)
+    return meta
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="prebake", description=__doc__.split("\n\n")[0])
+    ap.add_argument("--model-id", default=os.getenv("MODEL_ID", "Salesforce/codegen-350M-multi"))
+    ap.add_argument("--adapter", default="", help="LoRA adapter dir to merge; skipped if missing")
+    ap.add_argument("--adapter-version", default="", help="version to record (default: its manifest, else 'baked')")
+    ap.add_argument("--out", default=os.getenv("PREBAKED_MODEL_DIR", "/models/prebaked"))
+    args = ap.parse_args(argv)
+
+    meta = prebake(args.model_id, args.out, args.adapter, args.adapter_version)
+    print(f"prebake: {json.dumps(meta)} -> {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,21 @@
 from __future__ import annotations
-from typing import Any, Dict, List
+import hashlib
+import re
+from typing import Any, Dict, Iterator, List, Optional
 
+import requests
+
+from . import tracing
 from .logutil import setup_logger
 from .github_api import gh_request, make_marker
-from .config import GITHUB_API_BASE, IDEMPOTENCY, MARKER_PREFIX, MAX_HUNKS_LIMIT
-from .model_io import suggest
+from .config import (
+    GITHUB_API_BASE, IDEMPOTENCY, MARKER_PREFIX, MAX_HUNKS_LIMIT, LLM_DISABLED, REVIEW_MAX_COMMENTS,
+    HUNK_TOKEN_BUDGET, MAX_HUNKS_PER_FILE, SKIP_SUPERSEDED,
+)
+from .hunk_priority import default_ranker
+from .model_io import suggest_batch, generation_signature, active_adapter_version, FALLBACK_SUGGESTIONS
+from .suggest_cache import get_cache, suggestion_key
+from .review_store import DONE, POSTING, get_review_store, review_key
 
 log = setup_logger("review")
 
@@ -13,27 +24,120 @@ def pick_line(h: Dict[str, Any]) -> int:
     new_len = int(h.get("new_lines") or 1)
     return new_start if new_len <= 1 else new_start + (new_len // 2)
 
-def existing_marker(owner: str, repo: str, pr: int, token: str, delivery_id: str, head_sha: str) -> bool:
-    if not IDEMPOTENCY:
-        return False
-    marker = make_marker(delivery_id, head_sha).strip("<!-- ").strip(" -->")
+def _iter_reviews(owner: str, repo: str, pr: int, token: str) -> Iterator[Dict[str, Any]]:
     url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/pulls/{pr}/reviews?per_page=100"
     while url:
         r = gh_request("GET", url, token)
-        for rev in r.json():
-            body = rev.get("body") or ""
-            if MARKER_PREFIX in body and all(p in body for p in marker.split()):
-                return True
+        yield from r.json()
         link = r.headers.get("Link", "") or ""
         nxt = None
         for p in [p.strip() for p in link.split(",") if p.strip()]:
             if 'rel="next"' in p:
                 nxt = p[p.find("<") + 1 : p.find(">")]
         url = nxt
+
+def existing_marker(owner: str, repo: str, pr: int, token: str, delivery_id: str, head_sha: str) -> bool:
+    if not IDEMPOTENCY:
+        return False
+    marker = make_marker(delivery_id, head_sha).strip("<!-- ").strip(" -->")
+    for rev in _iter_reviews(owner, repo, pr, token):
+        body = rev.get("body") or ""
+        if MARKER_PREFIX in body and all(p in body for p in marker.split()):
+            return True
     return False
 
+def comment_key(h: Dict[str, Any]) -> str:
+    raw = f"{h.get('file_path')}:{h.get('new_start')}:{h.get('new_lines')}:{h.get('patch_hunk') or ''}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+def part_marker(delivery_id, head_sha, chunk: List[Dict[str, Any]]) -> str:
+    """Hidden tag of a review that is one part of a larger one: which hunks it covered."""
+    keys = ",".join(comment_key(c["h"]) for c in chunk)
+    return f"<!-- {MARKER_PREFIX}-part:delivery_id={delivery_id} head_sha={head_sha} hunks={keys} -->"
+
+_PART_RE = re.compile(r"<!-- (\S+)-part:delivery_id=(\S*) head_sha=(\S*) hunks=(\S*) -->")
+
+def may_have_posted(owner: str, repo: str, pr: int, delivery_id: str, head_sha: str) -> bool:
+    """Whether an earlier run of this delivery may have posted part of its review:
+    its record is `posting`, or there is no store to tell."""
+    if not IDEMPOTENCY:
+        return False
+    store = get_review_store()
+    if store is None:
+        return True
+    try:
+        rec = store.get(review_key(owner, repo, pr, delivery_id, head_sha))
+    except Exception as e:
+        log.warning("Review store read failed (checking for posted parts): %s", e)
+        return True
+    return bool(rec) and rec.get("state") == POSTING
+
+def posted_parts(owner: str, repo: str, pr: int, token: str, delivery_id: str, head_sha: str) -> Dict[str, Any]:
+    """Review ids and hunk keys of the parts an interrupted run of this delivery posted."""
+    ids: List[Any] = []
+    keys = set()
+    for rev in _iter_reviews(owner, repo, pr, token):
+        m = _PART_RE.search(rev.get("body") or "")
+        if m and m.groups()[:3] == (MARKER_PREFIX, str(delivery_id), head_sha):
+            ids.append(rev.get("id"))
+            keys.update(k for k in m.group(4).split(",") if k)
+    return {"review_ids": ids, "keys": keys}
+
+def already_reviewed(owner: str, repo: str, pr: int, token: str, delivery_id: str, head_sha: str) -> bool:
+    """Dedup check: one store lookup; the review-list scan only when the store
+    is off, unreachable, or holds a `posting` record from an interrupted run."""
+    if not IDEMPOTENCY:
+        return False
+    with tracing.span("idempotency_check") as sp:
+        sp["duplicate"] = found = _already_reviewed(owner, repo, pr, token, delivery_id, head_sha)
+    return found
+
+def _already_reviewed(owner: str, repo: str, pr: int, token: str, delivery_id: str, head_sha: str) -> bool:
+    store = get_review_store()
+    if store is None:
+        return existing_marker(owner, repo, pr, token, delivery_id, head_sha)
+    key = review_key(owner, repo, pr, delivery_id, head_sha)
+    try:
+        rec = store.get(key)
+    except Exception as e:
+        log.warning("Review store read failed (scanning reviews): %s", e)
+        return existing_marker(owner, repo, pr, token, delivery_id, head_sha)
+    if rec is None:
+        return False
+    if rec.get("state") == DONE:
+        return True
+    # `posting` without `done`: the previous run may or may not have reached GitHub.
+    found = existing_marker(owner, repo, pr, token, delivery_id, head_sha)
+    if found:
+        mark_review(owner, repo, pr, delivery_id, head_sha, DONE, reconciled=True)
+    return found
+
+def mark_review(owner: str, repo: str, pr: int, delivery_id: str, head_sha: str, state: str, **fields: Any) -> None:
+    store = get_review_store() if IDEMPOTENCY else None
+    if store is None:
+        return
+    try:
+        store.put(review_key(owner, repo, pr, delivery_id, head_sha), state, **fields)
+    except Exception as e:
+        log.warning("Review store write failed (%s): %s", state, e)
+
+def head_moved(owner: str, repo: str, pr: int, token: str, head_sha: str) -> bool:
+    """True if the PR head is no longer `head_sha`, i.e. a newer push superseded this review."""
+    if not SKIP_SUPERSEDED:
+        return False
+    try:
+        pr_obj = gh_request("GET", f"{GITHUB_API_BASE}/repos/{owner}/{repo}/pulls/{pr}", token).json()
+    except Exception as e:
+        log.warning("Could not read PR head (continuing): %s", e)
+        return False
+    current = (pr_obj.get("head") or {}).get("sha")
+    return bool(current) and current != head_sha
+
+def summary_body(delivery_id, head_sha, count_comments, count_hunks) -> str:
+    return f"Automated review: {count_comments} suggestion(s) across {count_hunks} hunk(s).\n\n{make_marker(delivery_id, head_sha)}"
+
 def create_summary(owner, repo, pr, token, delivery_id, head_sha, count_comments, count_hunks):
-    body = f"Automated review: {count_comments} suggestion(s) across {count_hunks} hunk(s).\n\n{make_marker(delivery_id, head_sha)}"
+    body = summary_body(delivery_id, head_sha, count_comments, count_hunks)
     url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/pulls/{pr}/reviews"
     return gh_request("POST", url, token, json={"event": "COMMENT", "body": body}).json()
 
@@ -48,10 +152,145 @@ def post_inline(owner, repo, pr, token, head_sha, hunk, text):
     }
     return gh_request("POST", url, token, json=payload).json()
 
+def review_comment(hunk, text) -> Dict[str, Any]:
+    return {"path": hunk["file_path"], "line": pick_line(hunk), "side": "RIGHT", "body": text}
+
+def post_review(owner, repo, pr, token, head_sha, body, comments: List[Dict[str, Any]]):
+    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/pulls/{pr}/reviews"
+    payload = {"commit_id": head_sha, "event": "COMMENT", "body": body,
+               "comments": [review_comment(c["h"], c["t"]) for c in comments]}
+    return gh_request("POST", url, token, json=payload).json()
+
+def _post_individually(owner, repo, pr, token, head_sha, comments: List[Dict[str, Any]]) -> None:
+    for c in comments:
+        try:
+            post_inline(owner, repo, pr, token, head_sha, c["h"], c["t"])
+            c["status"] = "posted"
+        except Exception as e:
+            c["status"] = "failed"
+            log.warning("Inline failed for %s:%s: %s", c["h"].get("file_path"), pick_line(c["h"]), e)
+
+def _post_in_body(owner, repo, pr, token, head_sha, body, chunk: List[Dict[str, Any]], label: str) -> List[Any]:
+    """One plain review listing the chunk's suggestions, for when its inline review could not be posted."""
+    lines = [f"- `{c['h']['file_path']}` line {pick_line(c['h'])}: {c['t']}" for c in chunk]
+    body = f"{body}\n\nInline comments could not be posted:\n\n" + "\n".join(lines)
+    try:
+        rid = post_review(owner, repo, pr, token, head_sha, body, []).get("id")
+    except Exception as e:
+        log.warning("Review chunk %s lost (%d comments): %s", label, len(chunk), e)
+        for c in chunk:
+            c["status"] = "failed"
+        return []
+    for c in chunk:
+        c["status"] = "posted"
+    return [rid]
+
+def submit_chunk(owner, repo, pr, token, delivery_id, head_sha, body, chunk: List[Dict[str, Any]],
+                 summary=None, label: str = "") -> List[Any]:
+    """Post one review with `chunk` as inline comments; returns the review ids created.
+
+    `summary` is (count_comments, count_hunks) for the review that carries the
+    idempotency marker: if GitHub rejects it with anything but 422 the error is
+    raised, and on 422 the summary is posted on its own before the comments.
+
+    Any other review may follow one that already carries the marker, so it
+    never raises: a 422 is retried one comment at a time, and any other
+    failure (5xx, connection error) lists the comments in a plain review body.
+    """
+    with tracing.span("github_post", comments=len(chunk), summary=summary is not None) as sp:
+        try:
+            rid = post_review(owner, repo, pr, token, head_sha, body, chunk).get("id")
+            for c in chunk:
+                c["status"] = "posted"
+            return [rid]
+        except Exception as e:
+            status = e.response.status_code if isinstance(e, requests.HTTPError) and e.response is not None else None
+            if summary is not None and status != 422:
+                raise
+            if status != 422:
+                log.warning("Review chunk %s failed (%s); listing its comments in the review body", label, e)
+                sp["fallback"] = "body"
+                return _post_in_body(owner, repo, pr, token, head_sha, body, chunk, label)
+            log.warning("Review chunk %s rejected (%s); posting comments individually", label, status)
+        sp["fallback"] = "individual"
+        ids: List[Any] = []
+        if summary is not None:
+            ids.append(create_summary(owner, repo, pr, token, delivery_id, head_sha, *summary).get("id"))
+        _post_individually(owner, repo, pr, token, head_sha, chunk)
+        return ids
+
+def review_counts(comments: List[Dict[str, Any]]) -> Dict[str, int]:
+    counts = {s: sum(1 for c in comments if c.get("status") == s) for s in ("posted", "failed", "skipped")}
+    for c in comments:
+        log.debug("Hunk %s:%s -> %s", c["h"].get("file_path"), pick_line(c["h"]), c.get("status"))
+    return counts
+
+def submit_review(owner, repo, pr, token, delivery_id, head_sha, comments: List[Dict[str, Any]], count_hunks: int) -> Dict[str, Any]:
+    """Post all inline comments as review submissions of up to REVIEW_MAX_COMMENTS each.
+
+    The first review carries the summary and idempotency marker. A chunk that
+    GitHub rejects (422, typically a line outside the diff) is retried one
+    comment at a time so only the offending comments are lost. Once the
+    marker is on GitHub a retry would skip this delivery, so a later chunk
+    that fails otherwise is handled on its own and never aborts the run.
+    Every comment gets a `status` of posted / failed / skipped.
+    """
+    items = [c for c in comments if c["t"]]
+    for c in comments:
+        c["status"] = "skipped" if not c["t"] else "pending"
+    chunks = [items[i : i + REVIEW_MAX_COMMENTS] for i in range(0, len(items), REVIEW_MAX_COMMENTS)] or [[]]
+
+    review_ids: List[Any] = []
+    for idx, chunk in enumerate(chunks):
+        body = (summary_body(delivery_id, head_sha, len(comments), count_hunks) if idx == 0
+                else f"Automated review (part {idx + 1}/{len(chunks)}).")
+        review_ids += submit_chunk(
+            owner, repo, pr, token, delivery_id, head_sha, body, chunk,
+            summary=(len(comments), count_hunks) if idx == 0 else None, label=f"{idx + 1}/{len(chunks)}",
+        )
+    return {"review_ids": review_ids, **review_counts(comments)}
+
 def limit_hunks(hunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    if MAX_HUNKS_LIMIT and len(hunks) > MAX_HUNKS_LIMIT:
-        return hunks[:MAX_HUNKS_LIMIT]
-    return hunks
+    if not (MAX_HUNKS_LIMIT or HUNK_TOKEN_BUDGET or MAX_HUNKS_PER_FILE):
+        return hunks
+    picked = default_ranker.select(
+        hunks, max_hunks=MAX_HUNKS_LIMIT, token_budget=HUNK_TOKEN_BUDGET, per_file_cap=MAX_HUNKS_PER_FILE,
+    )
+    if len(picked) < len(hunks):
+        log.info("Selected %d of %d hunks by priority", len(picked), len(hunks))
+    return picked
+
+def prepare_comments(hunks: List[Dict[str, Any]], stats: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+    """Suggestion per hunk, from the cache where possible. Cache hit/miss counts
+    are added to `stats` when given (the caller logs them), else logged here."""
+    cache = None if LLM_DISABLED else get_cache()
+    if cache is None:
+        return [{"h": h, "t": t} for h, t in zip(hunks, suggest_batch(hunks))]
+
+    sig, adapter = generation_signature(), active_adapter_version()
+    keys = [suggestion_key(h, sig, adapter) for h in hunks]
+    report = stats is None
+    stats = {} if stats is None else stats
+    texts = cache.get_many(keys, stats)
+
+    missed = [i for i, t in enumerate(texts) if t is None]
+    if missed:
+        fresh = suggest_batch([hunks[i] for i in missed])
+        # The first generation loads the model, which may fall back to another
+        # backend or run without the adapter: store under what actually ran.
+        if (generation_signature(), active_adapter_version()) != (sig, adapter):
+            sig, adapter = generation_signature(), active_adapter_version()
+            for i in missed:
+                keys[i] = suggestion_key(hunks[i], sig, adapter)
+        for i, t in zip(missed, fresh):
+            texts[i] = t
+            if t not in FALLBACK_SUGGESTIONS:
+                cache.put(keys[i], t)
+
+    if report:
+        log_cache_stats(stats)
+    return [{"h": h, "t": t} for h, t in zip(hunks, texts)]
 
-def prepare_comments(hunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    return [{"h": h, "t": suggest(h)} for h in hunks]
+def log_cache_stats(stats: Dict[str, int]) -> None:
+    log.info("Suggestion cache: local_hits=%d shared_hits=%d misses=%d",
+             stats.get("local", 0), stats.get("shared", 0), stats.get("miss", 0))
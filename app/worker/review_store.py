@@ -0,0 +1,113 @@
+"""Worker-side review idempotency: one keyed record per (PR, delivery, head SHA).
+
+A record is written as `posting` right before the first review is submitted and
+as `done` once submit_review returns, so the check before a run is a single
+lookup instead of paging through every review on the PR. A `posting` record
+means an earlier run may have died mid-submit; only then is the GitHub review
+list scanned to reconcile.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Protocol
+
+from .logutil import setup_logger
+from .config import REVIEW_STORE_BACKEND, REVIEW_STORE_TABLE, REVIEW_STORE_TTL_SEC
+
+log = setup_logger("review-store")
+
+POSTING = "posting"
+DONE = "done"
+
+
+def review_key(owner: str, repo: str, pr: Any, delivery_id: Any, head_sha: str) -> str:
+    return f"{owner}/{repo}#{pr}:{delivery_id}:{head_sha}"
+
+
+class ReviewStore(Protocol):
+    def get(self, key: str) -> Optional[Dict[str, Any]]: ...
+    def put(self, key: str, state: str, **fields: Any) -> None: ...
+
+
+class LocalReviewStore:
+    """Records in process memory with per-entry TTL; for `--serve` on one task and tests."""
+
+    def __init__(self, ttl_sec: int = REVIEW_STORE_TTL_SEC, clock: Callable[[], float] = time.time):
+        self._ttl = ttl_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            rec = self._data.get(key)
+            if rec is None:
+                return None
+            if self._ttl > 0 and rec["exp"] < self._clock():
+                del self._data[key]
+                return None
+            return {k: v for k, v in rec.items() if k != "exp"}
+
+    def put(self, key: str, state: str, **fields: Any) -> None:
+        with self._lock:
+            self._data[key] = {**fields, "state": state, "exp": self._clock() + self._ttl}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DynamoReviewStore:
+    """Records as `review:<key>` items in a DynamoDB table with `pk` hash key and a `ttl` attribute."""
+
+    def __init__(self, table: str, ttl_sec: int, resource: Any = None, prefix: str = "review:"):
+        if resource is None:
+            import boto3
+            resource = boto3.resource("dynamodb")
+        self._table = resource.Table(table)
+        self._ttl = ttl_sec
+        self._prefix = prefix
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self._table.get_item(Key={"pk": self._prefix + key}, ConsistentRead=True).get("Item")
+        if not item:
+            return None
+        if self._ttl > 0 and int(item.get("ttl", 0)) < time.time():
+            return None
+        return {k: v for k, v in item.items() if k not in ("pk", "ttl")}
+
+    def put(self, key: str, state: str, **fields: Any) -> None:
+        self._table.put_item(Item={
+            **fields, "pk": self._prefix + key, "state": state, "ttl": int(time.time()) + self._ttl,
+        })
+
+
+def _build_store() -> Optional[ReviewStore]:
+    if REVIEW_STORE_BACKEND == "memory":
+        return LocalReviewStore(REVIEW_STORE_TTL_SEC)
+    if REVIEW_STORE_BACKEND == "dynamodb" and REVIEW_STORE_TABLE:
+        return DynamoReviewStore(REVIEW_STORE_TABLE, REVIEW_STORE_TTL_SEC)
+    if REVIEW_STORE_BACKEND not in ("none", ""):
+        log.warning("Review store backend %r not configured; falling back to the GitHub scan", REVIEW_STORE_BACKEND)
+    return None
+
+
+_store_lock = threading.Lock()
+_store_ctx: Dict[str, Any] = {"store": None, "built": False}
+
+
+def get_review_store() -> Optional[ReviewStore]:
+    if _store_ctx["built"]:
+        return _store_ctx["store"]
+    with _store_lock:
+        if not _store_ctx["built"]:
+            _store_ctx["store"] = _build_store()
+            _store_ctx["built"] = True
+        return _store_ctx["store"]
+
+
+def set_review_store(store: Optional[ReviewStore]) -> None:
+    """Swap the process-wide store, e.g. for a local backend in simulations."""
+    with _store_lock:
+        _store_ctx["store"] = store
+        _store_ctx["built"] = True
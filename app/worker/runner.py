@@ -4,16 +4,27 @@ import sys
 import os
 import json
 
+from . import infer_pool, tracing
 from .logutil import setup_logger
-from .aws_utils import download_latest_adapter_from_s3, load_hunks_from_s3
-from .github_api import get_token
+from .config import LLM_DISABLED, PIPELINE_POSTING
+from .aws_utils import download_latest_adapter_from_s3, load_hunks_from_s3, promote_file_index
+from .github_api import get_token, gh_metrics
+from .model_io import get_model
 from .review_logic import (
-    existing_marker, create_summary, post_inline, limit_hunks, prepare_comments
+    already_reviewed, head_moved, mark_review, may_have_posted, posted_parts, submit_review, limit_hunks,
+    prepare_comments,
 )
+from .review_store import DONE, POSTING
+from .pipeline import stream_review
 
 log = setup_logger("runner")
 
 def handle_event(evt: Dict[str, Any]) -> None:
+    with tracing.bind(service="worker", **tracing.context_from(evt)):
+        with tracing.span("review", pr=evt.get("pr_number"), hunks=evt.get("hunk_count")) as sp:
+            sp["outcome"] = _handle_event(evt)
+
+def _handle_event(evt: Dict[str, Any]) -> str:
     #raise RuntimeError("Forced failure for test (via payload)")
     owner = evt.get("owner")
     repo = evt.get("repo")
@@ -28,31 +39,60 @@ def handle_event(evt: Dict[str, Any]) -> None:
 
     token = get_token()
 
-    if existing_marker(owner, repo, int(pr), token, delivery_id, head_sha):
-        log.info("Duplicate marker found, skip")
-        return
+    if already_reviewed(owner, repo, int(pr), token, delivery_id, head_sha):
+        log.info("Already reviewed, skip")
+        return "duplicate"
 
-    hunks = load_hunks_from_s3(bucket, key)
-    hunks = limit_hunks(hunks)
-    comments = prepare_comments(hunks)
+    if head_moved(owner, repo, int(pr), token, head_sha):
+        log.info("Head moved past %s; superseded, skip", head_sha[:7])
+        return "superseded"
 
-    rev = create_summary(owner, repo, int(pr), token, delivery_id, head_sha, len(comments), len(hunks))
+    loaded = load_hunks_from_s3(bucket, key)
+    hunks = limit_hunks(loaded)
 
-    posted = 0
-    for c in comments:
-        try:
-            if not c["t"]:
-                continue
-            post_inline(owner, repo, int(pr), token, head_sha, c["h"], c["t"])
-            posted += 1
-        except Exception:
-            log.exception("Inline failed for %s", c["h"].get("file_path"))
+    if PIPELINE_POSTING:
+        resume = (posted_parts(owner, repo, int(pr), token, delivery_id, head_sha)
+                  if may_have_posted(owner, repo, int(pr), delivery_id, head_sha) else None)
+        mark_review(owner, repo, int(pr), delivery_id, head_sha, POSTING)
+        res = stream_review(owner, repo, int(pr), token, delivery_id, head_sha, hunks,
+                            head_moved=lambda: head_moved(owner, repo, int(pr), token, head_sha), resume=resume)
+        if res["cancelled"]:
+            log.info("Superseded during review of %s; posted=%d before stopping", head_sha[:7], res["posted"])
+            return "superseded"
+        log.info("First comments after %.1fs of %.1fs", res["first_post_s"] or 0.0, res["wall_s"])
+    else:
+        comments = prepare_comments(hunks)
+
+        # Generation can take a while; a push in the meantime makes these comments stale.
+        if head_moved(owner, repo, int(pr), token, head_sha):
+            log.info("Head moved past %s during generation; superseded, not posting", head_sha[:7])
+            return "superseded"
 
-    log.info("Review id=%s; inline posted=%d", rev.get("id"), posted)
+        mark_review(owner, repo, int(pr), delivery_id, head_sha, POSTING)
+        res = submit_review(owner, repo, int(pr), token, delivery_id, head_sha, comments, len(hunks))
+        tracing.since_received("first_comment_s")
+    mark_review(owner, repo, int(pr), delivery_id, head_sha, DONE,
+                review_ids=res["review_ids"], posted=res["posted"], failed=res["failed"])
+    if evt.get("file_index"):
+        _advance_file_index(evt["file_index"], loaded, hunks)
+
+    log.info("Review ids=%s; inline posted=%d failed=%d skipped=%d",
+             res["review_ids"], res["posted"], res["failed"], res["skipped"])
+    log.info("GitHub client: %s", gh_metrics())
+    tracing.since_received("review_done_s", posted=res["posted"])
+    return "posted"
+
+def _advance_file_index(ref: Dict[str, Any], loaded: List[Dict[str, Any]], kept: List[Dict[str, Any]]) -> None:
+    """Move the PR's file index to this head now that its review is posted."""
+    kept_ids = {id(h) for h in kept}
+    cut = {h.get("file_path") for h in loaded if id(h) not in kept_ids}
+    try:
+        promote_file_index(ref, cut)
+    except Exception as e:
+        log.warning("File index update failed (next review covers more): %s", e)
 
 def entrypoint() -> int:
-    raw = os.environ.get("PAYLOAD", "<missing>")
-    print(raw)
+    raw = os.environ.get("PAYLOAD", "")
     if not raw:
         print("Missing EVENT env with SQS message body", file=sys.stderr)
         return 2
@@ -62,14 +102,22 @@ def entrypoint() -> int:
         print(f"Bad EVENT JSON: {e}", file=sys.stderr)
         return 3
 
-    try:
-        download_latest_adapter_from_s3()
-    except Exception as e:
-        log.warning("Adapter download failed (continuing without): %s", e)
+    with tracing.bind(service="worker", **tracing.context_from(evt)):
+        if not LLM_DISABLED:
+            try:
+                download_latest_adapter_from_s3()
+            except Exception as e:
+                log.warning("Adapter download failed (continuing without): %s", e)
+            if infer_pool.pool_requested():
+                # Fork the inference workers now, before the pipeline starts its threads.
+                try:
+                    get_model()
+                except Exception as e:
+                    log.warning("Model preload failed (will retry lazily): %s", e)
 
-    try:
-        handle_event(evt)
-        return 0
-    except Exception as e:
-        log.exception("Processing failed: %s", e)
-        return 1
+        try:
+            handle_event(evt)
+            return 0
+        except Exception as e:
+            log.exception("Processing failed: %s", e)
+            return 1
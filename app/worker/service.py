@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import json
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from .logutil import setup_logger
+from .config import (
+    REVIEW_QUEUE_URL, SERVE_CONCURRENCY, SERVE_WAIT_SEC, SERVE_VISIBILITY_SEC, LLM_DISABLED,
+)
+
+log = setup_logger("service")
+
+
+class ReviewService:
+    """Long-polls the review queue and runs `handler` on each message body.
+
+    At most `concurrency` messages are in flight; each one has its visibility
+    extended while the handler runs and is deleted only on success, so failed
+    reviews fall through to the queue's redrive policy.
+    """
+
+    def __init__(
+        self,
+        queue_url: str,
+        handler: Callable[[Dict[str, Any]], None],
+        sqs_client: Any = None,
+        concurrency: int = SERVE_CONCURRENCY,
+        wait_sec: int = SERVE_WAIT_SEC,
+        visibility_sec: int = SERVE_VISIBILITY_SEC,
+    ):
+        if sqs_client is None:
+            from .aws_utils import client
+            sqs_client = client("sqs")
+        self._sqs = sqs_client
+        self._queue_url = queue_url
+        self._handler = handler
+        self._concurrency = max(1, concurrency)
+        self._wait_sec = wait_sec
+        self._visibility_sec = visibility_sec
+        self._stop = threading.Event()
+        self._slots = threading.BoundedSemaphore(self._concurrency)
+        self._stats_lock = threading.Lock()
+        self.stats = {"received": 0, "ok": 0, "failed": 0}
+
+    def stop(self) -> None:
+        if not self._stop.is_set():
+            log.info("Stop requested; draining in-flight reviews")
+        self._stop.set()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop.is_set()
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _take_slots(self) -> int:
+        while not self._stop.is_set():
+            if self._slots.acquire(timeout=1.0):
+                break
+        else:
+            return 0
+        taken = 1
+        while taken < min(self._concurrency, 10) and self._slots.acquire(blocking=False):
+            taken += 1
+        return taken
+
+    def _release_messages(self, msgs: List[Dict[str, Any]]) -> None:
+        for m in msgs:
+            try:
+                self._sqs.change_message_visibility(
+                    QueueUrl=self._queue_url, ReceiptHandle=m["ReceiptHandle"], VisibilityTimeout=0
+                )
+            except Exception as e:
+                log.warning("Could not release message %s: %s", m.get("MessageId"), e)
+
+    def _heartbeat(self, receipt: str, done: threading.Event) -> None:
+        interval = max(1, self._visibility_sec // 2)
+        while not done.wait(interval):
+            try:
+                self._sqs.change_message_visibility(
+                    QueueUrl=self._queue_url, ReceiptHandle=receipt, VisibilityTimeout=self._visibility_sec
+                )
+            except Exception as e:
+                log.warning("Visibility extension failed: %s", e)
+
+    def _process(self, msg: Dict[str, Any]) -> None:
+        receipt = msg["ReceiptHandle"]
+        done = threading.Event()
+        hb = threading.Thread(target=self._heartbeat, args=(receipt, done), daemon=True)
+        hb.start()
+        try:
+            evt = json.loads(msg.get("Body") or "{}")
+            self._handler(evt)
+            self._sqs.delete_message(QueueUrl=self._queue_url, ReceiptHandle=receipt)
+            self._count("ok")
+        except Exception:
+            self._count("failed")
+            log.exception("Processing failed for message %s", msg.get("MessageId"))
+        finally:
+            done.set()
+            hb.join()
+            self._slots.release()
+
+    def run(self) -> None:
+        log.info("Serving %s (concurrency=%d)", self._queue_url, self._concurrency)
+        pool = ThreadPoolExecutor(max_workers=self._concurrency, thread_name_prefix="review")
+        try:
+            while not self._stop.is_set():
+                free = self._take_slots()
+                if not free:
+                    break
+                try:
+                    resp = self._sqs.receive_message(
+                        QueueUrl=self._queue_url,
+                        MaxNumberOfMessages=free,
+                        WaitTimeSeconds=self._wait_sec,
+                        VisibilityTimeout=self._visibility_sec,
+                    )
+                    msgs = resp.get("Messages") or []
+                except Exception as e:
+                    log.warning("receive_message failed: %s", e)
+                    msgs = []
+                    self._stop.wait(1.0)
+
+                if msgs and self._stop.is_set():
+                    self._release_messages(msgs)
+                    msgs = []
+                for m in msgs:
+                    self._count("received")
+                    pool.submit(self._process, m)
+                for _ in range(free - len(msgs)):
+                    self._slots.release()
+        finally:
+            pool.shutdown(wait=True)
+            log.info("Service stopped: %s", self.stats)
+
+
+def warm_up() -> None:
+    """Fetch the adapter and load the model once, before the first message."""
+    if LLM_DISABLED:
+        return
+    from .aws_utils import download_latest_adapter_from_s3
+
+    try:
+        download_latest_adapter_from_s3()
+    except Exception as e:
+        log.warning("Adapter download failed (continuing without): %s", e)
+    try:
+        from .model_io import get_model
+        get_model()
+    except Exception as e:
+        log.warning("Model preload failed (will retry lazily): %s", e)
+
+
+def serve(queue_url: str = REVIEW_QUEUE_URL) -> int:
+    if not queue_url:
+        log.error("REVIEW_QUEUE_URL is required for --serve")
+        return 2
+
+    from .runner import handle_event
+
+    warm_up()
+    svc = ReviewService(queue_url, handle_event)
+    signal.signal(signal.SIGTERM, lambda *_: svc.stop())
+    signal.signal(signal.SIGINT, lambda *_: svc.stop())
+    svc.run()
+    return 0
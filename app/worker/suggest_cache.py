@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple
+
+from .logutil import setup_logger
+from .config import (
+    SUGGEST_CACHE, SUGGEST_CACHE_MAX_ENTRIES, SUGGEST_CACHE_TTL_SEC, SUGGEST_CACHE_BACKEND,
+    SUGGEST_CACHE_BUCKET, SUGGEST_CACHE_PREFIX, SUGGEST_CACHE_TABLE,
+)
+
+log = setup_logger("suggest-cache")
+
+_HUNK_HDR_RE = re.compile(r"^@@\s*-\d+(?:,\d+)?\s+\+\d+(?:,\d+)?\s+@@", re.M)
+
+
+def normalize_hunk(patch: str) -> str:
+    """Drop line numbers from hunk headers and trailing whitespace, so a
+    rebased hunk with unchanged content hashes the same."""
+    t = (patch or "").replace("\r\n", "\n")
+    t = _HUNK_HDR_RE.sub("@@ @@", t)
+    return "\n".join(ln.rstrip() for ln in t.split("\n")).strip("\n")
+
+
+def suggestion_key(h: Dict[str, Any], signature: str, adapter: str) -> str:
+    d = hashlib.sha256()
+    for part in (normalize_hunk(h.get("patch_hunk") or ""), signature, adapter):
+        d.update(part.encode("utf-8"))
+        d.update(b"\0")
+    return d.hexdigest()
+
+
+class SharedTier(Protocol):
+    def get(self, key: str) -> Optional[str]: ...
+    def put(self, key: str, text: str) -> None: ...
+
+
+class LocalLRU:
+    """In-process LRU with per-entry TTL, bounded by entry count."""
+
+    def __init__(self, max_entries: int, ttl_sec: int, clock: Callable[[], float] = time.time):
+        self._max = max(1, max_entries)
+        self._ttl = ttl_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            exp, text = item
+            if self._ttl > 0 and exp < self._clock():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return text
+
+    def put(self, key: str, text: str) -> None:
+        with self._lock:
+            self._data[key] = (self._clock() + self._ttl, text)
+            self._data.move_to_end(key)
+            while len(self._data) > self._max:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class S3Tier:
+    """Shared tier as one small JSON object per key; pair with a bucket lifecycle rule for cleanup."""
+
+    def __init__(self, bucket: str, prefix: str, ttl_sec: int, client: Any = None):
+        if client is None:
+            from .aws_utils import client as aws_client
+            client = aws_client("s3")
+        self._s3 = client
+        self._bucket = bucket
+        self._prefix = prefix
+        self._ttl = ttl_sec
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            obj = self._s3.get_object(Bucket=self._bucket, Key=self._prefix + key)
+        except self._s3.exceptions.NoSuchKey:
+            return None
+        data = json.loads(obj["Body"].read())
+        if self._ttl > 0 and data.get("exp", 0) < time.time():
+            return None
+        return data.get("t")
+
+    def put(self, key: str, text: str) -> None:
+        body = json.dumps({"t": text, "exp": int(time.time()) + self._ttl}, ensure_ascii=False)
+        self._s3.put_object(
+            Bucket=self._bucket, Key=self._prefix + key, Body=body.encode("utf-8"),
+            ContentType="application/json",
+        )
+
+
+class DynamoTier:
+    """Shared tier backed by a DynamoDB table with `pk` hash key and a `ttl` attribute."""
+
+    def __init__(self, table: str, ttl_sec: int, resource: Any = None):
+        if resource is None:
+            import boto3
+            resource = boto3.resource("dynamodb")
+        self._table = resource.Table(table)
+        self._ttl = ttl_sec
+
+    def get(self, key: str) -> Optional[str]:
+        item = self._table.get_item(Key={"pk": key}).get("Item")
+        if not item:
+            return None
+        if self._ttl > 0 and int(item.get("ttl", 0)) < time.time():
+            return None
+        return item.get("t")
+
+    def put(self, key: str, text: str) -> None:
+        self._table.put_item(Item={"pk": key, "t": text, "ttl": int(time.time()) + self._ttl})
+
+
+class SuggestionCache:
+    def __init__(self, local: LocalLRU, shared: Optional[SharedTier] = None):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key: str) -> Tuple[Optional[str], str]:
+        """Return (text, tier) where tier is 'local', 'shared' or 'miss'."""
+        t = self.local.get(key)
+        if t is not None:
+            return t, "local"
+        if self.shared is not None:
+            try:
+                t = self.shared.get(key)
+            except Exception as e:
+                log.warning("Shared cache read failed: %s", e)
+                t = None
+            if t is not None:
+                self.local.put(key, t)
+                return t, "shared"
+        return None, "miss"
+
+    def put(self, key: str, text: str) -> None:
+        self.local.put(key, text)
+        if self.shared is not None:
+            try:
+                self.shared.put(key, text)
+            except Exception as e:
+                log.warning("Shared cache write failed: %s", e)
+
+    def get_many(self, keys: List[str], stats: Dict[str, int]) -> List[Optional[str]]:
+        out: List[Optional[str]] = []
+        for k in keys:
+            t, tier = self.get(k)
+            stats[tier] = stats.get(tier, 0) + 1
+            out.append(t)
+        return out
+
+
+def _build_shared() -> Optional[SharedTier]:
+    if SUGGEST_CACHE_BACKEND == "s3" and SUGGEST_CACHE_BUCKET:
+        return S3Tier(SUGGEST_CACHE_BUCKET, SUGGEST_CACHE_PREFIX, SUGGEST_CACHE_TTL_SEC)
+    if SUGGEST_CACHE_BACKEND == "dynamodb" and SUGGEST_CACHE_TABLE:
+        return DynamoTier(SUGGEST_CACHE_TABLE, SUGGEST_CACHE_TTL_SEC)
+    if SUGGEST_CACHE_BACKEND not in ("none", ""):
+        log.warning("Suggestion cache backend %r not configured; using local tier only", SUGGEST_CACHE_BACKEND)
+    return None
+
+
+_cache_lock = threading.Lock()
+_cache_ctx: Dict[str, Optional[SuggestionCache]] = {"cache": None}
+
+
+def get_cache() -> Optional[SuggestionCache]:
+    if not SUGGEST_CACHE:
+        return None
+    if _cache_ctx["cache"] is not None:
+        return _cache_ctx["cache"]
+    with _cache_lock:
+        if _cache_ctx["cache"] is None:
+            _cache_ctx["cache"] = SuggestionCache(
+                LocalLRU(SUGGEST_CACHE_MAX_ENTRIES, SUGGEST_CACHE_TTL_SEC), _build_shared()
+            )
+        return _cache_ctx["cache"]
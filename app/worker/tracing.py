@@ -0,0 +1,180 @@
+"""Spans and metrics for the webhook -> dispatcher -> worker path, one JSON
+object per line:
+
+    {"type": "span", "name": "generate", "service": "worker", "cid": "<delivery id>",
+     "ts": 1700000000.123, "dur_ms": 812.4, "ok": true, "hunks": 4}
+    {"type": "metric", "name": "first_comment_s", "value": 41.2, "unit": "s", ...}
+
+The correlation id (`cid`) is the GitHub delivery id. The webhook stamps it,
+with the receipt time, under "trace" in the events message; the dispatcher
+copies that block into the review message and the worker binds it, so every
+record of one delivery can be joined across the three services.
+
+`MemoryExporter` keeps records in a list for tests and benchmarks.
+
+Standalone (stdlib only) so the dispatcher image can copy it, like gh_client.
+"""
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+TRACE_KEY = "trace"
+
+_ctx: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("trace_ctx", default={})
+
+
+def correlation_id(delivery_id: Any = None) -> str:
+    return str(delivery_id) if delivery_id else uuid.uuid4().hex
+
+
+def context_from(msg: Dict[str, Any]) -> Dict[str, Any]:
+    """Trace context carried by a queue message; falls back to its delivery id."""
+    t = msg.get(TRACE_KEY) or {}
+    ctx = {"cid": t.get("cid") or correlation_id(msg.get("delivery_id"))}
+    if t.get("received_at"):
+        ctx["received_at"] = float(t["received_at"])
+    return ctx
+
+
+def current() -> Dict[str, Any]:
+    return _ctx.get()
+
+
+def propagate() -> Dict[str, Any]:
+    """The "trace" block to put on an outgoing message."""
+    c = current()
+    return {k: c[k] for k in ("cid", "received_at") if k in c}
+
+
+@contextlib.contextmanager
+def bind(**fields: Any) -> Iterator[Dict[str, Any]]:
+    """Add `fields` (cid, service, received_at, ...) to every record emitted inside the block."""
+    token = _ctx.set({**_ctx.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield _ctx.get()
+    finally:
+        _ctx.reset(token)
+
+
+def wrap(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """`fn` running in a copy of the caller's trace context, for thread pools and threads."""
+    ctx = contextvars.copy_context()
+    # A Context can be entered by one thread at a time, so each call gets its own copy.
+    return lambda *a, **kw: ctx.copy().run(fn, *a, **kw)
+
+
+class LogExporter:
+    """JSON lines on stdout (CloudWatch Logs for Lambda and ECS)."""
+
+    def __init__(self, stream: Any = None):
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def export(self, rec: Dict[str, Any]) -> None:
+        line = json.dumps(rec, separators=(",", ":"), default=str)
+        with self._lock:
+            stream = self._stream or sys.stdout
+            stream.write(line + "\n")
+            stream.flush()
+
+
+class MemoryExporter:
+    """Keeps records in memory; `summary()` aggregates span durations by name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records: List[Dict[str, Any]] = []
+
+    def export(self, rec: Dict[str, Any]) -> None:
+        with self._lock:
+            self.records.append(rec)
+
+    def spans(self, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [r for r in self.records if r["type"] == "span" and (name is None or r["name"] == name)]
+
+    def metrics(self, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [r for r in self.records if r["type"] == "metric" and (name is None or r["name"] == name)]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        by: Dict[str, List[float]] = {}
+        for r in self.spans():
+            by.setdefault(r["name"], []).append(r["dur_ms"])
+        out = {}
+        for name, ds in by.items():
+            ds.sort()
+            out[name] = {
+                "count": len(ds), "total_ms": round(sum(ds), 3),
+                "p50_ms": ds[len(ds) // 2], "p99_ms": ds[min(len(ds) - 1, int(len(ds) * 0.99))],
+            }
+        return out
+
+
+_exporter: Dict[str, Any] = {
+    "exp": LogExporter() if os.getenv("TRACE", "true").lower() == "true" else None,
+}
+
+
+def set_exporter(exporter: Any) -> Any:
+    """Swap the process-wide exporter (None disables tracing); returns the previous one."""
+    prev, _exporter["exp"] = _exporter["exp"], exporter
+    return prev
+
+
+def emit(rec: Dict[str, Any]) -> None:
+    exp = _exporter["exp"]
+    if exp is None:
+        return
+    c = current()
+    exp.export({**rec, **{k: v for k, v in c.items() if k not in rec and k != "received_at"}})
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """Time the block as one span; the yielded dict takes attributes known only at the end."""
+    ts = time.time()
+    t0 = time.perf_counter()
+    ok = True
+    try:
+        yield attrs
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        emit({"type": "span", "name": name, "ts": round(ts, 3),
+              "dur_ms": round((time.perf_counter() - t0) * 1000, 3), "ok": ok, **attrs})
+
+
+def record(name: str, seconds: float, **attrs: Any) -> None:
+    """A span for work timed elsewhere (e.g. phases measured inside a lock)."""
+    emit({"type": "span", "name": name, "ts": round(time.time() - seconds, 3),
+          "dur_ms": round(seconds * 1000, 3), "ok": True, **attrs})
+
+
+def traced(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    def deco(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def inner(*a: Any, **kw: Any) -> Any:
+            with span(name):
+                return fn(*a, **kw)
+        return inner
+    return deco
+
+
+def metric(name: str, value: float, unit: str = "count", **attrs: Any) -> None:
+    emit({"type": "metric", "name": name, "ts": round(time.time(), 3), "value": value, "unit": unit, **attrs})
+
+
+def since_received(name: str, **attrs: Any) -> None:
+    """Seconds from webhook receipt to now, if the context knows the receipt time."""
+    received = current().get("received_at")
+    if received:
+        metric(name, round(time.time() - received, 3), unit="s", **attrs)
@@ -149,6 +149,8 @@ module "ecs_review_worker" {
   cpu    = local.ecs_worker_task_cfg.cpu
   memory = local.ecs_worker_task_cfg.memory
   model_adapters_s3_arn = local.ecs_worker_task_cfg.model_adapters_s3_arn
+  review_queue_arn      = module.review_queue.queue_arn
+  review_store_table_arn = module.idem.table_arn
 
   env = {
     APP_ENV   = local.env
@@ -160,7 +162,10 @@ module "ecs_review_worker" {
 
     GITHUB_API_BASE            = "https://api.github.com"
     GITHUB_USER_AGENT          = "lara-review-worker"
-    
+    REVIEW_QUEUE_URL           = module.review_queue.queue_url
+    REVIEW_STORE_BACKEND       = "dynamodb"
+    REVIEW_STORE_TABLE         = module.idem.table_name
+
   }
 
   tags = local.tags
@@ -8,4 +8,5 @@ locals {
   task_role_name       = coalesce(var.task_role_name, "${local.name}-task-role")
   task_s3_policy_name  = coalesce(var.task_s3_policy_name, "${local.name}-task-s3-policy")
   task_sqs_policy_name  = coalesce(var.task_sqs_policy_name, "${local.name}-task-sqs-policy")
+  task_ddb_policy_name  = "${local.name}-task-ddb-policy"
 }
\ No newline at end of file
@@ -71,6 +71,15 @@ data "aws_iam_policy_document" "task_s3" {
     ]
   }
 
+  statement {
+    sid     = "AllowAdvanceFileIndex"
+    effect  = "Allow"
+    actions = ["s3:PutObject"]
+    resources = [
+      "${var.artifact_bucket_arn}/repos/*/files-index.json"
+    ]
+  }
+
   statement {
     sid    = "AllowReadAdapters"
     effect = "Allow"
@@ -88,6 +97,47 @@ resource "aws_iam_role_policy" "task_s3" {
   policy = data.aws_iam_policy_document.task_s3.json
 }
 
+data "aws_iam_policy_document" "task_sqs" {
+  count = var.review_queue_arn == null ? 0 : 1
+
+  statement {
+    sid    = "AllowConsumeReviewQueue"
+    effect = "Allow"
+    actions = [
+      "sqs:ReceiveMessage",
+      "sqs:DeleteMessage",
+      "sqs:ChangeMessageVisibility",
+      "sqs:GetQueueAttributes"
+    ]
+    resources = [var.review_queue_arn]
+  }
+}
+
+resource "aws_iam_role_policy" "task_sqs" {
+  count  = var.review_queue_arn == null ? 0 : 1
+  name   = local.task_sqs_policy_name
+  role   = aws_iam_role.task_role.id
+  policy = data.aws_iam_policy_document.task_sqs[0].json
+}
+
+data "aws_iam_policy_document" "task_ddb" {
+  count = var.review_store_table_arn == null ? 0 : 1
+
+  statement {
+    sid       = "AllowReviewStore"
+    effect    = "Allow"
+    actions   = ["dynamodb:GetItem", "dynamodb:PutItem"]
+    resources = [var.review_store_table_arn]
+  }
+}
+
+resource "aws_iam_role_policy" "task_ddb" {
+  count  = var.review_store_table_arn == null ? 0 : 1
+  name   = local.task_ddb_policy_name
+  role   = aws_iam_role.task_role.id
+  policy = data.aws_iam_policy_document.task_ddb[0].json
+}
+
 resource "aws_ecs_task_definition" "td" {
   family                   = local.task_family
   network_mode             = "awsvpc"
@@ -118,6 +168,7 @@ resource "aws_ecs_task_definition" "td" {
           {"name":"GEN_TOP_P","value":"0.9"},
           {"name":"GEN_TOP_K","value":"50"},
           {"name":"TRUNCATE_HUNK_CHARS","value":"600"},
+          {"name":"GEN_BATCH_SIZE","value":"4"},
           {"name":"LORA_ADAPTER_DIR","value":"/models/adapters/codegen350m_lora"},
           {"name":"ADAPTER_BUCKET","value":"codegen-350m-finetune-adapters"},
           {"name":"HF_HUB_CACHE","value":"/models/.cache/huggingface"},
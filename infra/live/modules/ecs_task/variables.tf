@@ -81,3 +81,15 @@ variable "model_adapters_s3_arn" {
 
 
 
+
+variable "review_queue_arn" {
+  type        = string
+  default     = null
+  description = "ARN of the review SQS queue consumed by the worker in --serve mode. If null, no SQS consumer policy is attached."
+}
+
+variable "review_store_table_arn" {
+  type        = string
+  default     = null
+  description = "ARN of the DynamoDB table holding worker review idempotency records. If null, no DynamoDB policy is attached."
+}
@@ -59,7 +59,7 @@ data "aws_iam_policy_document" "sqs_produce" {
       "sqs:SendMessage",
       "sqs:SendMessageBatch"
     ]
-    resources = [var.review_queue_arn]
+    resources = [var.review_queue_arn, var.queue_arn]
   }
 }
 
@@ -103,10 +103,26 @@ resource "aws_iam_policy" "s3_put" {
   tags = merge(local.tags, { Name = "${local.name}-s3-put", Component = "iam-policy" })
 }
 
+data "aws_iam_policy_document" "s3_index_read" {
+  statement {
+    effect    = "Allow"
+    actions   = ["s3:GetObject"]
+    resources = ["${var.artifacts_bucket_arn}/repos/*/files-index.json"]
+  }
+}
+
+resource "aws_iam_policy" "s3_index_read" {
+  name   = "${local.name}-s3-index-read"
+  description = "Allow Lambda to read per-PR file indexes from ${var.artifacts_bucket_arn}"
+  policy = data.aws_iam_policy_document.s3_index_read.json
+
+  tags = merge(local.tags, { Name = "${local.name}-s3-index-read", Component = "iam-policy" })
+}
+
 data "aws_iam_policy_document" "dynamodb_put" {
   statement {
     effect  = "Allow"
-    actions = ["dynamodb:PutItem"]
+    actions = ["dynamodb:PutItem", "dynamodb:DeleteItem", "dynamodb:UpdateItem", "dynamodb:GetItem"]
     resources = [var.idem_table_arn]
   }
 }
@@ -124,6 +140,7 @@ resource "aws_iam_role_policy_attachment" "attachments" {
     sqs_consume = aws_iam_policy.sqs_consume.arn
     sqs_produce = aws_iam_policy.sqs_produce.arn
     s3_put      = aws_iam_policy.s3_put.arn
+    s3_index    = aws_iam_policy.s3_index_read.arn
     ddb_put     = aws_iam_policy.dynamodb_put.arn
   }
 
@@ -135,6 +152,7 @@ resource "aws_iam_role_policy_attachment" "attachments" {
     aws_iam_policy.sqs_consume,
     aws_iam_policy.sqs_produce,
     aws_iam_policy.s3_put,
+    aws_iam_policy.s3_index_read,
     aws_iam_policy.dynamodb_put,
   ]
 
@@ -161,6 +179,8 @@ resource "aws_lambda_function" "fn" {
       IDEMPOTENCY_TABLE      = var.idem_table_name
       GITHUB_TOKEN_SECRET_ARN = var.github_token_arn
       MAX_HUNKS              = 6
+      DEBOUNCE_SEC           = var.debounce_seconds
+      EVENTS_QUEUE_URL       = var.queue_url
       LOG_LEVEL              = "INFO"
     }
   }
@@ -128,3 +128,13 @@ variable "timeout" {
   description = "Lambda timeout (seconds). Also used for calculating recommended SQS visibility timeout."
   default     = 20
 }
+
+variable "debounce_seconds" {
+  type        = number
+  description = "Hold PR events this long and forward only the newest per PR (0 disables)."
+  default     = 10
+  validation {
+    condition     = var.debounce_seconds >= 0 && var.debounce_seconds <= 900
+    error_message = "debounce_seconds must be between 0 and 900 (SQS DelaySeconds limit)."
+  }
+}
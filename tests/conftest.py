@@ -0,0 +1,58 @@
+"""Shared setup for the worker tests.
+
+The worker reads its configuration from the environment at import time, so
+the tiny-model settings are exported here before any `worker` module loads.
+Model tests run against `loadtest.build_tiny_model`: random weights, but the
+same architecture and generation code path as the real model.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+MODEL_DIR = os.path.join(tempfile.mkdtemp(prefix="review-tests-"), "tiny")
+
+os.environ.update({
+    "LLM_DISABLED": "false",
+    "MODEL_ID": MODEL_DIR,
+    "MODEL_DIR": MODEL_DIR,
+    "MODEL_OFFLINE": "1",
+    "PREBAKED_MODEL_DIR": os.path.join(MODEL_DIR, "prebaked"),
+    "LORA_ADAPTER_DIR": os.path.join(MODEL_DIR, "no-adapter"),
+    "ADAPTER_BUCKET": "",
+    "INFERENCE_BACKEND": "eager",
+    "INFER_PROCS": "1",
+    "SUGGEST_CACHE": "false",
+    "TRACE": "false",
+})
+
+
+@pytest.fixture(scope="session")
+def tiny_model():
+    """(tokenizer, model) of the tiny CodeGen, built once per session."""
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    from worker import loadtest, model_io
+
+    loadtest.build_tiny_model(MODEL_DIR)
+    return model_io.get_model()
+
+
+@pytest.fixture(scope="module")
+def dispatcher():
+    """The dispatcher Lambda module, imported against the in-process AWS fakes."""
+    from worker import fakes, loadtest
+
+    for name in ("TARGET_QUEUE_URL", "ARTIFACTS_BUCKET", "IDEMPOTENCY_TABLE"):
+        os.environ.setdefault(name, f"test-{name.lower()}")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    if os.path.join(APP_DIR, "worker") not in sys.path:
+        sys.path.insert(0, os.path.join(APP_DIR, "worker"))  # the Lambda's bundled modules
+    mod = loadtest._load_service("test_dispatcher", os.path.join(APP_DIR, "dispatcher", "handler.py"))
+    ddb = fakes.LocalDynamoDB()
+    mod.s3, mod.ddb, mod.ddb_client = fakes.LocalS3(), ddb.Table(mod.IDEMPOTENCY_TABLE), ddb
+    return mod
@@ -0,0 +1,48 @@
+import copy
+
+import pytest
+
+from worker import bench, model_io
+
+
+@pytest.fixture(scope="module")
+def adapted(tiny_model):
+    """The tiny model wrapped in a LoRA adapter with random, non-zero weights."""
+    peft = pytest.importorskip("peft")
+    import torch
+
+    tok, model = tiny_model
+    torch.manual_seed(1)
+    config = peft.LoraConfig(r=4, target_modules=["qkv_proj"], init_lora_weights=False)
+    adapted = peft.get_peft_model(copy.deepcopy(model), config)
+    adapted.eval()
+    return tok, adapted
+
+
+def _backend(tok, model, backend):
+    out, ran = model_io._apply_backend(copy.deepcopy(model), tok, backend)
+    assert ran == backend
+    return out
+
+
+def test_merged_matches_eager_token_for_token(adapted):
+    tok, eager = adapted
+    merged = _backend(tok, eager, "merged")
+    encoded = model_io.encode_prompts(tok, bench.sample_hunks(6))
+    for early_stop in (False, True):
+        assert (model_io._generate_batch(tok, merged, encoded, early_stop=early_stop)
+                == model_io._generate_batch(tok, eager, encoded, early_stop=early_stop))
+
+
+def test_int8_logits_within_documented_tolerance(adapted):
+    import torch
+
+    tok, eager = adapted
+    merged = _backend(tok, eager, "merged")
+    quantized = _backend(tok, eager, "int8")
+    for ids in model_io.encode_prompts(tok, bench.sample_hunks(6)):
+        x = torch.tensor([ids])
+        with torch.no_grad():
+            ref, got = merged(input_ids=x).logits[0], quantized(input_ids=x).logits[0]
+        cosine = torch.nn.functional.cosine_similarity(ref, got, dim=-1)
+        assert cosine.min().item() >= model_io.INT8_LOGITS_MIN_COSINE
@@ -0,0 +1,23 @@
+from worker import bench, model_io
+
+
+def test_batched_matches_per_prompt(tiny_model):
+    tok, model = tiny_model
+    hunks = bench.sample_hunks(6)
+    encoded = model_io.encode_prompts(tok, hunks)
+    assert len({len(ids) for ids in encoded}) > 1, "prompts must differ in length to exercise padding"
+
+    single = [model_io.llm_suggest(h) for h in hunks]
+    assert len(set(single)) > 1
+    # One micro-batch holding every prompt: the shorter rows are left-padded.
+    assert model_io.llm_suggest_batch(hunks, max_batch=len(hunks)) == single
+    assert model_io.llm_suggest_batch(hunks, max_batch=2) == single
+
+
+def test_batched_raw_tokens_match_per_prompt(tiny_model):
+    tok, model = tiny_model
+    encoded = model_io.encode_prompts(tok, bench.sample_hunks(6))
+    for early_stop in (False, True):
+        batched = model_io._generate_batch(tok, model, encoded, early_stop=early_stop)
+        single = [model_io._generate_batch(tok, model, [ids], early_stop=early_stop)[0] for ids in encoded]
+        assert batched == single
@@ -0,0 +1,64 @@
+import json
+
+from worker import fakes
+
+
+class CancellingClient:
+    """transact_write_items that is always cancelled with `codes`, or raises `error`."""
+
+    def __init__(self, codes=None, error=None):
+        self.codes, self.error = codes, error
+        self.exceptions = fakes.LocalDynamoDB().exceptions
+
+    def transact_write_items(self, TransactItems, **kw):
+        if self.error is not None:
+            raise self.error
+        raise fakes.TransactionCanceledException(
+            "TransactionCanceledException", CancellationReasons=[{"Code": c} for c in self.codes])
+
+
+def test_claim_many_splits_claimed_and_duplicates(dispatcher):
+    assert dispatcher.claim_many(["a:1", "b:1"]) == ({"a:1", "b:1"}, set())
+    assert dispatcher.claim_many(["a:1", "c:1"]) == ({"c:1"}, set())
+
+
+def test_claim_many_reports_undecided_keys_as_failed(dispatcher, monkeypatch):
+    for client in (CancellingClient(codes=["ThrottlingError", "TransactionConflict"]),
+                   CancellingClient(error=RuntimeError("endpoint unreachable"))):
+        monkeypatch.setattr(dispatcher, "ddb_client", client)
+        assert dispatcher.claim_many(["x:1", "y:1"]) == (set(), {"x:1", "y:1"})
+
+
+def test_unclaimed_records_are_retried_not_acked(dispatcher, monkeypatch):
+    monkeypatch.setattr(dispatcher, "ddb_client", CancellingClient(codes=["ThrottlingError"]))
+    monkeypatch.setattr(dispatcher, "get_token", lambda: "t")
+    monkeypatch.setattr(dispatcher, "_enrich_one", lambda msg, token: ("abc", [], {"mode": "full"}))
+    body = {"owner": "o", "repo": "r", "pr_number": 1, "delivery_id": "d1", "action": "opened"}
+    result = dispatcher._handle_batch({"Records": [{"messageId": "m1", "body": json.dumps(body)}]})
+    assert result["batchItemFailures"] == [{"itemIdentifier": "m1"}]
+
+
+def test_failed_artifact_save_releases_claim_and_retries(dispatcher, monkeypatch):
+    ddb = fakes.LocalDynamoDB()
+    monkeypatch.setattr(dispatcher, "ddb_client", ddb)
+    monkeypatch.setattr(dispatcher, "ddb", ddb.Table(dispatcher.IDEMPOTENCY_TABLE))
+    sqs = fakes.LocalSQS()
+    monkeypatch.setattr(dispatcher, "sqs", sqs)
+    monkeypatch.setattr(dispatcher.s3, "put_object", lambda **kw: (_ for _ in ()).throw(OSError("S3 down")))
+    monkeypatch.setattr(dispatcher, "get_token", lambda: "t")
+    hunks = [{"file_path": "a.py", "new_start": 1, "new_lines": 1, "patch": "@@ -1 +1 @@\n-x\n+y\n"}]
+    monkeypatch.setattr(dispatcher, "_enrich_one", lambda msg, token: ("abc", hunks, {"mode": "full"}))
+    body = {"owner": "o", "repo": "r", "pr_number": 1, "delivery_id": "d1", "action": "opened"}
+    for _ in range(2):  # the redelivery is retried again, not skipped as a duplicate
+        result = dispatcher._handle_batch({"Records": [{"messageId": "m1", "body": json.dumps(body)}]})
+        assert result["batchItemFailures"] == [{"itemIdentifier": "m1"}] and result["processed"] == 0
+        assert "Item" not in dispatcher.ddb.get_item(Key={"pk": "d1:abc"})
+    assert not sqs.receive_message(QueueUrl=dispatcher.TARGET_QUEUE_URL).get("Messages")
+
+
+def test_review_scope_without_index_is_full(dispatcher, monkeypatch):
+    calls = []
+    monkeypatch.setattr(dispatcher, "gh_request", lambda *a, **kw: calls.append(a))
+    msg = {"action": "synchronize", "before": "b" * 40, "incremental": True}
+    assert dispatcher.review_scope("o", "r", 7, "h" * 40, "t", msg) == {"mode": "full"}
+    assert calls == []
@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+from conftest import APP_DIR
+
+_PROBE = """
+import sys
+import worker.runner, worker.review_logic
+heavy = sorted(m for m in ("torch", "transformers") if m in sys.modules)
+assert not heavy, heavy
+"""
+
+
+def test_llm_disabled_never_imports_torch_or_transformers():
+    env = {**os.environ, "LLM_DISABLED": "true", "PYTHONPATH": APP_DIR}
+    proc = subprocess.run([sys.executable, "-c", _PROBE], env=env, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+from conftest import APP_DIR
+from worker import fakes
+
+
+def test_fake_compare_returns_only_hunks_added_after_base():
+    gh = fakes.FakeGitHub()
+    first = "@@ -1,0 +1,1 @@\n+a = 1"
+    second = "@@ -20,0 +21,1 @@\n+b = 2"
+    gh.set_pr("o", "r", 1, "h1", [{"filename": "x.py", "sha": "s1", "patch": first},
+                                  {"filename": "y.py", "sha": "t1", "patch": "@@ -1,0 +1,1 @@\n+y = 1"}])
+    gh.set_pr("o", "r", 1, "h2", [{"filename": "x.py", "sha": "s2", "patch": first + "\n" + second},
+                                  {"filename": "y.py", "sha": "t1", "patch": "@@ -1,0 +1,1 @@\n+y = 1"}])
+    status, _, data = gh._compare("o", "r", "h1...h2")
+    assert status == 200 and data["status"] == "ahead"
+    assert [(f["filename"], f["patch"]) for f in data["files"]] == [("x.py", second)]
+
+
+def test_debounced_pushes_review_every_hunk():
+    env = {**os.environ, "PYTHONPATH": APP_DIR}
+    for name in ("MAX_HUNKS", "DEBOUNCE_SEC"):
+        env.pop(name, None)
+    cmd = [sys.executable, "-m", "worker.loadtest", "--model", "heuristic", "--profile", "pushes",
+           "--prs", "2", "--files", "4", "--pushes", "3", "--debounce", "2", "--timeout", "120"]
+    proc = subprocess.run(cmd, env=env, cwd=APP_DIR, capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert "14/14 hunks commented" in proc.stdout
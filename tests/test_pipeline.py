@@ -0,0 +1,76 @@
+import json
+
+import pytest
+import requests
+
+from worker import pipeline, review_logic
+
+
+class Crash(BaseException):
+    """The process dying mid-review: nothing in the worker catches it."""
+
+
+class ReviewsAPI:
+    """Stands in for `gh_request` over the PR reviews endpoint; `crash_on` is the POST to die on."""
+
+    def __init__(self, crash_on=None):
+        self.crash_on = crash_on
+        self.reviews = []
+
+    def __call__(self, method, url, token, **kw):
+        resp = requests.Response()
+        resp.status_code = 200
+        if method == "GET":
+            resp._content = json.dumps(self.reviews).encode()
+            return resp
+        if len(self.reviews) + 1 == self.crash_on:
+            raise Crash()
+        review = {"id": len(self.reviews) + 1, **kw["json"]}
+        self.reviews.append(review)
+        resp._content = json.dumps(review).encode()
+        return resp
+
+    def commented(self):
+        return [(c["path"], c["line"]) for r in self.reviews for c in r.get("comments", [])]
+
+
+def _hunks(n):
+    return [{"file_path": f"src/m{i}.py", "new_start": 1, "new_lines": 1, "patch_hunk": f"@@ -1,0 +1,1 @@\n+x{i}"}
+            for i in range(n)]
+
+
+@pytest.fixture
+def api(monkeypatch):
+    gh = ReviewsAPI()
+    monkeypatch.setattr(review_logic, "gh_request", gh)
+    monkeypatch.setattr(pipeline, "prepare_comments",
+                        lambda hunks, stats=None: [{"h": h, "t": f"Fix {h['file_path']}."} for h in hunks])
+    return gh
+
+
+def _stream(hunks, resume=None):
+    return pipeline.stream_review("o", "r", 1, "t", "d1", "abc", hunks, post_chunk=2, resume=resume)
+
+
+def test_retry_after_crash_posts_only_the_rest(api):
+    hunks = _hunks(7)
+    api.crash_on = 3
+    with pytest.raises(Crash):
+        _stream(hunks)
+    assert len(api.reviews) == 2 and not review_logic.existing_marker("o", "r", 1, "t", "d1", "abc")
+
+    api.crash_on = None
+    resume = review_logic.posted_parts("o", "r", 1, "t", "d1", "abc")
+    assert resume["review_ids"] == [1, 2] and len(resume["keys"]) == 4
+    result = _stream(hunks, resume=resume)
+
+    assert sorted(api.commented()) == sorted((h["file_path"], 1) for h in hunks)
+    assert result["posted"] == 7 and result["review_ids"] == [1, 2, 3, 4]
+    assert review_logic.existing_marker("o", "r", 1, "t", "d1", "abc")
+
+
+def test_part_markers_are_scoped_to_the_delivery(api):
+    _stream(_hunks(5))
+    assert review_logic.posted_parts("o", "r", 1, "t", "d1", "abc")["review_ids"] == [1, 2]
+    assert review_logic.posted_parts("o", "r", 1, "t", "d2", "abc")["review_ids"] == []
+    assert review_logic.posted_parts("o", "r", 1, "t", "d1", "def")["review_ids"] == []
@@ -0,0 +1,24 @@
+from worker import bench, model_io
+
+
+def test_cached_head_matches_uncached_greedy(tiny_model):
+    tok, model = tiny_model
+    encoded = model_io.encode_prompts(tok, bench.sample_hunks(6))
+    assert len({len(ids) for ids in encoded}) > 1, "rows must need different padding"
+    assert model_io._prefix_for(model, encoded, enabled=True) is not None, "the head cache was not built"
+
+    for early_stop in (False, True):
+        uncached = model_io._generate_batch(tok, model, encoded, early_stop=early_stop, prefix_cache=False)
+        cached = model_io._generate_batch(tok, model, encoded, early_stop=early_stop, prefix_cache=True)
+        assert cached == uncached
+        singles = [model_io._generate_batch(tok, model, [ids], early_stop=early_stop, prefix_cache=True)[0]
+                   for ids in encoded]
+        assert singles == uncached
+
+
+def test_cache_saves_the_head_prefill(tiny_model):
+    tok, model = tiny_model
+    encoded = model_io.encode_prompts(tok, bench.sample_hunks(3))
+    stats = {}
+    model_io._generate_batch(tok, model, encoded, stats=stats, prefix_cache=True)
+    assert stats["prefix_saved"] == len(model_io._template_ids(tok)["head"]) * len(encoded)
@@ -0,0 +1,69 @@
+import pytest
+import requests
+
+from worker import review_logic
+
+
+class FlakyGitHub:
+    """Stands in for `gh_request`: records review POSTs, fails the ones `fail` picks."""
+
+    def __init__(self, fail):
+        self.fail = fail
+        self.posts = []
+
+    def __call__(self, method, url, token, **kw):
+        body = kw.get("json") or {}
+        n = len(self.posts)
+        self.posts.append(body)
+        err = self.fail(n, url, body)
+        if err is not None:
+            raise err
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = b'{"id": %d}' % (n + 1)
+        return resp
+
+
+def _comments(n):
+    return [{"h": {"file_path": f"src/m{i}.py", "new_start": 10 * i + 1, "new_lines": 1}, "t": f"Fix {i}."}
+            for i in range(n)]
+
+
+def _server_error(url):
+    resp = requests.Response()
+    resp.status_code = 502
+    resp.url = url
+    return requests.HTTPError("502 Bad Gateway", response=resp)
+
+
+def _submit(monkeypatch, gh, comments):
+    monkeypatch.setattr(review_logic, "gh_request", gh)
+    monkeypatch.setattr(review_logic, "REVIEW_MAX_COMMENTS", 2)
+    return review_logic.submit_review("o", "r", 1, "t", "d1", "abc", comments, len(comments))
+
+
+def test_later_chunk_connection_error_lists_comments_in_body(monkeypatch):
+    gh = FlakyGitHub(lambda n, url, body: requests.ConnectionError("reset") if n == 1 else None)
+    comments = _comments(6)
+    result = _submit(monkeypatch, gh, comments)
+
+    assert "ecs:delivery_id=d1" in gh.posts[0]["body"]
+    fallback = gh.posts[2]
+    assert fallback["comments"] == [] and "src/m2.py" in fallback["body"] and "src/m3.py" in fallback["body"]
+    assert gh.posts[3]["comments"] and result["posted"] == 6 and result["failed"] == 0
+
+
+def test_later_chunk_failures_never_raise_after_marker(monkeypatch):
+    gh = FlakyGitHub(lambda n, url, body: _server_error(url) if n > 0 else None)
+    comments = _comments(5)
+    result = _submit(monkeypatch, gh, comments)
+
+    assert result["review_ids"] == [1]
+    assert result["posted"] == 2 and result["failed"] == 3
+
+
+def test_first_chunk_failure_raises_before_anything_is_posted(monkeypatch):
+    gh = FlakyGitHub(lambda n, url, body: _server_error(url))
+    with pytest.raises(requests.HTTPError):
+        _submit(monkeypatch, gh, _comments(3))
+    assert len(gh.posts) == 1
@@ -0,0 +1,35 @@
+from worker import model_io, review_logic
+from worker.suggest_cache import LocalLRU, SuggestionCache, suggestion_key
+
+HUNK = {"file_path": "src/a.py", "new_start": 1, "new_lines": 1, "patch": "@@ -1 +1 @@\n-x = 1\n+x = 2\n"}
+
+
+def test_cache_key_uses_the_backend_that_ran(monkeypatch):
+    cache = SuggestionCache(LocalLRU(100, 3600))
+    calls = []
+
+    def suggest_batch(hunks):
+        # Loading the model falls back from onnx to the merged backend.
+        calls.append(len(hunks))
+        model_io._model_ctx["backend"] = "merged"
+        return ["Use a constant." for _ in hunks]
+
+    monkeypatch.setattr(model_io, "INFERENCE_BACKEND", "onnx")
+    monkeypatch.setitem(model_io._model_ctx, "backend", None)
+    monkeypatch.setitem(model_io._model_ctx, "adapter", model_io.ADAPTER_NONE)
+    monkeypatch.setattr(review_logic, "get_cache", lambda: cache)
+    monkeypatch.setattr(review_logic, "suggest_batch", suggest_batch)
+
+    assert review_logic.prepare_comments([HUNK])[0]["t"] == "Use a constant."
+    ran = suggestion_key(HUNK, model_io.generation_signature(), model_io.ADAPTER_NONE)
+    assert "backend=merged" in model_io.generation_signature()
+    assert cache.get(ran)[0] == "Use a constant."
+
+    stats = {}
+    assert review_logic.prepare_comments([HUNK], stats)[0]["t"] == "Use a constant."
+    assert calls == [1]
+
+
+def test_failed_adapter_load_is_recorded_as_none(tiny_model):
+    # conftest points LORA_ADAPTER_DIR at a directory that does not exist.
+    assert model_io.active_adapter_version() == model_io.ADAPTER_NONE